@@ -1,20 +1,38 @@
 import os
+import re
 import sys
 import json
-import csv
 import argparse
+import threading
 import time
 import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, List, Dict, Any
 
 import requests
 
+from .query import parse_query, merge_bounds, QueryError
+from .pipeline import Pipeline, FileSink, SortedSink, ROW_FIELDS, guarded_sink, make_row_filter
+from .ratelimit import discord_get
+from .metadata_cache import get_cache, token_key
+from .sharding import split_range, run_shards, shard_progress
+
+DISCORD_EPOCH_MS = 1420070400000
+API_BASE = "https://discord.com/api/v10"
+# Channel types: text, announcement; forum/media channels only hold threads
+MESSAGE_CHANNEL_TYPES = {0, 5}
+THREAD_PARENT_TYPES = {0, 5, 15, 16}
+STATE_FILE = "discord_state.json"
+
 
 def parse_args():
     p = argparse.ArgumentParser(description="Export Discord channel messages (bot token)")
     p.add_argument("--token", required=True, help="Discord Bot token")
-    p.add_argument("--channel", required=True, help="Channel ID or channel URL (https://discord.com/channels/<guild>/<channel>)")
-    p.add_argument("--out", required=True, help="Output file path (jsonl or csv)")
+    p.add_argument("--channel", default=None, help="Channel ID or channel URL (https://discord.com/channels/<guild>/<channel>)")
+    p.add_argument("--guild", default=None, help="Guild mode: export every text channel and thread of this guild ID into the --out directory")
+    p.add_argument("--concurrency", type=int, default=4, help="Channels exported at the same time in guild mode")
+    p.add_argument("--no-threads", action="store_true", help="Guild mode: skip active and archived threads")
+    p.add_argument("--out", required=True, help="Output file path (jsonl or csv), or directory in guild mode")
     p.add_argument("--format", choices=["jsonl", "csv"], default=None, help="Output format (defaults from file extension)")
     p.add_argument("--reverse", action="store_true", help="Oldest to newest (collect then sort)")
     p.add_argument("--resume", action="store_true", help="Resume from last saved message id (jsonl only)")
@@ -26,6 +44,9 @@ def parse_args():
     p.add_argument("--only-text", action="store_true", help="Only export messages without attachments")
     p.add_argument("--keywords", default=None, help="Comma-separated keywords (case-insensitive) to match in content")
     p.add_argument("--users", default=None, help="Comma-separated user IDs or usernames to include")
+    p.add_argument("--query", default=None, help="Filter query, e.g. '(outage OR incident) AND NOT test has:media from:alice before:2024-01-01'")
+    p.add_argument("--shards", type=int, default=1, help="Split the snowflake/time range into N shards fetched concurrently")
+    p.add_argument("--cache", default=None, help="Metadata cache file (default: CHATTOOLS_CACHE or the per-user cache directory)")
     return p.parse_args()
 
 
@@ -46,6 +67,14 @@ def parse_date(d: Optional[str]) -> Optional[dt.datetime]:
     return dt.datetime.strptime(d, "%Y-%m-%d")
 
 
+def date_to_snowflake(d: dt.datetime) -> int:
+    # Naive datetimes are treated as UTC
+    if d.tzinfo is None:
+        d = d.replace(tzinfo=dt.timezone.utc)
+    ms = int(d.timestamp() * 1000)
+    return max(0, (ms - DISCORD_EPOCH_MS) << 22)
+
+
 def ensure_dir(path):
     os.makedirs(path, exist_ok=True)
 
@@ -150,6 +179,55 @@ def parse_channel_id(input_str: str) -> str:
     return s
 
 
+def iter_message_pages(base: str, channel_id: str, headers: Dict[str, str], after_id: Optional[int] = None,
+                       before_id: Optional[int] = None, descending: bool = False):
+    # With a lower bound (or resume) page forwards with 'after', unless
+    # `descending`; otherwise backwards from the upper bound with 'before',
+    # stopping at the lower bound
+    ascending = after_id is not None and not descending
+    params = {"limit": 100}
+    if ascending:
+        params["after"] = str(after_id)
+    elif before_id:
+        params["before"] = str(before_id)
+
+    while True:
+        try:
+            r = discord_get(f"{base}/channels/{channel_id}/messages", headers=headers, params=params, timeout=30)
+        except Exception as e:
+            raise RuntimeError(f"Discord request failed: {e}")
+        if r.status_code == 403:
+            raise RuntimeError("Forbidden: bot likely missing Read Message History or access to channel")
+        if r.status_code == 401:
+            raise RuntimeError("Unauthorized: invalid bot token")
+        if r.status_code != 200:
+            raise RuntimeError(f"Discord API error: {r.status_code} {r.text}")
+        msgs = r.json() or []
+        if not msgs:
+            break
+        ids = [int(m.get("id")) for m in msgs if m.get("id")]
+        if ascending:
+            # Pages come newest-first even when paging forwards; yield them in
+            # ascending order so a limit keeps the oldest messages
+            page = sorted(msgs, key=lambda m: int(m.get("id") or 0))
+            yield [m for m in page if int(m.get("id") or 0) < before_id] if before_id else page
+        else:
+            yield [m for m in msgs if int(m.get("id") or 0) > after_id] if after_id is not None else msgs
+        if len(msgs) < params["limit"]:
+            break
+        if ascending:
+            # Keep going forwards from the largest id until past the upper bound
+            largest = max(ids)
+            if before_id and largest >= before_id:
+                break
+            params = {"limit": 100, "after": str(largest)}
+        else:
+            # Paginate using 'before' = smallest id we've seen to keep going backwards
+            if after_id is not None and min(ids) <= after_id:
+                break
+            params = {"limit": 100, "before": str(min(ids))}
+
+
 def export_discord_messages(
     token: str,
     channel: str,
@@ -165,157 +243,381 @@ def export_discord_messages(
     only_text: bool = False,
     keywords: Optional[List[str]] = None,
     users: Optional[List[str]] = None,
+    query: Optional[str] = None,
+    shards: int = 1,
+    after_id: Optional[int] = None,
+    before_id: Optional[int] = None,
+    channel_name: Optional[str] = None,
     on_progress=None,
     sink=None,
+    written: Optional[dict] = None,
 ):
+    # after_id/before_id: explicit exclusive snowflake cursors (e.g. guild
+    # resume state), combined with resume and the date bounds. `written`, if
+    # given, receives the number of rows written and the highest message id.
     channel_id = parse_channel_id(channel)
     headers = {"Authorization": f"Bot {token}", "User-Agent": "ChatTools-Exporter"}
-    base = "https://discord.com/api/v10"
+    base = API_BASE
 
     # Get channel name
-    channel_name = None
-    try:
-        info = requests.get(f"{base}/channels/{channel_id}", headers=headers, timeout=30)
-        if info.status_code == 200:
-            channel_name = (info.json() or {}).get("name")
-    except Exception:
-        pass
-
-    # Writers
-    out_f = None
-    csv_writer = None
-    if sink is None:
-        if out_fmt == "jsonl":
-            out_f = open(out_path, "a", encoding="utf-8")
-        else:
-            out_f = open(out_path, "a", newline="", encoding="utf-8")
-            headers_row = [
-                "id","date","chat_id","chat_title","sender_id","sender_username",
-                "sender_display","text","reply_to_id","views","forwards","edit_date",
-                "via_bot_id","is_pinned","media","media_type","media_file_name","media_path"
-            ]
-            csv_writer = csv.DictWriter(out_f, fieldnames=headers_row)
-            if out_f.tell() == 0:
-                csv_writer.writeheader()
+    if channel_name is None:
+        try:
+            channel_name = get_channel_info(token, channel_id).get("name")
+        except Exception:
+            pass
 
     min_dt = parse_date(min_date)
     max_dt = parse_date(max_date)
-    kw = [k.lower() for k in (keywords or []) if k]
-    user_filters = [u.lower() for u in (users or []) if u]
+    q = parse_query(query)
+    lo, hi = merge_bounds(min_dt, max_dt, q)
 
+    # An explicit lower cursor skips messages the sink may not have seen
+    from_cursor = after_id is None
     last_id = None
-    if resume and out_fmt == "jsonl" and os.path.exists(out_path):
+    if resume and sink is not None and hasattr(sink, "resume_after"):
+        # External sinks (Notion) know what they already delivered
+        last_id = sink.resume_after(channel_id)
+    elif resume and out_fmt == "jsonl" and os.path.exists(out_path):
         last_id = read_last_id_jsonl(out_path)
-        if last_id and on_progress:
-            on_progress(f"Resuming after id {last_id}")
+    if last_id and on_progress:
+        on_progress(f"Resuming after id {last_id}")
 
-    collected = [] if reverse else None
-    fetched = 0
-    params = {"limit": 100}
+    # Date bounds become snowflake cursors
     if last_id:
-        params["after"] = last_id
+        after_id = max(after_id or 0, int(last_id))
+    if lo:
+        after_id = max(after_id or 0, date_to_snowflake(lo) - 1)
+    if hi:
+        before_id = min(before_id or date_to_snowflake(hi), date_to_snowflake(hi))
+
+    row_filter = make_row_filter(lo, hi, only_media, only_text, users, keywords, q)
+
+    def download(row, m):
+        # Download attachments if requested (filesystem only)
+        atts = m.get("attachments", []) or []
+        if atts:
+            paths = download_attachments(atts, media_dir)
+            row["media_path"] = ";".join(paths) if paths else None
+        return row
+
+    def to_row(m):
+        return msg_to_row(m, channel_id, channel_name)
+    stages = [download] if (media_dir and sink is None) else []
+
+    if sink is not None:
+        external = sink
+        out = guarded_sink(lambda row, m: external(row, m, None), on_progress)
+    else:
+        out = FileSink(out_path, out_fmt, ROW_FIELDS)
+    if written is not None:
+        out = MaxIdSink(out, written)
+
+    if shards and shards > 1:
+        # Messages cannot predate the channel, whose id is itself a snowflake
+        start = after_id + 1 if after_id is not None else int(channel_id)
+        end = before_id or date_to_snowflake(dt.datetime.now(dt.timezone.utc)) + 1
+        ranges = split_range(start, end, shards)
+        if on_progress:
+            on_progress(f"Exporting {len(ranges)} snowflake shards concurrently")
+
+        def export_range(i, a, b, segment, budget):
+            # Rows are re-sorted per shard, so a shard reads its whole range
+            # (the merge applies the limit) unless earlier shards have enough
+            seg_sink = SortedSink(FileSink(segment, "jsonl"), key=lambda r: int(r.get("id") or 0), descending=not reverse)
+            pipe = Pipeline(
+                to_row=to_row,
+                sink=seg_sink,
+                filters=[row_filter],
+                stages=stages,
+                on_progress=shard_progress(on_progress, i, len(ranges)),
+                enough=budget and budget.slot(i, ordered=False),
+            )
+            return pipe.run(iter_message_pages(base, channel_id, headers, a - 1, b))
+
+        fetched = run_shards(ranges if reverse else ranges[::-1], export_range, out_path, out, limit, on_progress)
+    else:
+        if reverse:
+            out = SortedSink(out, key=lambda r: int(r.get("id") or 0))
+        pipe = Pipeline(
+            to_row=to_row,
+            sink=out,
+            filters=[row_filter],
+            stages=stages,
+            limit=limit,
+            on_progress=on_progress,
+        )
+        # Oldest-first exports page forwards from the start and newest-first
+        # ones backwards from the end, so a limit keeps the first messages in
+        # output order
+        start_after = 0 if (reverse and after_id is None) else after_id
+        fetched = pipe.run(iter_message_pages(base, channel_id, headers, start_after, before_id, descending=not reverse))
+
+    if reverse and from_cursor and row_filter is None and hasattr(sink, "commit_resume"):
+        # A complete unfiltered oldest-first run leaves no gaps behind it
+        sink.commit_resume(channel_id)
+    if on_progress:
+        on_progress(f"Done. Exported {fetched} messages to {out_path}")
+    return fetched
 
+
+def api_get_json(url: str, headers: Dict[str, str], params: Optional[dict] = None):
+    r = discord_get(url, headers=headers, params=params, timeout=30)
+    if r.status_code == 403:
+        raise PermissionError(f"Forbidden: {url}")
+    if r.status_code != 200:
+        raise RuntimeError(f"Discord API error: {r.status_code} {r.text}")
+    return r.json()
+
+
+def iter_archived_threads(channel_id: str, headers: Dict[str, str], private: bool = False):
+    # Archived threads, newest first, paged by archive timestamp
+    kind = "private" if private else "public"
+    params: Dict[str, Any] = {"limit": 100}
     while True:
-        try:
-            r = requests.get(f"{base}/channels/{channel_id}/messages", headers=headers, params=params, timeout=30)
-        except Exception as e:
-            raise RuntimeError(f"Discord request failed: {e}")
-        if r.status_code == 429:
-            retry = int(r.headers.get("Retry-After", "1"))
-            time.sleep(max(1, retry))
-            continue
-        if r.status_code == 403:
-            raise RuntimeError("Forbidden: bot likely missing Read Message History or access to channel")
-        if r.status_code == 401:
-            raise RuntimeError("Unauthorized: invalid bot token")
-        if r.status_code != 200:
-            raise RuntimeError(f"Discord API error: {r.status_code} {r.text}")
-        msgs = r.json() or []
-        if not msgs:
-            break
+        data = api_get_json(f"{API_BASE}/channels/{channel_id}/threads/archived/{kind}", headers, params) or {}
+        threads = data.get("threads") or []
+        yield from threads
+        if not data.get("has_more") or not threads:
+            return
+        params = {"limit": 100, "before": threads[-1].get("thread_metadata", {}).get("archive_timestamp")}
 
-        # API returns newest-first; process accordingly
-        for m in msgs:
-            if limit and fetched >= limit:
-                break
 
-            # Date filters
-            try:
-                m_dt = dt.datetime.fromisoformat(m.get("timestamp", "").replace('Z', '+00:00'))
-            except Exception:
-                m_dt = None
-            if min_dt and m_dt and m_dt < min_dt:
-                continue
-            if max_dt and m_dt and m_dt > max_dt:
-                continue
+def get_channel_info(token: str, channel_id: str, refresh: bool = False) -> Dict[str, Any]:
+    headers = {"Authorization": f"Bot {token}", "User-Agent": "ChatTools-Exporter"}
 
-            atts = m.get("attachments", []) or []
-            if only_media and not atts:
-                continue
-            if only_text and atts:
+    def load():
+        return api_get_json(f"{API_BASE}/channels/{channel_id}", headers) or {}
+    return get_cache().fetch("discord.channel", f"{token_key(token)}:{channel_id}", load, refresh=refresh)
+
+
+def list_guild_channels(token: str, guild_id: str, include_threads: bool = True, concurrency: int = 4, refresh: bool = False) -> List[Dict[str, Any]]:
+    # Text/announcement channels plus (optionally) their active and archived
+    # threads, including forum posts. Threads carry parent_id/parent_name.
+    # Served from the metadata cache unless refresh=True.
+    key = f"{token_key(token)}:{guild_id}:{'threads' if include_threads else 'channels'}"
+    return get_cache().fetch(
+        "discord.guild_channels", key,
+        lambda: _list_guild_channels(token, guild_id, include_threads, concurrency), refresh=refresh,
+    )
+
+
+def _list_guild_channels(token: str, guild_id: str, include_threads: bool, concurrency: int) -> List[Dict[str, Any]]:
+    headers = {"Authorization": f"Bot {token}", "User-Agent": "ChatTools-Exporter"}
+    chans = api_get_json(f"{API_BASE}/guilds/{guild_id}/channels", headers) or []
+    names = {c.get("id"): c.get("name") for c in chans}
+    items = [
+        {"id": c["id"], "name": c.get("name") or c["id"], "type": c.get("type"), "kind": "channel"}
+        for c in chans if c.get("type") in MESSAGE_CHANNEL_TYPES
+    ]
+    if not include_threads:
+        return items
+
+    threads: Dict[str, dict] = {}
+    active = api_get_json(f"{API_BASE}/guilds/{guild_id}/threads/active", headers) or {}
+    for t in active.get("threads") or []:
+        threads[t["id"]] = t
+
+    def archived(parent):
+        found = []
+        for private in (False, True):
+            try:
+                found.extend(iter_archived_threads(parent["id"], headers, private))
+            except PermissionError:
+                # Private archived threads need Manage Threads; public ones Read Message History
                 continue
+        return found
+
+    parents = [c for c in chans if c.get("type") in THREAD_PARENT_TYPES]
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        for found in pool.map(archived, parents):
+            for t in found:
+                threads.setdefault(t["id"], t)
+
+    for t in threads.values():
+        items.append({
+            "id": t["id"],
+            "name": t.get("name") or t["id"],
+            "type": t.get("type"),
+            "kind": "thread",
+            "parent_id": t.get("parent_id"),
+            "parent_name": names.get(t.get("parent_id")),
+        })
+    return items
+
+
+def channel_file_name(item: Dict[str, Any]) -> str:
+    name = item["name"]
+    if item.get("kind") == "thread" and item.get("parent_name"):
+        name = f"{item['parent_name']}__{name}"
+    name = re.sub(r"[^\w.-]+", "_", name).strip("_") or "channel"
+    return f"{name}-{item['id']}"
+
+
+class MaxIdSink:
+    # Passes rows through, recording in `written` how many were written
+    # ("count") and the highest message id ("max_id")
+    def __init__(self, sink, written: dict):
+        self.sink = sink
+        self.written = written
+
+    def __call__(self, row: dict, raw=None):
+        self.sink(row, raw)
+        self.written["count"] = self.written.get("count", 0) + 1
+        mid = int(row.get("id") or 0)
+        if mid > self.written.get("max_id", 0):
+            self.written["max_id"] = mid
+
+    def close(self):
+        if hasattr(self.sink, "close"):
+            self.sink.close()
+
+
+def load_state(path: str) -> Dict[str, dict]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
 
-            if user_filters:
-                au = m.get("author", {}) if isinstance(m.get("author"), dict) else {}
-                uid = str(au.get("id", "")).lower()
-                uname = str(au.get("username", "")).lower()
-                if uid not in user_filters and uname not in user_filters:
-                    continue
 
-            if kw:
-                content = (m.get("content") or "").lower()
-                if not any(k in content for k in kw):
-                    continue
+def save_state(path: str, state: Dict[str, dict]):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path)
 
-            row = msg_to_row(m, channel_id, channel_name)
-            # Download attachments if requested (filesystem only)
-            if media_dir and atts and sink is None:
-                paths = download_attachments(atts, media_dir)
-                row["media_path"] = ";".join(paths) if paths else None
-
-            if reverse:
-                collected.append(row)
-            else:
-                if sink is not None:
-                    sink(row, m, None)
-                else:
-                    if out_fmt == "jsonl":
-                        out_f.write(json.dumps(row, ensure_ascii=False) + "\n")
-                    else:
-                        csv_writer.writerow(row)
-            fetched += 1
-        if limit and fetched >= limit:
-            break
-        # Paginate using 'before' = smallest id we've seen to keep going backwards
-        smallest = min(int(m.get("id")) for m in msgs if m.get("id"))
-        params = {"limit": 100, "before": str(smallest)}
 
-    if reverse and collected:
+def export_discord_guild(
+    token: str,
+    guild_id: str,
+    out_dir: str,
+    out_fmt: str,
+    concurrency: int = 4,
+    include_threads: bool = True,
+    resume: bool = False,
+    media_dir: Optional[str] = None,
+    on_progress=None,
+    **options,
+) -> Dict[str, dict]:
+    # Exports every text channel and thread of a guild concurrently into
+    # per-channel files. All requests share the per-token global and
+    # per-route bucket limiters (discord_get). discord_state.json records,
+    # per channel, the snowflake up to which it is complete; with resume the
+    # next run only fetches newer messages. Other keyword options are passed
+    # through to export_discord_messages.
+    #
+    # The cursor only covers what was really exported: it moves to the
+    # export's upper bound only after a full scan (no limit, max date or
+    # filters); otherwise an oldest-first run moves it to the last message
+    # written and a newest-first run leaves it where it was.
+    full_scan = not any(options.get(k) for k in ("limit", "max_date", "only_media", "only_text", "keywords", "users", "query"))
+    oldest_first = options.get("reverse", True)
+    os.makedirs(out_dir, exist_ok=True)
+    state_path = os.path.join(out_dir, STATE_FILE)
+    state = load_state(state_path)
+    state_lock = threading.Lock()
+
+    # A full backup always lists afresh (and refreshes the cache for pickers)
+    items = list_guild_channels(token, guild_id, include_threads, concurrency, refresh=True)
+    if on_progress:
+        threads = sum(1 for i in items if i["kind"] == "thread")
+        on_progress(f"Exporting {len(items) - threads} channels and {threads} threads with concurrency {concurrency}")
+
+    def run(item):
+        cid = item["id"]
+        fname = channel_file_name(item)
+        progress = (lambda msg: on_progress(f"[{fname}] {msg}")) if on_progress else None
+        # Fixed upper cursor so the state never claims messages sent mid-export
+        upper = date_to_snowflake(dt.datetime.now(dt.timezone.utc))
+        prev = state.get(cid, {})
+        after = int(prev["last_id"]) if (resume and prev.get("last_id")) else None
+        written: Dict[str, int] = {}
+        error = None
         try:
-            collected.sort(key=lambda r: int(r.get("id", "0")))
-        except Exception:
-            collected.sort(key=lambda r: r.get("id", ""))
-        for row in collected:
-            if sink is not None:
-                sink(row, None, None)
-            else:
-                if out_fmt == "jsonl":
-                    out_f.write(json.dumps(row, ensure_ascii=False) + "\n")
-                else:
-                    csv_writer.writerow(row)
-
-    if out_f:
-        out_f.flush(); out_f.close()
+            count = export_discord_messages(
+                token=token,
+                channel=cid,
+                out_path=os.path.join(out_dir, f"{fname}.{out_fmt}"),
+                out_fmt=out_fmt,
+                media_dir=os.path.join(media_dir, fname) if media_dir else None,
+                after_id=after,
+                before_id=upper,
+                channel_name=item["name"],
+                on_progress=progress,
+                written=written,
+                **options,
+            )
+        except Exception as e:
+            if progress:
+                progress(f"Failed: {e}")
+            error = str(e)
+        last_id = prev.get("last_id") if resume else None
+        if error is None and full_scan:
+            last_id = str(upper - 1)
+        elif oldest_first and written.get("max_id"):
+            last_id = str(max(written["max_id"], int(last_id or 0)))
+        if error is not None and not written:
+            return cid, {"error": error}
+        with state_lock:
+            state[cid] = {
+                "name": item["name"],
+                "kind": item["kind"],
+                "file": f"{fname}.{out_fmt}",
+                "last_id": last_id,
+                "messages": prev.get("messages", 0) + written.get("count", 0) if resume else written.get("count", 0),
+                "updated_at": dt.datetime.now(dt.timezone.utc).isoformat(),
+            }
+            save_state(state_path, state)
+        return cid, ({"error": error} if error is not None else {"messages": count})
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        results = dict(pool.map(run, items))
+
     if on_progress:
-        on_progress(f"Done. Exported {fetched} messages to {out_path}")
-    return fetched
+        total = sum(r.get("messages", 0) for r in results.values())
+        failed = sum(1 for r in results.values() if "error" in r)
+        on_progress(f"Done. Exported {total} messages from {len(items) - failed}/{len(items)} channels to {out_dir}")
+    return results
 
 
 def main():
     args = parse_args()
-    out_fmt = detect_format(args.out, args.format)
+    get_cache(args.cache)
+    if not args.channel and not args.guild:
+        print("Error: Provide --channel or --guild", file=sys.stderr)
+        sys.exit(1)
+    # Guild mode writes per-channel files into the --out directory
+    out_fmt = (args.format or "jsonl") if args.guild else detect_format(args.out, args.format)
     kw = [x.strip() for x in (args.keywords.split(",") if args.keywords else []) if x.strip()]
     users = [x.strip() for x in (args.users.split(",") if args.users else []) if x.strip()]
+    try:
+        parse_query(args.query)
+    except QueryError as e:
+        print(f"Error: invalid --query: {e}", file=sys.stderr)
+        sys.exit(1)
+    if args.guild:
+        export_discord_guild(
+            token=args.token,
+            guild_id=args.guild,
+            out_dir=args.out,
+            out_fmt=out_fmt,
+            concurrency=args.concurrency,
+            include_threads=not args.no_threads,
+            resume=args.resume,
+            media_dir=args.media_dir,
+            reverse=args.reverse,
+            limit=args.limit,
+            min_date=args.min_date,
+            max_date=args.max_date,
+            only_media=args.only_media,
+            only_text=args.only_text,
+            keywords=kw,
+            users=users,
+            query=args.query,
+            shards=args.shards,
+            on_progress=lambda msg: print(msg, file=sys.stderr),
+        )
+        return
     export_discord_messages(
         token=args.token,
         channel=args.channel,
@@ -331,6 +633,8 @@ def main():
         only_text=args.only_text,
         keywords=kw,
         users=users,
+        query=args.query,
+        shards=args.shards,
         on_progress=lambda msg: print(msg, file=sys.stderr),
         sink=None,
     )
@@ -1,22 +1,36 @@
 import os
+import re
 import sys
 import json
-import csv
 import time
+import fnmatch
 import argparse
+import threading
 import datetime as dt
-from typing import Optional, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, List
 
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
 import requests
 
+from .query import parse_query, merge_bounds, QueryError
+from .pipeline import Pipeline, FileSink, SortedSink, ROW_FIELDS, guarded_sink, make_row_filter
+from .ratelimit import slack_call
+from .metadata_cache import get_cache, token_key
+from .sharding import split_range, run_shards, shard_progress
+
+SLACK_ROW_FIELDS = ROW_FIELDS[:1] + ["ts"] + ROW_FIELDS[1:] + ["reactions"]
+
 
 def parse_args():
     p = argparse.ArgumentParser(description="Export Slack channel messages")
     p.add_argument("--token", default=os.getenv("SLACK_TOKEN"), help="Slack Bot/User OAuth token (env SLACK_TOKEN)")
-    p.add_argument("--channel", required=True, help="Channel name (#general) or channel ID (C.../G...)")
-    p.add_argument("--out", required=True, help="Output file path (jsonl or csv)")
+    p.add_argument("--channel", default=None, help="Channel name (#general) or channel ID (C.../G...)")
+    p.add_argument("--channels", default=None, help="Workspace mode: comma-separated globs (eng-*) or /regex/ of channel names; '*' for all")
+    p.add_argument("--concurrency", type=int, default=4, help="Channels exported at the same time in workspace mode")
+    p.add_argument("--include-archived", action="store_true", help="Workspace mode: include archived channels")
+    p.add_argument("--out", required=True, help="Output file path (jsonl or csv), or directory in workspace mode")
     p.add_argument("--format", choices=["jsonl", "csv"], default=None, help="Output format (defaults from file extension)")
     p.add_argument("--reverse", action="store_true", help="Oldest to newest (will sort by timestamp)")
     p.add_argument("--resume", action="store_true", help="Resume from last saved timestamp (jsonl only)")
@@ -28,6 +42,12 @@ def parse_args():
     p.add_argument("--only-text", action="store_true", help="Only export messages without files")
     p.add_argument("--keywords", default=None, help="Comma-separated keywords (case-insensitive) to match in text")
     p.add_argument("--users", default=None, help="Comma-separated user IDs or display names to include")
+    p.add_argument("--expand-mentions", action="store_true", help="Replace <@U...> mentions in text with @display names")
+    p.add_argument("--search", dest="use_search", action="store_true", default=False, help="Find --keywords/--query words with search.messages (user token; whole-word matching) instead of scanning history")
+    p.add_argument("--no-search", dest="use_search", action="store_false", help="Always scan the channel history (default)")
+    p.add_argument("--query", default=None, help="Filter query, e.g. '(outage OR incident) AND NOT test has:media from:alice before:2024-01-01'")
+    p.add_argument("--shards", type=int, default=1, help="Split the time range into N shards fetched concurrently")
+    p.add_argument("--cache", default=None, help="Metadata cache file (default: CHATTOOLS_CACHE or the per-user cache directory)")
     return p.parse_args()
 
 
@@ -86,37 +106,186 @@ def ensure_dir(path):
     os.makedirs(path, exist_ok=True)
 
 
-def get_channel_id(client: WebClient, channel_input: str) -> str:
-    ch = channel_input.strip()
-    if ch.startswith("C") or ch.startswith("G"):
-        return ch
-    if ch.startswith("#"):
-        ch = ch[1:]
-    def try_list(types: str):
+def list_conversations(client: WebClient, exclude_archived: bool = True, refresh: bool = False) -> List[dict]:
+    # Every conversation visible to the token, in one pass over conversations.list.
+    # Served from the metadata cache unless refresh=True.
+    def list_all(types: str):
+        out = []
         cursor = None
         while True:
-            res = client.conversations_list(limit=1000, cursor=cursor, types=types)
-            for c in res.get("channels", []):
-                if c.get("name") == ch:
-                    return c.get("id")
+            res = slack_call(client, "conversations.list", limit=1000, cursor=cursor, types=types, exclude_archived=exclude_archived)
+            out.extend(res.get("channels", []))
             cursor = res.get("response_metadata", {}).get("next_cursor") or None
             if not cursor:
-                break
-        return None
+                return out
 
-    # Try both public and private; if missing scope, fall back to public only
-    try:
-        found = try_list("public_channel,private_channel")
-    except SlackApiError as e:
-        if e.response and e.response.get("error") == "missing_scope":
-            found = try_list("public_channel")
-        else:
+    def load():
+        # Try both public and private; if missing scope, fall back to public only
+        try:
+            return list_all("public_channel,private_channel")
+        except SlackApiError as e:
+            if e.response and e.response.get("error") == "missing_scope":
+                return list_all("public_channel")
             raise
+
+    key = f"{token_key(client.token)}:{'active' if exclude_archived else 'all'}"
+    return get_cache().fetch("slack.conversations", key, load, refresh=refresh)
+
+
+def conversation_info(client: WebClient, channel_id: str, refresh: bool = False) -> dict:
+    def load():
+        return slack_call(client, "conversations.info", channel=channel_id).get("channel") or {}
+    return get_cache().fetch("slack.conversation_info", f"{token_key(client.token)}:{channel_id}", load, refresh=refresh)
+
+
+def get_channel_id(client: WebClient, channel_input: str, channels: Optional[List[dict]] = None) -> str:
+    ch = channel_input.strip()
+    if ch.startswith("C") or ch.startswith("G"):
+        return ch
+    if ch.startswith("#"):
+        ch = ch[1:]
+
+    def find(listing):
+        for c in listing:
+            if c.get("name") == ch:
+                return c.get("id")
+        return None
+    if channels is not None:
+        found = find(channels)
+    else:
+        # A cache miss may just be a new or renamed channel: re-list once
+        found = find(list_conversations(client, exclude_archived=False)) or find(
+            list_conversations(client, exclude_archived=False, refresh=True))
     if found:
         return found
     raise ValueError(f"Channel not found: {channel_input}")
 
 
+def select_channels(channels: List[dict], patterns: Optional[str]) -> List[dict]:
+    # Comma-separated globs on the channel name, or /regex/; empty or '*' selects all
+    pats = [p.strip().lstrip("#") for p in (patterns or "").split(",") if p.strip()]
+    if not pats or "*" in pats:
+        return list(channels)
+
+    def match(name: str) -> bool:
+        for p in pats:
+            if len(p) > 1 and p.startswith("/") and p.endswith("/"):
+                if re.search(p[1:-1], name):
+                    return True
+            elif fnmatch.fnmatchcase(name, p):
+                return True
+        return False
+    return [c for c in channels if match(c.get("name") or "")]
+
+
+MENTION_RE = re.compile(r"<@([UW][A-Z0-9]+)(?:\|[^>]*)?>")
+
+
+class SlackUserDirectory:
+    # id -> names for every member of the workspace, bulk-loaded from
+    # users.list (via the metadata cache) so rows get sender names and
+    # mentions at O(1) per message. Ids missing from the listing (new members,
+    # other workspaces in shared channels) are looked up once with users.info
+    # and added; the additions are saved back when the export finishes,
+    # keeping the listing's age, so the listing is still refreshed on time
+    # (which drops them; they are looked up again if still needed).
+    # Long-lived processes re-read the listing from the metadata cache (see
+    # get_user_directory), so its background refreshes reach the directory.
+    def __init__(self, client: WebClient):
+        self.client = client
+        self.key = token_key(client.token)
+        self.lock = threading.Lock()
+        self.users: Dict[str, dict] = {}
+        self.missing = set()
+        self.dirty = False
+        self.available = True
+        self.loaded_at = 0.0
+        self.reload()
+
+    def reload(self):
+        try:
+            users = get_cache().fetch("slack.users", self.key, self._load_all)
+        except SlackApiError as e:
+            # Tokens without users:read still export, just without names
+            if not (e.response and e.response.get("error") == "missing_scope"):
+                raise
+            self.available = False
+            return
+        with self.lock:
+            # Keep users.info additions not yet in the cached listing
+            self.users = {**self.users, **users}
+            self.missing = set()
+            self.loaded_at = time.time()
+
+    @staticmethod
+    def _entry(u: dict) -> dict:
+        profile = u.get("profile") or {}
+        return {
+            "name": u.get("name"),
+            "display": profile.get("display_name") or profile.get("real_name") or u.get("real_name") or u.get("name"),
+        }
+
+    def _load_all(self) -> Dict[str, dict]:
+        users = {}
+        cursor = None
+        while True:
+            res = slack_call(self.client, "users.list", limit=200, cursor=cursor)
+            for u in res.get("members", []):
+                users[u["id"]] = self._entry(u)
+            cursor = res.get("response_metadata", {}).get("next_cursor") or None
+            if not cursor:
+                return users
+
+    def get(self, user_id: Optional[str]) -> Optional[dict]:
+        if not user_id or not self.available:
+            return None
+        u = self.users.get(user_id)
+        if u is not None or user_id in self.missing:
+            return u
+        with self.lock:
+            if user_id in self.users or user_id in self.missing:
+                return self.users.get(user_id)
+            try:
+                u = self._entry(slack_call(self.client, "users.info", user=user_id).get("user") or {})
+            except SlackApiError:
+                self.missing.add(user_id)
+                return None
+            self.users[user_id] = u
+            self.dirty = True
+            return u
+
+    def expand_mentions(self, text: str) -> str:
+        def repl(m):
+            u = self.get(m.group(1))
+            return f"@{u['display']}" if u and u.get("display") else m.group(0)
+        return MENTION_RE.sub(repl, text) if "<@" in text else text
+
+    def save(self):
+        with self.lock:
+            if self.dirty:
+                get_cache().put("slack.users", self.key, dict(self.users), keep_age=True)
+                self.dirty = False
+
+
+USER_DIRECTORY_MAX_AGE = 60  # seconds
+_directories: Dict[str, SlackUserDirectory] = {}
+_directories_lock = threading.Lock()
+
+
+def get_user_directory(client: WebClient) -> SlackUserDirectory:
+    # One directory per token, shared by concurrent channel exports; an export
+    # starting more than USER_DIRECTORY_MAX_AGE after the last read re-reads
+    # the cached listing (picking up new and renamed users)
+    with _directories_lock:
+        key = token_key(client.token)
+        d = _directories.get(key)
+        if d is None:
+            d = _directories[key] = SlackUserDirectory(client)
+        elif d.available and time.time() - d.loaded_at > USER_DIRECTORY_MAX_AGE:
+            d.reload()
+        return d
+
+
 def slack_ts_to_iso(ts: str) -> str:
     try:
         seconds = float(ts)
@@ -125,8 +294,28 @@ def slack_ts_to_iso(ts: str) -> str:
         return ts
 
 
-def msg_to_row(m: dict, channel_id: str, channel_name: str) -> dict:
+def channel_pins(client: WebClient, channel_id: str) -> set:
+    # ts of every pinned message, from one pins.list call per channel
+    try:
+        res = slack_call(client, "pins.list", channel=channel_id)
+    except SlackApiError:
+        return set()  # e.g. missing pins:read; rows still use pinned_to
+    return {(item.get("message") or {}).get("ts") for item in res.get("items", []) if item.get("type") == "message"} - {None}
+
+
+def reactions_summary(m: dict) -> Optional[str]:
+    # "name:count;..." from the reactions already in the history payload
+    reactions = m.get("reactions") or []
+    return ";".join(f"{r.get('name')}:{r.get('count', 0)}" for r in reactions if isinstance(r, dict)) or None
+
+
+def msg_to_row(m: dict, channel_id: str, channel_name: str, directory: Optional[SlackUserDirectory] = None,
+               expand_mentions: bool = False, pinned: Optional[set] = None) -> dict:
     text = m.get("text", "")
+    profile = m.get("user_profile") if isinstance(m.get("user_profile"), dict) else {}
+    user = directory.get(m.get("user")) if directory is not None else None
+    if directory is not None and expand_mentions:
+        text = directory.expand_mentions(text)
     files = m.get("files", []) or []
     media = bool(files)
     media_types = ",".join([f.get("filetype") or f.get("mimetype", "") for f in files if isinstance(f, dict)]) or None
@@ -139,18 +328,19 @@ def msg_to_row(m: dict, channel_id: str, channel_name: str) -> dict:
         "chat_id": channel_id,
         "chat_title": channel_name,
         "sender_id": m.get("user") or m.get("bot_id"),
-        "sender_username": m.get("username"),
-        "sender_display": m.get("user_profile", {}).get("real_name") if isinstance(m.get("user_profile"), dict) else None,
+        "sender_username": m.get("username") or (user or {}).get("name") or profile.get("name"),
+        "sender_display": profile.get("real_name") or (user or {}).get("display"),
         "text": text,
         "reply_to_id": None,
         "views": None,
         "forwards": None,
         "edit_date": slack_ts_to_iso(m.get("edited", {}).get("ts")) if isinstance(m.get("edited"), dict) else None,
         "via_bot_id": m.get("bot_id"),
-        "is_pinned": False,
+        "is_pinned": channel_id in (m.get("pinned_to") or []) or (pinned is not None and m.get("ts") in pinned),
         "media": media,
         "media_type": media_types,
         "media_file_name": file_names,
+        "reactions": reactions_summary(m),
     }
 
 
@@ -176,6 +366,181 @@ def download_files(files: List[dict], token: str, media_dir: str):
     return paths
 
 
+def ts_micros(ts) -> int:
+    return int(round(float(ts) * 1_000_000))
+
+
+HISTORY_PAGE_SIZE = 1000  # conversations.history maximum
+
+
+def iter_history_pages(client: WebClient, channel_id: str, oldest: Optional[float], latest: Optional[float], inclusive: bool = False):
+    cursor = None
+    while True:
+        try:
+            res = slack_call(
+                client,
+                "conversations.history",
+                channel=channel_id,
+                limit=HISTORY_PAGE_SIZE,
+                cursor=cursor,
+                oldest=f"{oldest:.6f}" if oldest else None,
+                latest=f"{latest:.6f}" if latest else None,
+                inclusive=inclusive,
+            )
+        except SlackApiError as e:
+            raise RuntimeError(f"Slack API error: {e.response['error']}")
+        msgs = res.get("messages", [])
+        if not msgs:
+            break
+        yield msgs
+        cursor = res.get("response_metadata", {}).get("next_cursor") or None
+        if not cursor:
+            break
+
+
+FILES_PAGE_SIZE = 200
+MEDIA_CONCURRENCY = 4
+
+
+def iter_file_messages(client: WebClient, channel_id: str, oldest: Optional[float], latest: Optional[float]):
+    # Media-first source: the ts at which the channel's files (files.list)
+    # were shared, read back from conversations.history, newest first.
+    # Rows therefore match the history scan (text, reactions, all files).
+    # The window applies to the share ts: a file can be shared long after it
+    # was created, so only the upper bound is sent to files.list. Thread
+    # replies are skipped, as in the history scan. When there are at least a
+    # history page's worth of file messages, the channel is scanned instead.
+    share_ts = set()
+    page = 1
+    while True:
+        try:
+            res = slack_call(
+                client,
+                "files.list",
+                channel=channel_id,
+                ts_to=int(latest) + 1 if latest else None,
+                count=FILES_PAGE_SIZE,
+                page=page,
+            )
+        except SlackApiError as e:
+            raise RuntimeError(f"Slack API error: {e.response['error']}")
+        for f in res.get("files", []):
+            shares = f.get("shares") or {}
+            for kind in ("public", "private"):
+                for sh in (shares.get(kind) or {}).get(channel_id, []):
+                    ts = sh.get("ts")
+                    if not ts or (sh.get("thread_ts") and sh.get("thread_ts") != ts):
+                        continue
+                    if (oldest and float(ts) <= oldest) or (latest and float(ts) >= latest):
+                        continue
+                    share_ts.add(ts)
+        paging = res.get("paging") or {}
+        if page >= (paging.get("pages") or 1):
+            break
+        page += 1
+    if len(share_ts) >= HISTORY_PAGE_SIZE:
+        yield from iter_history_pages(client, channel_id, oldest, latest)
+        return
+    yield from iter_messages_at(client, channel_id, share_ts)
+
+
+def iter_messages_at(client: WebClient, channel_id: str, timestamps, page_size: int = FILES_PAGE_SIZE):
+    # The channel messages at the given ts, newest first. Each
+    # conversations.history request reads a full page down from the newest
+    # ts not yet found and keeps the wanted ones, so clustered ts cost one
+    # request per page and scattered ones at most one each; never more than
+    # a history scan of the same span. Thread replies and deleted messages
+    # are not in the channel history and are dropped.
+    wanted = sorted(set(timestamps), key=float, reverse=True)
+    if not wanted:
+        return
+    floor = wanted[-1]
+    batch = []
+    while wanted:
+        try:
+            res = slack_call(client, "conversations.history", channel=channel_id, oldest=floor, latest=wanted[0],
+                             inclusive=True, limit=HISTORY_PAGE_SIZE)
+        except SlackApiError as e:
+            raise RuntimeError(f"Slack API error: {e.response['error']}")
+        msgs = res.get("messages", [])
+        found = {m.get("ts"): m for m in msgs}
+        batch.extend(found[ts] for ts in wanted if ts in found)
+        if not msgs or not res.get("has_more"):
+            break  # the page reached the oldest wanted ts
+        # Continue from the newest wanted ts below this page
+        reached = min(float(m["ts"]) for m in msgs)
+        wanted = [ts for ts in wanted if float(ts) < reached]
+        if len(batch) >= page_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def prefetch_downloads(pages, to_row, row_filter, limit, token: str, media_dir: str, pool: ThreadPoolExecutor):
+    # Starts downloads for the messages that will be exported as soon as their
+    # page arrives, so files download concurrently; the pipeline's download
+    # stage then only waits for each result
+    selected = 0
+    for page in pages:
+        keep = []
+        for m in page:
+            if limit and selected >= limit:
+                break
+            if row_filter is not None and not row_filter(to_row(m)):
+                continue
+            m["_downloads"] = pool.submit(download_files, m["files"], token, media_dir)
+            keep.append(m)
+            selected += 1
+        if keep:
+            yield keep
+        if limit and selected >= limit:
+            return
+
+
+SEARCH_PAGE_SIZE = 100
+
+
+def search_channel_messages(client: WebClient, channel_id: str, channel_name: str, terms: List[str],
+                            oldest: Optional[float], latest: Optional[float]) -> List[dict]:
+    # Messages of one channel matching any of `terms`, via search.messages
+    # (user tokens with search:read). Results of all terms are merged and
+    # deduplicated by ts and returned newest first; the exact filter still
+    # runs locally, so search only has to return a superset.
+    scope = [f"in:#{channel_name}"]
+    # Slack's after:/before: are exclusive whole days; ts bounds are exact below
+    if oldest:
+        scope.append(f"after:{(dt.datetime.fromtimestamp(oldest, tz=dt.timezone.utc) - dt.timedelta(days=1)):%Y-%m-%d}")
+    if latest:
+        scope.append(f"before:{(dt.datetime.fromtimestamp(latest, tz=dt.timezone.utc) + dt.timedelta(days=1)):%Y-%m-%d}")
+    found: Dict[str, dict] = {}
+    for term in terms:
+        text = f'"{term}"' if re.search(r"\s", term) else term
+        page = 1
+        while True:
+            res = slack_call(
+                client,
+                "search.messages",
+                query=" ".join([text] + scope),
+                count=SEARCH_PAGE_SIZE,
+                page=page,
+                sort="timestamp",
+                sort_dir="desc",
+            )
+            data = res.get("messages") or {}
+            for m in data.get("matches", []):
+                ts = m.get("ts")
+                if not ts or (m.get("channel") or {}).get("id", channel_id) != channel_id:
+                    continue
+                if (oldest and float(ts) <= oldest) or (latest and float(ts) >= latest):
+                    continue
+                found.setdefault(ts, m)
+            if page >= ((data.get("paging") or {}).get("pages") or 1):
+                break
+            page += 1
+    return sorted(found.values(), key=lambda m: float(m["ts"]), reverse=True)
+
+
 def export_slack_messages(
     token: str,
     channel: str,
@@ -191,145 +556,238 @@ def export_slack_messages(
     only_text: bool = False,
     keywords: Optional[List[str]] = None,
     users: Optional[List[str]] = None,
+    query: Optional[str] = None,
+    shards: int = 1,
+    channel_info: Optional[dict] = None,
+    client: Optional[WebClient] = None,
+    expand_mentions: bool = False,
+    use_search: bool = False,
     on_progress=None,
     sink=None,
 ):
-    client = WebClient(token=token)
+    # `channel_info`: the conversations.list entry when already known
+    # (workspace mode), saving the lookup and conversations.info calls
+    client = client or WebClient(token=token)
 
     if media_dir and not sink:
         ensure_dir(media_dir)
 
     min_dt = parse_date(min_date)
     max_dt = parse_date(max_date)
-    oldest = to_ts(min_dt)
-    latest = to_ts(max_dt)
+    q = parse_query(query)
+    # Date bounds (including query after:/before:/on:) become oldest/latest
+    lo, hi = merge_bounds(min_dt, max_dt, q)
+    # oldest is exclusive (inclusive=False keeps resume exact), so nudge date bounds back
+    oldest = to_ts(lo) - 0.000001 if lo else None
+    latest = to_ts(hi)
+
+    if channel_info:
+        channel_id = channel_info["id"]
+        channel_name = channel_info.get("name") or channel_id
+        created = channel_info.get("created")
+    else:
+        channel_id = get_channel_id(client, channel)
+        channel_name = channel.lstrip("#")
+        created = None
+        # Try fetch channel info to get name
+        try:
+            info = conversation_info(client, channel_id)
+            channel_name = info.get("name") or channel_name
+            created = info.get("created")
+        except SlackApiError:
+            pass
 
     last_ts = None
-    if resume and out_fmt == "jsonl" and os.path.exists(out_path):
+    if resume and sink is not None and hasattr(sink, "resume_after"):
+        # External sinks (Notion) know what they already delivered
+        last_ts = sink.resume_after(channel_id)
+    elif resume and out_fmt == "jsonl" and os.path.exists(out_path):
         last_ts = read_last_ts_jsonl(out_path)
-        if last_ts and on_progress:
-            on_progress(f"Resuming after ts {last_ts}")
-        if last_ts:
-            try:
-                v = float(last_ts)
-                oldest = max(oldest or 0.0, v)
-            except Exception:
-                pass
-
-    channel_id = get_channel_id(client, channel)
-    channel_name = channel.lstrip("#")
-    # Try fetch channel info to get name
-    try:
-        info = client.conversations_info(channel=channel_id)
-        channel_name = info.get("channel", {}).get("name") or channel_name
-    except SlackApiError:
-        pass
-
-    # Prepare writers
-    out_f = None
-    csv_writer = None
-    if sink is None:
-        if out_fmt == "jsonl":
-            out_f = open(out_path, "a", encoding="utf-8")
-        else:
-            out_f = open(out_path, "a", newline="", encoding="utf-8")
-            headers = [
-                "id","ts","date","chat_id","chat_title","sender_id","sender_username",
-                "sender_display","text","reply_to_id","views","forwards","edit_date",
-                "via_bot_id","is_pinned","media","media_type","media_file_name","media_path"
-            ]
-            csv_writer = csv.DictWriter(out_f, fieldnames=headers)
-            if out_f.tell() == 0:
-                csv_writer.writeheader()
-
-    count = 0
-    collected = [] if reverse else None
-
-    cursor = None
-    while True:
-        try:
-            res = client.conversations_history(
-                channel=channel_id,
-                limit=1000,
-                cursor=cursor,
-                oldest=str(oldest) if oldest else None,
-                latest=str(latest) if latest else None,
-                inclusive=False,
-            )
-        except SlackApiError as e:
-            raise RuntimeError(f"Slack API error: {e.response['error']}")
-        msgs = res.get("messages", [])
-        if not msgs:
-            break
-
-        for m in msgs:
-            if limit and count >= limit:
-                break
-
-            # Filters
-            files = m.get("files", []) or []
-            if only_media and not files:
-                continue
-            if only_text and files:
-                continue
-
-            if users:
-                uid = m.get("user") or m.get("bot_id") or ""
-                uname = (m.get("username") or "").lower()
-                if uid not in users and uname not in [u.lower() for u in users]:
-                    continue
-
-            if keywords:
-                text = (m.get("text") or "").lower()
-                if not any(k.lower() in text for k in keywords):
-                    continue
-
-            row = msg_to_row(m, channel_id, channel_name)
-
-            # Download files if requested (filesystem only)
-            if media_dir and files and sink is None:
-                paths = download_files(files, token, media_dir)
-                row["media_path"] = ";".join(paths) if paths else None
-
-            if reverse:
-                collected.append(row)
-            else:
-                if sink is not None:
-                    sink(row, m, client)
-                else:
-                    if out_fmt == "jsonl":
-                        out_f.write(json.dumps(row, ensure_ascii=False) + "\n")
-                    else:
-                        csv_writer.writerow(row)
-            count += 1
-        if limit and count >= limit:
-            break
-        cursor = res.get("response_metadata", {}).get("next_cursor") or None
-        if not cursor:
-            break
-
-    # Flush collected in ascending order by ts
-    if reverse and collected:
+    if last_ts and on_progress:
+        on_progress(f"Resuming after ts {last_ts}")
+    if last_ts:
         try:
-            collected.sort(key=lambda r: float(r.get("ts", "0")))
+            v = float(last_ts)
+            oldest = max(oldest or 0.0, v)
         except Exception:
-            collected.sort(key=lambda r: r.get("ts", ""))
-        for row in collected:
-            if sink is not None:
-                sink(row, None, client)
+            pass
+
+    row_filter = make_row_filter(lo, hi, only_media, only_text, users, keywords, q)
+
+    def download(row, m):
+        # Download files if requested (filesystem only)
+        files = m.get("files", []) or []
+        if files:
+            pending = m.pop("_downloads", None)
+            paths = pending.result() if pending is not None else download_files(files, token, media_dir)
+            row["media_path"] = ";".join(paths) if paths else None
+        return row
+
+    # Sender names and <@U..> mentions come from the workspace user directory
+    directory = get_user_directory(client)
+
+    pinned = channel_pins(client, channel_id)
+
+    def to_row(m):
+        return msg_to_row(m, channel_id, channel_name, directory, expand_mentions, pinned)
+    stages = [download] if (media_dir and sink is None) else []
+
+    if sink is not None:
+        external = sink
+        out = guarded_sink(lambda row, m: external(row, m, client), on_progress)
+    else:
+        out = FileSink(out_path, out_fmt, SLACK_ROW_FIELDS)
+
+    if shards and shards > 1:
+        # Shard [start, end) in integer microseconds of Slack ts
+        start = ts_micros(oldest) + 1 if oldest else ts_micros(created or 0)
+        end = ts_micros(latest) if latest else ts_micros(time.time()) + 1
+        ranges = split_range(start, end, shards)
+        if on_progress:
+            on_progress(f"Exporting {len(ranges)} time shards concurrently")
+
+        def export_range(i, a, b, segment, budget):
+            # Each shard writes its rows, in output order, to its own segment.
+            # Pages arrive in API order and are re-sorted, so a shard reads
+            # its whole range (the merge applies the limit) unless earlier
+            # shards already hold enough rows
+            seg_sink = SortedSink(FileSink(segment, "jsonl"), key=lambda r: float(r.get("ts") or 0), descending=not reverse)
+            pipe = Pipeline(
+                to_row=to_row,
+                sink=seg_sink,
+                filters=[lambda row: a <= ts_micros(row["ts"]) < b, row_filter],
+                stages=stages,
+                on_progress=shard_progress(on_progress, i, len(ranges)),
+                enough=budget and budget.slot(i, ordered=False),
+            )
+            return pipe.run(iter_history_pages(client, channel_id, a / 1_000_000, b / 1_000_000, inclusive=True))
+
+        count = run_shards(ranges if reverse else ranges[::-1], export_range, out_path, out, limit, on_progress)
+    else:
+        if reverse:
+            # History pages arrive newest-first; emit in ascending ts order
+            out = SortedSink(out, key=lambda r: float(r.get("ts") or 0))
+        pipe = Pipeline(
+            to_row=to_row,
+            sink=out,
+            filters=[row_filter],
+            stages=stages,
+            limit=limit,
+            on_progress=on_progress,
+        )
+        # With use_search, keyword pulls find candidates with search.messages
+        # (whole-word matching, so opt-in) and read them back from history;
+        # media-only exports without text conditions list the channel's
+        # files; otherwise scan history
+        terms = [k for k in (keywords or []) if k.strip()] or ([q.search_term()] if q and q.search_term() else [])
+        found = None
+        if terms and use_search:
+            try:
+                found = search_channel_messages(client, channel_id, channel_name, terms, oldest, latest)
+                if on_progress:
+                    on_progress(f"Search found {len(found)} candidate messages for {', '.join(terms)}")
+                if len(found) >= HISTORY_PAGE_SIZE:
+                    # Hits fill history pages anyway: the scan is as cheap
+                    found = None
+                    if on_progress:
+                        on_progress("Hits fill whole history pages; scanning history instead")
+            except SlackApiError as e:
+                if on_progress:
+                    on_progress(f"search.messages unavailable ({e.response.get('error') if e.response else e}); scanning history")
+        if found is not None:
+            # Search hits lack reactions/files and include thread replies:
+            # export the channel messages themselves, read back a history
+            # page at a time
+            count = pipe.run(iter_messages_at(client, channel_id, [m["ts"] for m in found], SEARCH_PAGE_SIZE))
+        elif only_media and not only_text and not keywords and q is None:
+            if on_progress:
+                on_progress("Media only: listing channel files with files.list")
+            pages = iter_file_messages(client, channel_id, oldest, latest)
+            if stages:
+                with ThreadPoolExecutor(max_workers=MEDIA_CONCURRENCY) as pool:
+                    count = pipe.run(prefetch_downloads(pages, to_row, row_filter, limit, token, media_dir, pool))
             else:
-                if out_fmt == "jsonl":
-                    out_f.write(json.dumps(row, ensure_ascii=False) + "\n")
-                else:
-                    csv_writer.writerow(row)
+                count = pipe.run(pages)
+        else:
+            count = pipe.run(iter_history_pages(client, channel_id, oldest, latest))
 
-    if out_f:
-        out_f.flush(); out_f.close()
+    if reverse and row_filter is None and not limit and hasattr(sink, "commit_resume"):
+        # A complete unfiltered oldest-first run leaves no gaps behind it
+        # (unsharded, a limit keeps the newest rows of the range)
+        sink.commit_resume(channel_id)
+    directory.save()
     if on_progress:
         on_progress(f"Done. Exported {count} messages to {out_path}")
     return count
 
 
+def export_slack_workspace(
+    token: str,
+    out_dir: str,
+    out_fmt: str,
+    channels: Optional[str] = None,
+    concurrency: int = 4,
+    include_archived: bool = False,
+    media_dir: Optional[str] = None,
+    on_progress=None,
+    **options,
+) -> dict:
+    # Exports every selected conversation concurrently into per-channel files
+    # plus manifest.json. Conversations are listed once; all channels share
+    # the process-wide Slack tier limiter (slack_call), so concurrency fills
+    # the token's budget without exceeding it. Other keyword options are
+    # passed through to export_slack_messages.
+    client = WebClient(token=token)
+    ensure_dir(out_dir)
+    # A full backup always lists afresh (and refreshes the cache for pickers)
+    listed = select_channels(list_conversations(client, exclude_archived=not include_archived, refresh=True), channels)
+    # Tokens can only read history of conversations they are a member of
+    selected = [c for c in listed if c.get("is_member", True)]
+    if on_progress:
+        skipped = len(listed) - len(selected)
+        note = f" (skipping {skipped} the token is not a member of)" if skipped else ""
+        on_progress(f"Exporting {len(selected)} channels with concurrency {concurrency}{note}")
+
+    def run(info):
+        name = info.get("name") or info["id"]
+        progress = (lambda msg: on_progress(f"[#{name}] {msg}")) if on_progress else None
+        path = os.path.join(out_dir, f"{name}.{out_fmt}")
+        entry = {"id": info["id"], "name": name, "is_private": bool(info.get("is_private")), "file": os.path.basename(path)}
+        try:
+            entry["messages"] = export_slack_messages(
+                token=token,
+                channel=info["id"],
+                out_path=path,
+                out_fmt=out_fmt,
+                media_dir=os.path.join(media_dir, name) if media_dir else None,
+                channel_info=info,
+                client=client,
+                on_progress=progress,
+                **options,
+            )
+        except Exception as e:
+            entry["error"] = str(e)
+            if progress:
+                progress(f"Failed: {e}")
+        return entry
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        entries = list(pool.map(run, selected))
+
+    manifest = {
+        "exported_at": dt.datetime.now(dt.timezone.utc).isoformat(),
+        "format": out_fmt,
+        "channels": entries,
+    }
+    with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    if on_progress:
+        total = sum(e.get("messages") or 0 for e in entries)
+        failed = sum(1 for e in entries if "error" in e)
+        on_progress(f"Done. Exported {total} messages from {len(entries) - failed}/{len(entries)} channels to {out_dir}")
+    return manifest
+
+
 def test_slack_token(token: str) -> str:
     client = WebClient(token=token)
     res = client.auth_test()
@@ -340,7 +798,12 @@ def test_slack_token(token: str) -> str:
 
 def main():
     args = parse_args()
-    out_fmt = detect_format(args.out, args.format)
+    get_cache(args.cache)
+    if not args.channel and not args.channels:
+        print("Error: Provide --channel or --channels", file=sys.stderr)
+        sys.exit(1)
+    # Workspace mode writes per-channel files into the --out directory
+    out_fmt = (args.format or "jsonl") if args.channels else detect_format(args.out, args.format)
 
     if not args.token:
         print("Error: Provide --token or set SLACK_TOKEN", file=sys.stderr)
@@ -348,6 +811,37 @@ def main():
 
     kw = [x.strip() for x in (args.keywords.split(",") if args.keywords else []) if x.strip()]
     users = [x.strip() for x in (args.users.split(",") if args.users else []) if x.strip()]
+    try:
+        parse_query(args.query)
+    except QueryError as e:
+        print(f"Error: invalid --query: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.channels:
+        export_slack_workspace(
+            token=args.token,
+            out_dir=args.out,
+            out_fmt=out_fmt,
+            channels=args.channels,
+            concurrency=args.concurrency,
+            include_archived=args.include_archived,
+            media_dir=args.media_dir,
+            reverse=args.reverse,
+            resume=args.resume,
+            limit=args.limit,
+            min_date=args.min_date,
+            max_date=args.max_date,
+            only_media=args.only_media,
+            only_text=args.only_text,
+            keywords=kw,
+            users=users,
+            query=args.query,
+            expand_mentions=args.expand_mentions,
+            use_search=args.use_search,
+            shards=args.shards,
+            on_progress=lambda msg: print(msg, file=sys.stderr),
+        )
+        return
 
     export_slack_messages(
         token=args.token,
@@ -364,6 +858,10 @@ def main():
         only_text=args.only_text,
         keywords=kw,
         users=users,
+        query=args.query,
+        expand_mentions=args.expand_mentions,
+        use_search=args.use_search,
+        shards=args.shards,
         on_progress=lambda msg: print(msg, file=sys.stderr),
         sink=None,
     )
@@ -1,13 +1,27 @@
 import os
 import sys
 import json
-import csv
+import time
 import argparse
-from datetime import datetime
+import re
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timedelta, timezone
 
 from telethon.sync import TelegramClient
-from telethon.errors import FloodWaitError
-from telethon.tl.types import MessageMediaDocument, MessageMediaPhoto
+from telethon.errors import FloodWaitError, RpcCallFailError, ServerError, TakeoutInitDelayError, TimedOutError
+from telethon.sessions import StringSession
+from telethon import utils as tg_utils
+from telethon.tl.types import Channel, MessageMediaDocument, MessageMediaPhoto
+
+from .query import parse_query, merge_bounds, QueryError
+from .pipeline import Pipeline, FileSink, SharedSink, ROW_FIELDS, chunked, guarded_sink, make_row_filter
+from .ratelimit import AdaptivePacer
+from .sharding import split_range, run_shards, shard_progress
+from .tg_session_pool import SessionPool
+from .tg_connections import get_manager as tg_connections
+from .tg_sender_cache import SenderCache, sender_info
+from .metadata_cache import get_cache
 
 
 def parse_args():
@@ -15,8 +29,12 @@ def parse_args():
     p.add_argument("--api-id", type=int, default=int(os.getenv("TELEGRAM_API_ID", "0")), help="Telegram API ID")
     p.add_argument("--api-hash", default=os.getenv("TELEGRAM_API_HASH"), help="Telegram API Hash")
     p.add_argument("--session", default="tg_export.session", help="Session file name")
-    p.add_argument("--chat", required=True, help="Chat username/link/id (e.g., @group, https://t.me/group, or -100123...)")
-    p.add_argument("--out", required=True, help="Output file path (jsonl or csv)")
+    p.add_argument("--chat", default=None, help="Chat username/link/id (e.g., @group, https://t.me/group, or -100123...)")
+    p.add_argument("--chats", default=None, help="Comma-separated chats to export concurrently (--out is then a directory)")
+    p.add_argument("--chats-file", default=None, help="File with one chat per line (# comments allowed); like --chats")
+    p.add_argument("--concurrency", type=int, default=4, help="Chats exported at the same time with --chats/--chats-file")
+    p.add_argument("--combined", action="store_true", help="With --chats/--chats-file, write all chats into the single --out file")
+    p.add_argument("--out", required=True, help="Output file path (jsonl or csv), or directory for per-chat files")
     p.add_argument("--format", choices=["jsonl", "csv"], default=None, help="Output format (defaults from file extension)")
     p.add_argument("--reverse", action="store_true", help="Oldest to newest (recommended for stable resume)")
     p.add_argument("--resume", action="store_true", help="Resume from last saved message id (jsonl only)")
@@ -28,6 +46,13 @@ def parse_args():
     p.add_argument("--only-text", action="store_true", help="Only export messages without media")
     p.add_argument("--keywords", default=None, help="Comma-separated keywords (case-insensitive) to match in text")
     p.add_argument("--users", default=None, help="Comma-separated usernames (without @) or numeric IDs to include")
+    p.add_argument("--query", default=None, help="Filter query, e.g. '(outage OR incident) AND NOT test has:media from:alice before:2024-01-01'")
+    p.add_argument("--shards", type=int, default=1, help="Split the message id range into N shards fetched over N connections")
+    p.add_argument("--server-search", action="store_true", help="Send a required --query word to Telegram search (matches whole words/prefixes, not substrings)")
+    p.add_argument("--takeout", action="store_true", help="Use a takeout session (far fewer FloodWaits for full-history exports)")
+    p.add_argument("--sessions", default=None, help="Comma-separated logged-in session files to lease round-robin (moves work off accounts that hit FloodWait)")
+    p.add_argument("--pool-state", default=None, help="File persisting per-account cool-downs for --sessions (default: per-user cache directory)")
+    p.add_argument("--cache", default=None, help="Metadata cache file (default: CHATTOOLS_CACHE or the per-user cache directory)")
     return p.parse_args()
 
 
@@ -76,16 +101,18 @@ def parse_date(d):
     return datetime.strptime(d, "%Y-%m-%d")
 
 
-def msg_to_row(m, chat_title):
-    sender = None
-    sender_id = None
-    sender_username = None
-    if getattr(m, "sender", None):
-        s = m.sender
-        sender_id = getattr(s, "id", None)
-        sender_username = getattr(s, "username", None)
-        name_parts = [getattr(s, "first_name", None), getattr(s, "last_name", None)]
-        sender = " ".join([x for x in name_parts if x]) or sender_username or str(sender_id)
+def msg_to_row(m, chat_title, senders: SenderCache | None = None):
+    # Sender fields come from the entity delivered with the message, else
+    # from the sender cache; never from a network lookup
+    sender_id = getattr(m, "sender_id", None)
+    s = getattr(m, "sender", None)
+    if s is not None:
+        sender_id = getattr(s, "id", sender_id)
+        info = senders.remember(s) if senders is not None else sender_info(s)
+    else:
+        info = senders.lookup(sender_id) if senders is not None else None
+    sender_username = info["username"] if info else None
+    sender = info["display"] if info else None
 
     text = m.message or ""
     reply_to = m.reply_to_msg_id if hasattr(m, "reply_to_msg_id") else None
@@ -139,6 +166,288 @@ def ensure_dir(path):
     os.makedirs(path, exist_ok=True)
 
 
+def in_date_range(messages, lo, hi, reverse):
+    # Messages arrive ordered by date, so stop as soon as we are past the range
+    for m in messages:
+        m_dt = m.date.replace(tzinfo=None)
+        if reverse and hi and m_dt >= hi:
+            return
+        if not reverse and lo and m_dt < lo:
+            return
+        yield m
+
+
+def utc(d):
+    return d.replace(tzinfo=timezone.utc) if d and d.tzinfo is None else d
+
+
+# Largest file a takeout session is allowed to download (Telegram's upper limit)
+TAKEOUT_MAX_FILE_SIZE = 4000 * 1024 * 1024
+
+
+@contextmanager
+def takeout_session(client, files=False, on_progress=None):
+    # Yields a client whose requests are wrapped in the account's takeout
+    # session. Telegram rate-limits these far less for bulk history reads. The
+    # takeout is always finished on exit (success only when no error escaped).
+    if client.session.takeout_id is not None:
+        # Left over from an interrupted run: close it before starting a new one
+        if on_progress:
+            on_progress("Finishing a takeout session left open by a previous run")
+        client.end_takeout(success=False)
+    try:
+        tc = client.takeout(
+            finalize=True,
+            users=True,
+            chats=True,
+            megagroups=True,
+            channels=True,
+            files=files,
+            max_file_size=TAKEOUT_MAX_FILE_SIZE if files else None,
+        )
+        takeout = tc.__enter__()
+    except TakeoutInitDelayError as e:
+        raise RuntimeError(
+            f"Telegram requires a {e.seconds}s delay before this takeout can start; "
+            "confirm the data export request in your Telegram app and retry later"
+        ) from e
+    if on_progress:
+        on_progress("Takeout session started")
+    ok = False
+    try:
+        yield takeout
+        ok = True
+    finally:
+        tc.__exit__(None if ok else Exception, None, None)
+        if on_progress:
+            on_progress("Takeout session finished")
+
+
+@contextmanager
+def joined_takeout(client, takeout_id):
+    # Shard connections reuse the takeout started by the main connection and
+    # leave finishing it to that connection
+    if not takeout_id:
+        yield client
+        return
+    client.session.takeout_id = takeout_id
+    with client.takeout(finalize=False) as takeout:
+        yield takeout
+
+
+# Errors worth retrying with backoff besides FloodWait
+RETRYABLE_ERRORS = (ServerError, RpcCallFailError, TimedOutError, ConnectionError, TimeoutError)
+# messages.getHistory/messages.search return at most 100 messages per request.
+# Batches stay at that maximum: Telegram's flood limits count requests, so
+# smaller batches would only add requests; the pacer adapts the spacing.
+HISTORY_BATCH = 100
+
+
+def new_pacer(takeout=False):
+    # Takeout requests are barely throttled; regular history starts at
+    # Telethon's own bulk spacing and adapts from there
+    return AdaptivePacer(start_wait=0.0 if takeout else 1.0)
+
+
+def paced_call(pacer, fn, *args, what="request", on_progress=None, retries=6, **kwargs):
+    # One Telegram call under `pacer`. FloodWaits slow the pacer down and are
+    # retried after the server's wait plus jitter; transient errors are
+    # retried with exponential backoff.
+    for attempt in range(retries):
+        pacer.before_request()
+        try:
+            result = fn(*args, **kwargs)
+        except FloodWaitError as e:
+            if attempt == retries - 1:
+                raise
+            pacer.on_flood()
+            delay = pacer.backoff(attempt, e.seconds)
+            reason = f"FloodWait {e.seconds}s on {what}"
+        except RETRYABLE_ERRORS as e:
+            if attempt == retries - 1:
+                raise
+            delay = pacer.backoff(attempt)
+            reason = f"{type(e).__name__} on {what}"
+        else:
+            pacer.on_success()
+            return result
+        pacer.note_backoff(delay)
+        if on_progress:
+            on_progress(
+                f"{reason}; retrying in {delay:.1f}s "
+                f"(throttled {pacer.throttled:.0f}s so far, pacing {pacer.wait:.1f}s/request)"
+            )
+        time.sleep(delay)
+
+
+def iter_history(client, entity, pacer, reverse=True, min_id=0, max_id=0, offset_date=None,
+                 search=None, limit=None, on_progress=None):
+    # Pages of history fetched one request at a time, each under `pacer`; a
+    # retried request resumes from the last message received
+    offset_id = 0
+    got = 0
+    while not limit or got < limit:
+        batch = min(HISTORY_BATCH, limit - got) if limit else HISTORY_BATCH
+        page = paced_call(
+            pacer, client.get_messages, entity,
+            limit=batch,
+            reverse=reverse,
+            min_id=min_id,
+            max_id=max_id,
+            offset_id=offset_id,
+            offset_date=None if offset_id else offset_date,
+            search=search,
+            wait_time=0,
+            what="history",
+            on_progress=on_progress,
+        )
+        page = list(page or [])
+        if not page:
+            return
+        yield page
+        got += len(page)
+        offset_id = page[-1].id
+
+
+def make_media_stage(client, media_dir, on_progress=None, pacer=None):
+    # With client=None each message is downloaded through the connection that
+    # fetched it (session pool exports switch connections mid-range)
+    pacer = pacer or AdaptivePacer()
+
+    def download(row, m):
+        # Optionally download media (only for filesystem exports)
+        if m.media:
+            c = client or m.client
+            try:
+                row["media_path"] = paced_call(
+                    pacer, c.download_media, m, file=media_dir, what=f"media of {m.id}", on_progress=on_progress,
+                )
+            except Exception as e:
+                row["media_path"] = None
+                if on_progress:
+                    on_progress(f"Media download failed for {m.id}: {e}")
+        return row
+    return download
+
+
+def message_id_bounds(client, entity, lo=None, hi=None, last_id=None):
+    # Half-open [start, end) message id range covering the requested dates
+    latest = client.get_messages(entity, limit=1)
+    if not latest:
+        return None
+    start = (last_id + 1) if last_id else 1
+    end = latest[0].id + 1
+    if lo:
+        first = client.get_messages(entity, limit=1, offset_date=utc(lo - timedelta(seconds=1)), reverse=True)
+        if not first:
+            return None
+        start = max(start, first[0].id)
+    if hi:
+        last = client.get_messages(entity, limit=1, offset_date=utc(hi))
+        if not last:
+            return None
+        end = min(end, last[0].id + 1)
+    return (start, end) if start < end else None
+
+
+def iter_id_range(client, entity, start, end, reverse=True, search=None, on_progress=None, pacer=None):
+    # Pages of messages with start <= id < end. FloodWaits only pace and
+    # pause the caller (one shard), which retries from its last page.
+    return iter_history(
+        client, entity, pacer or new_pacer(), reverse=reverse, min_id=start - 1, max_id=end,
+        search=search, on_progress=on_progress,
+    )
+
+
+def resolve_peer(client, chat):
+    try:
+        return client.get_input_entity(chat)
+    except ValueError:
+        # Fresh in-memory sessions know no entities yet; numeric ids need the
+        # account's dialogs to be loaded first
+        client.get_dialogs()
+        return client.get_input_entity(chat)
+
+
+def iter_pool_range(pool, api_id, api_hash, chat, start, end, reverse=True, search=None, on_progress=None, page_size=100):
+    # Like iter_id_range, but over leased pool accounts: a FloodWait puts the
+    # account on cool-down and the range continues on another account after
+    # the last page yielded. Channel message ids are the same for every
+    # member, so the cursor carries over; peers are resolved per account.
+    min_id, max_id = start - 1, end
+    while True:
+        lease = pool.lease(on_progress)
+        c = TelegramClient(StringSession(lease.session), api_id, api_hash)
+        # Surface every FloodWait instead of letting Telethon sleep through it
+        c.flood_sleep_threshold = 0
+        c.connect()
+        try:
+            peer = resolve_peer(c, chat)
+            it = c.iter_messages(peer, reverse=reverse, min_id=min_id, max_id=max_id, search=search)
+            for page in chunked(it, page_size):
+                yield page
+                if reverse:
+                    min_id = page[-1].id
+                else:
+                    max_id = page[-1].id
+            return
+        except FloodWaitError as e:
+            pool.cool_down(lease.name, e.seconds)
+            if on_progress:
+                on_progress(f"FloodWait {e.seconds}s on {os.path.basename(lease.name)}; moving to another account")
+        finally:
+            c.disconnect()
+            pool.release(lease)
+
+
+def export_id_shards(client, entity, api_id, api_hash, shards, lo, hi, last_id, reverse, search,
+                     build_pipeline, out_path, out, limit=None, on_progress=None, takeout_id=None,
+                     pool=None, chat=None):
+    # Message ids are dense and monotonic per chat: split [start, end) into id
+    # ranges and fetch each over its own connection, cloned from the logged-in
+    # session so the .session file is never opened concurrently. With a
+    # takeout, every shard joins the main connection's takeout session; with
+    # a session pool, shards lease accounts from the pool instead.
+    bounds = message_id_bounds(client, entity, lo, hi, last_id)
+    if not bounds:
+        if hasattr(out, "close"):
+            out.close()
+        return 0
+    ranges = split_range(bounds[0], bounds[1], shards)
+    if on_progress:
+        on_progress(f"Exporting ids {bounds[0]}..{bounds[1] - 1} in {len(ranges)} shards")
+
+    if pool is not None:
+        def export_range(i, a, b, segment, budget):
+            progress = shard_progress(on_progress, i, len(ranges))
+            pipe = build_pipeline(FileSink(segment, "jsonl"), None, progress, budget and budget.slot(i, ordered=True))
+            pages = iter_pool_range(pool, api_id, api_hash, chat, a, b, reverse, search, progress)
+            return pipe.run(pages, threaded_source=False)
+
+        return run_shards(ranges if reverse else ranges[::-1], export_range, out_path, out, limit, on_progress)
+
+    session_str = StringSession.save(client.session)
+    peer = client.get_input_entity(entity)
+
+    def export_range(i, a, b, segment, budget):
+        # Shards fetch in output order, so each stops as soon as the merge
+        # has enough rows up to and including it
+        progress = shard_progress(on_progress, i, len(ranges))
+        c = TelegramClient(StringSession(session_str), api_id, api_hash)
+        # FloodWaits are paced and retried by iter_id_range, not slept through
+        c.flood_sleep_threshold = 0
+        c.connect()
+        try:
+            with joined_takeout(c, takeout_id) as tc:
+                pipe = build_pipeline(FileSink(segment, "jsonl"), tc, progress, budget and budget.slot(i, ordered=True))
+                pages = iter_id_range(tc, peer, a, b, reverse, search, progress, new_pacer(bool(takeout_id)))
+                return pipe.run(pages, threaded_source=False)
+        finally:
+            c.disconnect()
+
+    return run_shards(ranges if reverse else ranges[::-1], export_range, out_path, out, limit, on_progress)
+
+
 def export_messages(
     api_id: int,
     api_hash: str,
@@ -156,129 +465,272 @@ def export_messages(
     only_text: bool = False,
     keywords: list[str] | None = None,
     users: list[str] | None = None,
+    query: str | None = None,
+    shards: int = 1,
+    takeout: bool = False,
+    server_search: bool = False,
+    pool: SessionPool | None = None,
+    client=None,
+    pacer: AdaptivePacer | None = None,
+    file_sink=None,
     on_progress=None,
     sink=None,
 ):
+    # `client`: an already connected client (e.g. the server's shared
+    # connection) to use instead of opening `session`. `pacer` and
+    # `file_sink` let concurrent exports share request pacing and an output.
+    # `server_search` sends a required query word to Telegram search, which
+    # matches words/prefixes: messages that only contain it inside a longer
+    # word or a URL are then not fetched.
+    if pool is not None and takeout:
+        raise ValueError("Takeout mode cannot be combined with a session pool")
     if media_dir and not sink:
         # Only ensure local media directory when writing to filesystem
         ensure_dir(media_dir)
 
     min_dt = parse_date(min_date)
     max_dt = parse_date(max_date)
+    q = parse_query(query)
+    # Combined [lo, hi) bounds from --min-date/--max-date and the query
+    lo, hi = merge_bounds(min_dt, max_dt, q)
     last_id = None
     if resume and out_fmt == "jsonl" and os.path.exists(out_path):
         last_id = read_last_id_jsonl(out_path)
         if last_id and on_progress:
             on_progress(f"Resuming after message id {last_id}")
 
-    kw_list = [k.strip().lower() for k in (keywords or []) if k.strip()]
-    user_list = [u.strip().lstrip("@") for u in (users or []) if u.strip()]
-
-    with TelegramClient(session, api_id, api_hash) as client:
+    row_filter = make_row_filter(lo, hi, only_media, only_text, users, keywords, q)
+
+    # With a pool, setup (entity, bounds, external sink) runs on a leased account
+    lease = pool.lease(on_progress) if (pool is not None and client is None) else None
+    if lease is not None:
+        session = StringSession(lease.session)
+    try:
+        return _export(
+            api_id, api_hash, session, client, chat, out_path, out_fmt, reverse, limit, media_dir,
+            lo, hi, last_id, q, row_filter, shards, takeout, pool, on_progress, sink,
+            pacer=pacer, file_sink=file_sink, server_search=server_search,
+            resume_sink=resume and sink is not None and hasattr(sink, "resume_after"),
+        )
+    finally:
+        if lease is not None:
+            pool.release(lease)
+
+
+def _export(api_id, api_hash, session, shared_client, chat, out_path, out_fmt, reverse, limit, media_dir,
+            lo, hi, last_id, q, row_filter, shards, takeout, pool, on_progress, sink,
+            pacer=None, file_sink=None, server_search=False, resume_sink=False):
+    opened = nullcontext(shared_client) if shared_client is not None else TelegramClient(session, api_id, api_hash)
+    with opened as client, \
+            (takeout_session(client, bool(media_dir and sink is None), on_progress) if takeout else nullcontext(client)) as reader:
+        # `reader` fetches history (through the takeout when enabled)
+        if shared_client is None:
+            # FloodWaits go to the pacer instead of Telethon's silent sleeps
+            client.flood_sleep_threshold = 0
+        pacer = pacer or new_pacer(takeout)
         entity = client.get_entity(chat)
         chat_title = getattr(entity, "title", getattr(entity, "username", str(getattr(entity, "id", ""))))
+        if resume_sink:
+            # External sinks (Notion) know what they already delivered
+            delivered = sink.resume_after(tg_utils.get_peer_id(entity))
+            if delivered:
+                last_id = int(delivered)
+                if on_progress:
+                    on_progress(f"Resuming after message id {last_id}")
+        senders = SenderCache(str(tg_utils.get_peer_id(entity)))
+        senders.prewarm(client, entity, on_progress)
+
+        # Date bounds are pushed down to Telegram, a required search word
+        # only on request (Telegram search is word-based, the local filter
+        # matches substrings); the full filter is still applied locally
+        search = q.search_term() if (q and server_search) else None
+        if search and on_progress:
+            on_progress(f"Using Telegram search for '{search}'")
+
+        def build_pipeline(out, c, progress, enough=None):
+            # `c` is the client that fetched the messages (media must use it too)
+            return Pipeline(
+                to_row=lambda m: msg_to_row(m, chat_title, senders),
+                sink=out,
+                filters=[row_filter],
+                stages=[make_media_stage(c, media_dir, progress)] if (media_dir and sink is None) else [],
+                limit=limit,
+                on_progress=progress,
+                enough=enough,
+            )
 
-        # Prepare writers (filesystem only)
-        out_f = None
-        csv_writer = None
-        if sink is None:
-            if out_fmt == "jsonl":
-                out_f = open(out_path, "a", encoding="utf-8")
-            else:
-                out_f = open(out_path, "a", newline="", encoding="utf-8")
-                headers = [
-                    "id","date","chat_id","chat_title","sender_id","sender_username",
-                    "sender_display","text","reply_to_id","views","forwards","edit_date",
-                    "via_bot_id","is_pinned","media","media_type","media_file_name"
-                ]
-                csv_writer = csv.DictWriter(out_f, fieldnames=headers)
-                if out_f.tell() == 0:
-                    csv_writer.writeheader()
-
-        count = 0
-        try:
-            it = client.iter_messages(
+        if sink is not None:
+            external = sink
+            out = guarded_sink(lambda row, m: external(row, m, client), on_progress)
+        elif file_sink is not None:
+            out = file_sink
+        else:
+            out = FileSink(out_path, out_fmt, ROW_FIELDS)
+
+        if pool is not None and not isinstance(entity, Channel):
+            # Basic group/private message ids differ per account: no failover
+            if on_progress:
+                on_progress("Not a channel or supergroup; exporting from a single pool account")
+            pool = None
+        # Each pool account resolves the chat itself (access hashes are per account)
+        chat_ref = (getattr(entity, "username", None) or tg_utils.get_peer_id(entity)) if pool is not None else chat
+
+        if shards and shards > 1:
+            count = export_id_shards(
+                reader, entity, api_id, api_hash, shards, lo, hi, last_id, reverse, search,
+                build_pipeline, out_path, out, limit, on_progress,
+                takeout_id=client.session.takeout_id if takeout else None,
+                pool=pool, chat=chat_ref,
+            )
+        elif pool is not None:
+            bounds = message_id_bounds(client, entity, lo, hi, last_id)
+            pages = iter_pool_range(pool, api_id, api_hash, chat_ref, *bounds, reverse, search, on_progress) if bounds else []
+            count = build_pipeline(out, None, on_progress).run(pages, threaded_source=False)
+        else:
+            # offset_date is exclusive: step back so a message stamped exactly
+            # at the lower bound is still returned (the filter enforces lo)
+            offset_date = (lo - timedelta(seconds=1) if lo else None) if reverse else hi
+            history = iter_history(
+                reader,
                 entity,
+                pacer,
                 reverse=reverse,
-                limit=limit,
-                min_id=(last_id + 1) if last_id else 0,
+                min_id=last_id or 0,
+                offset_date=utc(offset_date),
+                search=search,
+                # Only cap the fetch when nothing can be filtered out locally
+                limit=limit if row_filter is None else None,
+                on_progress=on_progress,
             )
-            for m in it:
-                # Date filters
-                if min_dt and m.date.replace(tzinfo=None) < min_dt:
-                    continue
-                if max_dt and m.date.replace(tzinfo=None) > max_dt:
-                    continue
+            messages = (m for page in history for m in page)
+            pages = chunked(in_date_range(messages, lo, hi, reverse), HISTORY_BATCH)
+            # Telethon's sync client is bound to this thread's event loop, so the
+            # source stays here; writing overlaps on the pipeline's sink thread
+            count = build_pipeline(out, reader, on_progress).run(pages, threaded_source=False)
+
+        if reverse and row_filter is None and hasattr(sink, "commit_resume"):
+            # A complete unfiltered oldest-first run leaves no gaps behind it
+            sink.commit_resume(tg_utils.get_peer_id(entity))
+        senders.save()
+        if on_progress:
+            throttled = f" (throttled {pacer.throttled:.0f}s)" if pacer.throttled >= 1 else ""
+            on_progress(f"Done. Exported {count} messages to {out_path}{throttled}")
+    return count
 
-                # Media filters
-                if only_media and not m.media:
-                    continue
-                if only_text and m.media:
-                    continue
 
-                # User filters
-                if user_list:
-                    uid = str(getattr(m.sender, "id", "")) if getattr(m, "sender", None) else ""
-                    uname = (getattr(m.sender, "username", None) or "").lower() if getattr(m, "sender", None) else ""
-                    if uid not in user_list and (uname not in [u.lower() for u in user_list]):
-                        continue
-
-                # Keyword filters
-                if kw_list:
-                    text = (m.message or "").lower()
-                    if not any(k in text for k in kw_list):
-                        continue
-
-                row = msg_to_row(m, chat_title)
-
-                # Optionally download media (only for filesystem exports)
-                if media_dir and m.media and sink is None:
-                    try:
-                        path = client.download_media(m, file=media_dir)
-                        row["media_path"] = path
-                    except FloodWaitError as e:
-                        if on_progress:
-                            on_progress(f"Rate limited during media download, sleeping {e.seconds}s...")
-                        import time
-                        time.sleep(e.seconds)
-                        path = client.download_media(m, file=media_dir)
-                        row["media_path"] = path
-                    except Exception as e:
-                        row["media_path"] = None
-                        if on_progress:
-                            on_progress(f"Media download failed for {m.id}: {e}")
-
-                if sink is not None:
-                    try:
-                        sink(row, m, client)
-                    except Exception as e:
-                        if on_progress:
-                            on_progress(f"Sink error for message {m.id}: {e}")
-                else:
-                    if out_fmt == "jsonl":
-                        out_f.write(json.dumps(row, ensure_ascii=False) + "\n")
-                    else:
-                        csv_writer.writerow(row)
+def chat_file_name(chat: str) -> str:
+    # Filesystem-safe name for a chat reference (@name, t.me link or id)
+    name = chat.strip().rstrip("/")
+    if "t.me/" in name:
+        name = name.split("t.me/", 1)[1]
+    name = re.sub(r"[^\w.-]+", "_", name.lstrip("@+")).strip("_")
+    return name or "chat"
 
-                count += 1
-                if count % 500 == 0:
-                    out_f.flush()
-                    if on_progress:
-                        on_progress(f"Exported {count} messages...")
 
-        finally:
-            if out_f:
-                out_f.flush()
-                out_f.close()
+def read_chat_list(path: str) -> list[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        lines = [line.split("#", 1)[0].strip() for line in f]
+    return [line for line in lines if line]
 
-        if on_progress:
-            on_progress(f"Done. Exported {count} messages to {out_path}")
-    return count
+
+def export_chats(
+    api_id: int,
+    api_hash: str,
+    session: str,
+    chats: list[str],
+    out: str,
+    out_fmt: str,
+    concurrency: int = 4,
+    combined: bool = False,
+    resume: bool = False,
+    media_dir: str | None = None,
+    takeout: bool = False,
+    client=None,
+    on_progress=None,
+    **options,
+) -> dict:
+    # Exports many chats concurrently over one connected client (the shared
+    # connection manager's), with one pacer for the whole account. `out` is a
+    # directory of per-chat files, or a single file when `combined`. Other
+    # keyword options are passed through to export_messages. Returns
+    # {chat: message count} with an error string for chats that failed.
+    chats = list(dict.fromkeys(c.strip() for c in chats if c and c.strip()))
+    own = client is None
+    if own:
+        manager = tg_connections()
+        client = manager.get(session, api_id, api_hash).client
+        if not client.is_user_authorized():
+            raise RuntimeError("Telegram session is not logged in; run a single-chat export first to log in")
+
+    shared = None
+    if combined:
+        # One stream; rows carry chat_id/chat_title. Resume needs per-chat files.
+        shared = SharedSink(FileSink(out, out_fmt, ROW_FIELDS))
+        resume = False
+    else:
+        ensure_dir(out)
+
+    results: dict = {}
+
+    def run(chat, reader, pacer):
+        name = chat_file_name(chat)
+        progress = (lambda msg: on_progress(f"[{name}] {msg}")) if on_progress else None
+        try:
+            results[chat] = export_messages(
+                api_id=api_id,
+                api_hash=api_hash,
+                session=session,
+                chat=chat,
+                out_path=out if combined else os.path.join(out, f"{name}.{out_fmt}"),
+                out_fmt=out_fmt,
+                resume=resume,
+                media_dir=os.path.join(media_dir, name) if media_dir else None,
+                client=reader,
+                pacer=pacer,
+                file_sink=shared,
+                on_progress=progress,
+                **options,
+            )
+        except Exception as e:
+            results[chat] = f"error: {e}"
+            if progress:
+                progress(f"Failed: {e}")
+
+    try:
+        # A takeout is per account, so all chats share one
+        with (takeout_session(client, bool(media_dir), on_progress) if takeout else nullcontext(client)) as reader:
+            pacer = new_pacer(takeout)
+            with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+                for chat in chats:
+                    pool.submit(run, chat, reader, pacer)
+    finally:
+        if shared is not None:
+            shared.sink.close()
+        if own:
+            manager.persist(session)
+            manager.drop(session)
+
+    if on_progress:
+        failed = sum(1 for v in results.values() if not isinstance(v, int))
+        total = sum(v for v in results.values() if isinstance(v, int))
+        on_progress(f"Done. Exported {total} messages from {len(chats) - failed}/{len(chats)} chats to {out}")
+    return results
 
 
 def main():
     args = parse_args()
-    out_fmt = detect_format(args.out, args.format)
+    get_cache(args.cache)
+    chats = [x.strip() for x in (args.chats.split(",") if args.chats else []) if x.strip()]
+    if args.chats_file:
+        chats += read_chat_list(args.chats_file)
+    if not chats and not args.chat:
+        print("Error: Provide --chat, --chats or --chats-file", file=sys.stderr)
+        sys.exit(1)
+    if chats and not args.combined:
+        # Per-chat files in the --out directory
+        out_fmt = args.format or "jsonl"
+    else:
+        out_fmt = detect_format(args.out, args.format)
 
     if not args.api_id or not args.api_hash:
         print("Error: Provide --api-id and --api-hash or set TELEGRAM_API_ID/TELEGRAM_API_HASH", file=sys.stderr)
@@ -286,6 +738,41 @@ def main():
 
     kw = [x for x in (args.keywords.split(",") if args.keywords else [])]
     users = [x for x in (args.users.split(",") if args.users else [])]
+    try:
+        parse_query(args.query)
+    except QueryError as e:
+        print(f"Error: invalid --query: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if chats:
+        if args.chat:
+            chats.insert(0, args.chat)
+        export_chats(
+            api_id=args.api_id,
+            api_hash=args.api_hash,
+            session=args.session,
+            chats=chats,
+            out=args.out,
+            out_fmt=out_fmt,
+            concurrency=args.concurrency,
+            combined=args.combined,
+            resume=args.resume,
+            media_dir=args.media_dir,
+            takeout=args.takeout,
+            reverse=args.reverse,
+            limit=args.limit,
+            min_date=args.min_date,
+            max_date=args.max_date,
+            only_media=args.only_media,
+            only_text=args.only_text,
+            keywords=kw,
+            users=users,
+            query=args.query,
+            shards=args.shards,
+            server_search=args.server_search,
+            on_progress=lambda msg: print(msg, file=sys.stderr),
+        )
+        return
 
     export_messages(
         api_id=args.api_id,
@@ -304,6 +791,11 @@ def main():
         only_text=args.only_text,
         keywords=kw,
         users=users,
+        query=args.query,
+        shards=args.shards,
+        server_search=args.server_search,
+        takeout=args.takeout,
+        pool=SessionPool(args.sessions.split(","), args.pool_state) if args.sessions else None,
         on_progress=lambda msg: print(msg, file=sys.stderr),
         sink=None,
     )
@@ -0,0 +1,137 @@
+import heapq
+import itertools
+import os
+import threading
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+
+# Admission control for the server's export jobs. Jobs wait in a bounded
+# priority queue and run on a fixed pool of worker threads. A job starts only
+# while its platform and its account (token or session) are below their
+# concurrency caps, so a burst of requests queues up instead of
+# oversubscribing CPU, sockets and the platforms' rate limits. Higher
+# priorities run first; equal priorities run in submission order. A job that
+# is blocked by a cap does not hold back eligible jobs behind it.
+
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_QUEUED = 64
+DEFAULT_PER_KEY = 1  # concurrent jobs per token/session on other platforms
+PLATFORM_LIMITS = {"telegram": 2, "slack": 2, "discord": 2}
+# Concurrent jobs per token/session. A Telegram session serves several chats
+# over its one shared connection and Discord buckets are per channel; Slack's
+# per-token method tiers would only be split between jobs.
+PER_KEY_LIMITS = {"telegram": 2, "slack": 1, "discord": 2}
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, job_id: str, fn: Callable[[], None], platform: str, key: Optional[str], priority: int):
+        self.id = job_id
+        self.fn = fn
+        self.platform = platform
+        self.key = f"{platform}:{key}" if key else None
+        self.priority = priority
+
+
+class JobScheduler:
+    def __init__(self, workers: int = DEFAULT_WORKERS, max_queued: int = DEFAULT_MAX_QUEUED,
+                 platform_limits: Optional[Dict[str, int]] = None, per_key: Optional[Dict[str, int]] = None):
+        self.max_queued = max_queued
+        self.platform_limits = dict(PLATFORM_LIMITS if platform_limits is None else platform_limits)
+        self.per_key = dict(PER_KEY_LIMITS if per_key is None else per_key)
+        self.cond = threading.Condition()
+        self.queue: List[tuple] = []  # heap of (-priority, seq, job)
+        self.seq = itertools.count()
+        self.running_platform: Counter = Counter()
+        self.running_key: Counter = Counter()
+        for i in range(max(1, workers)):
+            threading.Thread(target=self._worker, name=f"export-worker-{i}", daemon=True).start()
+
+    def submit(self, job_id: str, fn: Callable[[], None], platform: str, key: Optional[str] = None, priority: int = 0) -> int:
+        # Queues the job; returns its queue position (1 = next to start)
+        job = Job(job_id, fn, platform, key, priority)
+        with self.cond:
+            if len(self.queue) >= self.max_queued:
+                raise QueueFull(f"Export queue is full ({self.max_queued} jobs waiting); try again later")
+            heapq.heappush(self.queue, (-priority, next(self.seq), job))
+            self.cond.notify_all()
+            return self._position(job_id) or 0
+
+    def position(self, job_id: str) -> Optional[int]:
+        with self.cond:
+            return self._position(job_id)
+
+    def stats(self) -> dict:
+        with self.cond:
+            return {
+                "queued": len(self.queue),
+                "running": dict(self.running_platform),
+                "limits": dict(self.platform_limits),
+                "per_key_limits": dict(self.per_key),
+            }
+
+    def _position(self, job_id: str) -> Optional[int]:
+        for i, (_, _, job) in enumerate(sorted(self.queue, key=lambda e: e[:2]), 1):
+            if job.id == job_id:
+                return i
+        return None
+
+    def _eligible(self, job: Job) -> bool:
+        limit = self.platform_limits.get(job.platform)
+        if limit is not None and self.running_platform[job.platform] >= limit:
+            return False
+        return job.key is None or self.running_key[job.key] < self.per_key.get(job.platform, DEFAULT_PER_KEY)
+
+    def _take(self) -> Optional[Job]:
+        # First job in priority order that its caps allow to start
+        for entry in sorted(self.queue, key=lambda e: e[:2]):
+            job = entry[2]
+            if self._eligible(job):
+                self.queue.remove(entry)
+                heapq.heapify(self.queue)
+                self.running_platform[job.platform] += 1
+                if job.key:
+                    self.running_key[job.key] += 1
+                return job
+        return None
+
+    def _worker(self):
+        while True:
+            with self.cond:
+                job = self._take()
+                while job is None:
+                    self.cond.wait()
+                    job = self._take()
+            try:
+                job.fn()
+            except Exception:
+                pass  # jobs record their own errors
+            finally:
+                with self.cond:
+                    self.running_platform[job.platform] -= 1
+                    if job.key:
+                        self.running_key[job.key] -= 1
+                    self.cond.notify_all()
+
+
+_scheduler: Optional[JobScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> JobScheduler:
+    # Process-wide scheduler, sized by EXPORTER_WORKERS / EXPORTER_QUEUE;
+    # EXPORTER_PER_KEY_<PLATFORM> (e.g. EXPORTER_PER_KEY_TELEGRAM=3) overrides
+    # a platform's jobs per token/session
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            per_key = {p: int(os.getenv(f"EXPORTER_PER_KEY_{p.upper()}") or n) for p, n in PER_KEY_LIMITS.items()}
+            _scheduler = JobScheduler(
+                workers=int(os.getenv("EXPORTER_WORKERS") or DEFAULT_WORKERS),
+                max_queued=int(os.getenv("EXPORTER_QUEUE") or DEFAULT_MAX_QUEUED),
+                per_key=per_key,
+            )
+        return _scheduler
@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Small on-disk cache for platform metadata (Slack conversation lists and
+# conversations.info, Discord guild channel/thread listings), shared by the
+# exporters and the server so that #name resolution and picker searches do
+# not re-list a whole workspace every time.
+#
+# Entries are fresh for `ttl` seconds. Stale entries are still served while a
+# background refresh runs (at most one per key), and a refresh whose content
+# hash matches the stored one only bumps the timestamp. Slack and Discord do
+# not send ETags for these endpoints, so the hash plays that role. Callers
+# that need an exact answer (a lookup miss, a full export) pass refresh=True.
+
+CACHE_FILE = "chattools_cache.sqlite"
+DEFAULT_TTL = 15 * 60  # seconds
+
+
+def user_cache_dir() -> str:
+    # Per-user cache directory (platformdirs when installed)
+    try:
+        from platformdirs import user_cache_dir as platform_cache_dir
+        return platform_cache_dir("chattools-exporter", appauthor=False)
+    except ImportError:
+        pass
+    if os.name == "nt":
+        return os.path.join(os.getenv("LOCALAPPDATA") or os.path.expanduser("~"), "chattools-exporter", "Cache")
+    if sys.platform == "darwin":
+        return os.path.join(os.path.expanduser("~/Library/Caches"), "chattools-exporter")
+    return os.path.join(os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "chattools-exporter")
+
+
+def default_cache_path() -> str:
+    # CHATTOOLS_CACHE overrides the per-user location
+    return os.getenv("CHATTOOLS_CACHE") or os.path.join(user_cache_dir(), CACHE_FILE)
+
+
+def token_key(token: str) -> str:
+    # Cache keys never contain the token itself
+    return hashlib.sha256((token or "").encode("utf-8")).hexdigest()[:16]
+
+
+def _digest(payload: str) -> str:
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MetadataCache:
+    def __init__(self, path: Optional[str] = None, ttl: float = DEFAULT_TTL):
+        self.path = path or default_cache_path()
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.refreshing: Dict[Tuple[str, str], threading.Thread] = {}
+        parent = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(parent, exist_ok=True)
+        self.db = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        with self.lock:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS metadata ("
+                " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+                " etag TEXT NOT NULL, fetched_at REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            self.db.commit()
+
+    def get(self, namespace: str, key: str) -> Tuple[Any, float]:
+        # (value, age in seconds); (None, inf) when missing
+        with self.lock:
+            row = self.db.execute(
+                "SELECT value, fetched_at FROM metadata WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+        if row is None:
+            return None, float("inf")
+        return json.loads(row[0]), time.time() - row[1]
+
+    def put(self, namespace: str, key: str, value: Any, keep_age: bool = False):
+        # keep_age: amend a stored value without making it look fresh, so its
+        # refresh still comes due
+        payload = json.dumps(value, ensure_ascii=False, sort_keys=True)
+        etag = _digest(payload)
+        now = time.time()
+        with self.lock:
+            if keep_age:
+                row = self.db.execute(
+                    "SELECT fetched_at FROM metadata WHERE namespace = ? AND key = ?", (namespace, key)
+                ).fetchone()
+                now = row[0] if row else now
+            cur = self.db.execute(
+                "UPDATE metadata SET fetched_at = ? WHERE namespace = ? AND key = ? AND etag = ?",
+                (now, namespace, key, etag),
+            )
+            if cur.rowcount == 0:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO metadata (namespace, key, value, etag, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                    (namespace, key, payload, etag, now),
+                )
+            self.db.commit()
+
+    def invalidate(self, namespace: str, key: Optional[str] = None):
+        with self.lock:
+            if key is None:
+                self.db.execute("DELETE FROM metadata WHERE namespace = ?", (namespace,))
+            else:
+                self.db.execute("DELETE FROM metadata WHERE namespace = ? AND key = ?", (namespace, key))
+            self.db.commit()
+
+    def _refresh_in_background(self, namespace: str, key: str, loader: Callable[[], Any]):
+        slot = (namespace, key)
+
+        def run():
+            try:
+                self.put(namespace, key, loader())
+            except Exception:
+                pass  # keep serving the stale value; the next call retries
+            finally:
+                with self.lock:
+                    self.refreshing.pop(slot, None)
+
+        with self.lock:
+            if slot in self.refreshing:
+                return
+            t = self.refreshing[slot] = threading.Thread(target=run, name=f"cache-refresh-{namespace}", daemon=True)
+        t.start()
+
+    def fetch(self, namespace: str, key: str, loader: Callable[[], Any], ttl: Optional[float] = None, refresh: bool = False) -> Any:
+        # Cached value for (namespace, key), loading it on a miss. Stale
+        # values are returned immediately and refreshed in the background.
+        if not refresh:
+            value, age = self.get(namespace, key)
+            if value is not None:
+                if age > (self.ttl if ttl is None else ttl):
+                    self._refresh_in_background(namespace, key, loader)
+                return value
+        value = loader()
+        self.put(namespace, key, value)
+        return value
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+_cache: Optional[MetadataCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache(path: Optional[str] = None) -> MetadataCache:
+    # Process-wide cache; the first caller may choose the file (the server
+    # keeps it next to its config, the CLIs take --cache)
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = MetadataCache(path or default_cache_path())
+        return _cache
@@ -0,0 +1,176 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+# Local record of what the Notion sink has written: for every exported
+# message (per destination, i.e. platform, parent and mode, and per chat) the
+# Notion page holding it, the block ids of its content and a hash of that
+# content. Re-running an export skips unchanged messages without any API
+# call and patches edited ones in place.
+#
+# A chat's resume cursor is the id up to which every message has been
+# accepted for a destination. Only complete, unfiltered oldest-first runs
+# advance it; other runs lean on the ledger to skip what is already written.
+#
+# The same database holds the sink's outbox, a write-ahead queue of rows
+# accepted from the exporter but not yet confirmed by Notion. Rows leave it
+# only once written, so a failure or restart never loses them; delivery is
+# at-least-once and the ledger makes repeats free. Each row belongs to the
+# run (sink) that queued it and is delivered by that run alone while it keeps
+# renewing its lease; rows whose lease ran out are claimed by exactly one
+# later run for the same destination.
+
+DEFAULT_LEDGER_PATH = "notion_ledger.sqlite"
+
+
+@dataclass
+class LedgerEntry:
+    page_id: str
+    block_ids: List[str]
+    content_hash: str
+
+
+def content_hash(title: str, blocks: list) -> str:
+    payload = json.dumps([title, blocks], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def id_order(message_id: str) -> tuple:
+    # Sort key for numeric string ids of any length
+    return len(message_id), message_id
+
+
+class NotionLedger:
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or DEFAULT_LEDGER_PATH
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        with self.lock:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                " destination TEXT NOT NULL, chat_id TEXT NOT NULL, message_id TEXT NOT NULL,"
+                " page_id TEXT NOT NULL, block_ids TEXT NOT NULL, content_hash TEXT NOT NULL,"
+                " PRIMARY KEY (destination, chat_id, message_id))"
+            )
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS cursors ("
+                " destination TEXT NOT NULL, chat_id TEXT NOT NULL, message_id TEXT NOT NULL,"
+                " PRIMARY KEY (destination, chat_id))"
+            )
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS outbox ("
+                " seq INTEGER PRIMARY KEY AUTOINCREMENT, destination TEXT NOT NULL, run_id TEXT NOT NULL,"
+                " lease_until REAL NOT NULL, chat_id TEXT NOT NULL, message_id TEXT NOT NULL, row TEXT NOT NULL)"
+            )
+            self.db.execute("CREATE INDEX IF NOT EXISTS outbox_run ON outbox (run_id, seq)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS outbox_destination ON outbox (destination, lease_until)")
+            self.db.commit()
+
+    def get(self, destination: str, chat_id, message_id) -> Optional[LedgerEntry]:
+        with self.lock:
+            row = self.db.execute(
+                "SELECT page_id, block_ids, content_hash FROM messages"
+                " WHERE destination = ? AND chat_id = ? AND message_id = ?",
+                (destination, str(chat_id), str(message_id)),
+            ).fetchone()
+        if row is None:
+            return None
+        return LedgerEntry(row[0], json.loads(row[1]), row[2])
+
+    def put(self, destination: str, chat_id, message_id, entry: LedgerEntry):
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO messages"
+                " (destination, chat_id, message_id, page_id, block_ids, content_hash)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (destination, str(chat_id), str(message_id), entry.page_id, json.dumps(entry.block_ids), entry.content_hash),
+            )
+            self.db.commit()
+
+    def cursor(self, destination: str, chat_id) -> Optional[str]:
+        with self.lock:
+            row = self.db.execute(
+                "SELECT message_id FROM cursors WHERE destination = ? AND chat_id = ?",
+                (destination, str(chat_id)),
+            ).fetchone()
+        return row[0] if row else None
+
+    def advance_cursor(self, destination: str, chat_id, message_id):
+        # Never moves backwards; ids are numeric strings (Telegram ids, Slack
+        # ts, Discord snowflakes), so compare by length, then text
+        message_id = str(message_id)
+        with self.lock:
+            row = self.db.execute(
+                "SELECT message_id FROM cursors WHERE destination = ? AND chat_id = ?",
+                (destination, str(chat_id)),
+            ).fetchone()
+            if row and id_order(row[0]) >= id_order(message_id):
+                return
+            self.db.execute(
+                "INSERT OR REPLACE INTO cursors (destination, chat_id, message_id) VALUES (?, ?, ?)",
+                (destination, str(chat_id), message_id),
+            )
+            self.db.commit()
+
+    # --- outbox ---
+
+    def enqueue(self, run_id: str, destination: str, lease_until: float, chat_id, message_id, row: dict) -> int:
+        with self.lock:
+            cur = self.db.execute(
+                "INSERT INTO outbox (destination, run_id, lease_until, chat_id, message_id, row) VALUES (?, ?, ?, ?, ?, ?)",
+                (destination, run_id, lease_until, str(chat_id), str(message_id), json.dumps(row, ensure_ascii=False, default=str)),
+            )
+            self.db.commit()
+            return cur.lastrowid
+
+    def claim(self, run_id: str, destination: str, lease_until: float) -> int:
+        # Takes over the destination's rows whose run stopped renewing its
+        # lease; a single UPDATE, so each row goes to one claimant only
+        with self.lock:
+            cur = self.db.execute(
+                "UPDATE outbox SET run_id = ?, lease_until = ? WHERE destination = ? AND run_id != ? AND lease_until < ?",
+                (run_id, lease_until, destination, run_id, time.time()),
+            )
+            self.db.commit()
+            return cur.rowcount
+
+    def renew(self, run_id: str, lease_until: float):
+        with self.lock:
+            self.db.execute("UPDATE outbox SET lease_until = ? WHERE run_id = ?", (lease_until, run_id))
+            self.db.commit()
+
+    def release(self, run_id: str):
+        # Lets the next run for the destination claim what is left at once
+        self.renew(run_id, 0.0)
+
+    def queued(self, run_id: str, after_seq: int = 0, limit: int = 100) -> List[tuple]:
+        # [(seq, row)] of the run still waiting for delivery, oldest first
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT seq, row FROM outbox WHERE run_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+                (run_id, after_seq, limit),
+            ).fetchall()
+        return [(seq, json.loads(row)) for seq, row in rows]
+
+    def delivered(self, seqs: List[int]):
+        if not seqs:
+            return
+        with self.lock:
+            self.db.executemany("DELETE FROM outbox WHERE seq = ?", [(s,) for s in seqs])
+            self.db.commit()
+
+    def queue_size(self, run_id: str) -> int:
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM outbox WHERE run_id = ?", (run_id,)).fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.db.close()
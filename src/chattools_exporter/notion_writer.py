@@ -1,40 +1,74 @@
+import asyncio
+import inspect
+import threading
 import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+
 import requests
 
+try:
+    import httpx
+except ImportError:  # requests-only installs use the synchronous client
+    httpx = None
+
+from .ratelimit import notion_bucket
+from .notion_ledger import NotionLedger, LedgerEntry, content_hash, id_order
+
 NOTION_VERSION = "2022-06-28"
+NOTION_API = "https://api.notion.com/v1"
+MAX_BLOCKS_PER_APPEND = 100  # API maximum children per request
+MAX_TEXT_CHARS = 2000  # per rich_text segment
+MAX_RICH_TEXT = 100  # segments per block
+NOTION_WORKERS = 4  # concurrent page writes per sink; the shared bucket sets the pace
+DELIVERY_RETRIES = 6  # per write, on top of NotionClient's own retries; backoff 2s..60s
+OUTBOX_LEASE = 300.0  # seconds a run's queued rows stay its own unless renewed
 
 
 class NotionError(Exception):
     pass
 
 
+def _headers(api_key: str) -> dict:
+    return {
+        "Authorization": f"Bearer {api_key}",
+        "Notion-Version": NOTION_VERSION,
+        "Content-Type": "application/json",
+    }
+
+
+def _response_action(resp, attempt: int, bucket):
+    # ("done", body) or ("retry", delay); raises NotionError when giving up
+    if resp.status_code == 429:
+        # Rate limited: pause every writer sharing the bucket
+        bucket.penalize(max(1.0, float(resp.headers.get("Retry-After", "1"))))
+        return "retry", 0.0
+    if 200 <= resp.status_code < 300:
+        return "done", (resp.json() if resp.content else None)
+    # transient 5xx
+    if 500 <= resp.status_code < 600 and attempt < 4:
+        return "retry", 1.0 + attempt
+    raise NotionError(f"Notion API error {resp.status_code}: {resp.text}")
+
+
 class NotionClient:
     def __init__(self, api_key: str):
         self.api_key = api_key.strip()
         self.session = requests.Session()
-        self.session.headers.update({
-            "Authorization": f"Bearer {self.api_key}",
-            "Notion-Version": NOTION_VERSION,
-            "Content-Type": "application/json",
-        })
+        self.session.headers.update(_headers(self.api_key))
 
     def _request(self, method, url, **kwargs):
+        # Every request takes a token from the integration's process-wide
+        # bucket, so concurrent writers together stay at Notion's average rate
+        bucket = notion_bucket(self.api_key)
         for attempt in range(5):
+            bucket.acquire()
             resp = self.session.request(method, url, **kwargs)
-            if resp.status_code == 429:
-                # Rate limited
-                wait = int(resp.headers.get("Retry-After", "1"))
-                time.sleep(max(1, wait))
-                continue
-            if 200 <= resp.status_code < 300:
-                if resp.content:
-                    return resp.json()
-                return None
-            # transient 5xx
-            if 500 <= resp.status_code < 600 and attempt < 4:
-                time.sleep(1 + attempt)
-                continue
-            raise NotionError(f"Notion API error {resp.status_code}: {resp.text}")
+            action, value = _response_action(resp, attempt, bucket)
+            if action == "done":
+                return value
+            time.sleep(value)
+        raise NotionError(f"Notion API still rate limited after retries: {method} {url}")
 
     def get_database(self, database_id: str):
         return self._request("GET", f"https://api.notion.com/v1/databases/{database_id}")
@@ -48,12 +82,33 @@ class NotionClient:
             payload["filter"] = {"value": filter_object, "property": "object"}
         return self._request("POST", "https://api.notion.com/v1/search", json=payload)
 
-    def append_children(self, page_id: str, children: list[dict]):
-        # Append children blocks to a page (page is also a block)
+    def list_children(self, block_id: str) -> list[dict]:
+        # All child blocks of a page/block, following pagination
+        url = f"https://api.notion.com/v1/blocks/{block_id}/children"
+        out = []
+        cursor = None
+        while True:
+            params = {"page_size": 100}
+            if cursor:
+                params["start_cursor"] = cursor
+            res = self._request("GET", url, params=params) or {}
+            out.extend(res.get("results", []))
+            cursor = res.get("next_cursor") if res.get("has_more") else None
+            if not cursor:
+                return out
+
+    def append_children(self, page_id: str, children: list[dict], after: str | None = None):
+        # Append children blocks to a page (page is also a block), at the end
+        # or right after block `after`
         url = f"https://api.notion.com/v1/blocks/{page_id}/children"
         payload = {"children": children}
+        if after:
+            payload["after"] = after
         return self._request("PATCH", url, json=payload)
 
+    def delete_block(self, block_id: str):
+        return self._request("DELETE", f"https://api.notion.com/v1/blocks/{block_id}")
+
     def find_title_property_name(self, database: dict) -> str:
         props = database.get("properties", {})
         for name, meta in props.items():
@@ -83,18 +138,168 @@ class NotionClient:
         return self._request("POST", "https://api.notion.com/v1/pages", json=payload)
 
 
+class AsyncNotionClient:
+    # NotionClient's API over httpx: one kept-alive connection per client,
+    # HTTP/2 when the h2 package is installed, so concurrent writes to
+    # different pages are multiplexed instead of opening connections.
+    # append_children packs up to the API maximum of blocks per request.
+    def __init__(self, api_key: str):
+        self.api_key = api_key.strip()
+        try:
+            self.http = httpx.AsyncClient(http2=True, headers=_headers(self.api_key), timeout=60)
+        except ImportError:  # no h2: HTTP/1.1 keep-alive
+            self.http = httpx.AsyncClient(headers=_headers(self.api_key), timeout=60)
+
+    async def _request(self, method, url, **kwargs):
+        bucket = notion_bucket(self.api_key)
+        loop = asyncio.get_running_loop()
+        for attempt in range(5):
+            await loop.run_in_executor(None, bucket.acquire)
+            resp = await self.http.request(method, url, **kwargs)
+            action, value = _response_action(resp, attempt, bucket)
+            if action == "done":
+                return value
+            await asyncio.sleep(value)
+        raise NotionError(f"Notion API still rate limited after retries: {method} {url}")
+
+    async def get_database(self, database_id: str):
+        return await self._request("GET", f"{NOTION_API}/databases/{database_id}")
+
+    async def list_children(self, block_id: str) -> list[dict]:
+        out = []
+        cursor = None
+        while True:
+            params = {"page_size": 100}
+            if cursor:
+                params["start_cursor"] = cursor
+            res = await self._request("GET", f"{NOTION_API}/blocks/{block_id}/children", params=params) or {}
+            out.extend(res.get("results", []))
+            cursor = res.get("next_cursor") if res.get("has_more") else None
+            if not cursor:
+                return out
+
+    async def append_children(self, page_id: str, children: list[dict], after: str | None = None):
+        # Packs `children` into as few requests as the API allows; packs go
+        # out in order (each after the previous one) and results are joined
+        results = []
+        for i in range(0, len(children), MAX_BLOCKS_PER_APPEND):
+            payload = {"children": children[i:i + MAX_BLOCKS_PER_APPEND]}
+            if after:
+                payload["after"] = after
+            res = await self._request("PATCH", f"{NOTION_API}/blocks/{page_id}/children", json=payload) or {}
+            got = res.get("results", [])
+            results.extend(got)
+            if after and got:
+                after = got[-1].get("id")
+        return {"results": results}
+
+    async def delete_block(self, block_id: str):
+        return await self._request("DELETE", f"{NOTION_API}/blocks/{block_id}")
+
+    def find_title_property_name(self, database: dict) -> str:
+        return NotionClient.find_title_property_name(self, database)
+
+    async def create_page_in_database(self, database_id: str, title_prop: str, title: str, children: list[dict]):
+        payload = {
+            "parent": {"database_id": database_id},
+            "properties": {title_prop: {"title": [{"type": "text", "text": {"content": title[:MAX_TEXT_CHARS]}}]}},
+            "children": children,
+        }
+        return await self._request("POST", f"{NOTION_API}/pages", json=payload)
+
+    async def create_child_page(self, parent_page_id: str, title: str, children: list[dict]):
+        payload = {
+            "parent": {"page_id": parent_page_id},
+            "properties": {"title": {"title": [{"type": "text", "text": {"content": title[:MAX_TEXT_CHARS]}}]}},
+            "children": children,
+        }
+        return await self._request("POST", f"{NOTION_API}/pages", json=payload)
+
+
+class _NotionLoop:
+    # Event loop thread shared by every bridged Notion client in the process,
+    # with one AsyncNotionClient (one connection) per integration token
+    _instance = None
+    _lock = threading.Lock()
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.clients: dict[str, AsyncNotionClient] = {}
+        threading.Thread(target=self.loop.run_forever, name="notion-http", daemon=True).start()
+
+    @classmethod
+    def get(cls) -> "_NotionLoop":
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def client(self, api_key: str) -> AsyncNotionClient:
+        key = api_key.strip()
+        with self._lock:
+            if key not in self.clients:
+                async def make():
+                    return AsyncNotionClient(key)
+                self.clients[key] = self.run(make())
+            return self.clients[key]
+
+    def close(self):
+        with self._lock:
+            clients, self.clients = list(self.clients.values()), {}
+        for c in clients:
+            self.run(c.http.aclose())
+
+
+def close_notion_clients():
+    # Closes the shared connections (server shutdown); later sinks reopen them
+    if _NotionLoop._instance is not None:
+        _NotionLoop._instance.close()
+
+
+class BridgedNotionClient:
+    # Blocking facade over AsyncNotionClient for the sink's worker threads;
+    # every sink for a token shares the loop and that token's connection
+    def __init__(self, api_key: str):
+        self._loop = _NotionLoop.get()
+        self._client = self._loop.client(api_key)
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not inspect.iscoroutinefunction(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            return self._loop.run(attr(*args, **kwargs))
+        return call
+
+
+def make_writer_client(api_key: str):
+    # Client used by sinks: async HTTP/2 when httpx is available
+    return BridgedNotionClient(api_key) if httpx is not None else NotionClient(api_key)
+
+
+def rich_text(text: str) -> list[dict]:
+    # Notion caps a text segment at 2000 characters: split instead of truncating
+    return [{"type": "text", "text": {"content": text[i:i + MAX_TEXT_CHARS]}} for i in range(0, len(text), MAX_TEXT_CHARS)]
+
+
+def paragraph_blocks(text: str) -> list[dict]:
+    segments = rich_text(text)
+    return [
+        {"object": "block", "type": "paragraph", "paragraph": {"rich_text": segments[i:i + MAX_RICH_TEXT]}}
+        for i in range(0, len(segments), MAX_RICH_TEXT)
+    ]
+
+
 def make_blocks_from_row(row: dict) -> list[dict]:
     blocks = []
     def add_paragraph(text: str):
         if not text:
             return
-        blocks.append({
-            "object": "block",
-            "type": "paragraph",
-            "paragraph": {
-                "rich_text": [{"type": "text", "text": {"content": text[:2000]}}]
-            }
-        })
+        blocks.extend(paragraph_blocks(text))
 
     title_line = f"{row.get('chat_title', '')} • {row.get('id', '')} • {row.get('date', '')}"
     add_paragraph(title_line)
@@ -105,15 +310,8 @@ def make_blocks_from_row(row: dict) -> list[dict]:
         add_paragraph(f"Media: {row.get('media_type')} {row.get('media_file_name') or ''}")
         if row.get("media_path"):
             add_paragraph(f"Media path: {row['media_path']}")
-    text = row.get("text") or ""
-    if text:
-        blocks.append({
-            "object": "block",
-            "type": "paragraph",
-            "paragraph": {
-                "rich_text": [{"type": "text", "text": {"content": text[:2000]}}]
-            }
-        })
+    # Long texts become several 2000-character segments (and paragraphs)
+    add_paragraph(row.get("text") or "")
     return blocks
 
 
@@ -130,58 +328,335 @@ def test_connection(api_key: str, dest_type: str, parent_id: str) -> str:
 
 
 class NotionSink:
-    def __init__(self, api_key: str, dest_type: str, parent_id: str, mode: str = "per_message", on_progress=None):
-        self.client = NotionClient(api_key)
+    # Rows are appended to a durable outbox (write-ahead queue in the ledger
+    # database) and the exporter moves on at once; a deliverer thread drains
+    # the outbox in order, so fetching is never blocked by Notion latency.
+    # Rows leave the outbox only after Notion confirmed them. Each sink is
+    # one run: it delivers only the rows it queued, so concurrent exports to
+    # one destination never take each other's rows. Rows still queued when a
+    # sink finishes (Notion down), or left by a run that died and stopped
+    # renewing its lease, are claimed and delivered first by the next sink
+    # for the same destination.
+    #
+    # Page writes run on a small thread pool paced by the shared Notion
+    # bucket; at most `workers * 4` are in flight. Failed writes are retried
+    # with backoff before the rows are left queued.
+    #
+    # group_by_day streams: rows arrive in date order, so a day is written as
+    # soon as a row of another day shows up and only the current day's blocks
+    # are held in memory. A day page that already exists under the parent
+    # (same title, e.g. from an earlier run) is appended to.
+    #
+    # Every delivered message is recorded in the ledger: unchanged messages
+    # are skipped without an API call and edited ones are rewritten in place.
+    # resume_after() gives exporters a chat's resume cursor, which only
+    # commit_resume() advances, after a complete unfiltered oldest-first run.
+    def __init__(self, api_key: str, dest_type: str, parent_id: str, mode: str = "per_message", on_progress=None,
+                 workers: int = NOTION_WORKERS, platform: str = "chat", ledger: NotionLedger | None = None,
+                 ledger_path: str | None = None):
+        self.client = make_writer_client(api_key)
         self.dest_type = dest_type
         self.parent_id = parent_id
         self.mode = mode  # 'per_message' or 'group_by_day'
         self.on_progress = on_progress
+        self.platform = platform
         self.title_prop = None
-        self.group = {}  # date -> list of blocks
         if self.dest_type.lower().startswith("data"):
             db = self.client.get_database(self.parent_id)
             self.title_prop = self.client.find_title_property_name(db)
+        self.owns_ledger = ledger is None
+        self.ledger = ledger or NotionLedger(ledger_path)
+        self.destination = f"{platform}|{dest_type.lower()}|{parent_id}|{mode}"
+        self.run_id = uuid.uuid4().hex
+        self.lease_until = time.time() + OUTBOX_LEASE
+        self.day = None  # date (YYYY-MM-DD) being collected
+        self.day_chat = None
+        self.day_blocks = []
+        self.day_messages = []  # (seq, chat_id, message id, hash, block count) per collected message
+        self.day_pages = None  # title -> page id, loaded on first day write
+        self.day_locks = {}  # title -> lock, so one day page is never created twice
+        self.pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="notion")
+        self.slots = threading.BoundedSemaphore(max(1, workers) * 4)
+        self.lock = threading.Lock()
+        self.pages_lock = threading.Lock()
+        self.pending = set()
+        self.accepted = {}  # chat id -> highest message id queued by this sink
+        self.gaps = set()  # chats with a row that could not be queued
+        self.errors = 0
+        self.skipped = 0
+        backlog = self.ledger.claim(self.run_id, self.destination, self.lease_until)
+        if backlog and self.on_progress:
+            self.on_progress(f"Notion: delivering {backlog} rows queued by an earlier run")
+        self.wakeup = threading.Event()
+        self.closing = False
+        self.deliverer = threading.Thread(target=self._deliver_loop, name="notion-deliver", daemon=True)
+        self.deliverer.start()
+        # The lease is renewed apart from delivery, which can stall for long
+        # in retries while rows are still this run's to deliver
+        self.closed = threading.Event()
+        self.heartbeat = threading.Thread(target=self._renew_lease, name="notion-lease", daemon=True)
+        self.heartbeat.start()
+
+    # --- exporter side ---
 
     def __call__(self, row, _message, _client):
-        if self.mode == "group_by_day" and self.dest_type.lower().startswith("page"):
-            # Group by date (YYYY-MM-DD) from row['date']
-            date_str = (row.get('date') or '')[:10]
-            blocks = make_blocks_from_row(row)
+        # Slack row ids may be client_msg_id; ts is the stable, ordered key
+        chat_id, msg_id = str(row.get('chat_id')), str(row.get('ts') or row.get('id'))
+        try:
+            self.ledger.enqueue(self.run_id, self.destination, self.lease_until, chat_id, msg_id, row)
+        except Exception:
+            with self.lock:
+                self.gaps.add(chat_id)
+            raise
+        with self.lock:
+            if chat_id not in self.accepted or id_order(msg_id) > id_order(self.accepted[chat_id]):
+                self.accepted[chat_id] = msg_id
+        self.wakeup.set()
+
+    def resume_after(self, chat_id) -> str | None:
+        # Id up to which every message of `chat_id` is written or queued
+        return self.ledger.cursor(self.destination, chat_id)
+
+    def commit_resume(self, chat_id):
+        # Call once a run over `chat_id` finished oldest-first with no
+        # filters: everything up to the highest row it queued is then in
+        # the ledger or the outbox, so the next resume may start there
+        with self.lock:
+            last = self.accepted.get(str(chat_id))
+            if last is None or str(chat_id) in self.gaps:
+                return
+        self.ledger.advance_cursor(self.destination, chat_id, last)
+
+    def finalize(self, chat_title: str | None = None):
+        # Deliver everything queued so far, then stop the deliverer and free
+        # the write threads and the ledger connection, even on errors
+        self.final_title = chat_title
+        self.closing = True
+        self.wakeup.set()
+        try:
+            self.deliverer.join()
+            left = self.ledger.queue_size(self.run_id)
+            if left:
+                self.ledger.release(self.run_id)
+        finally:
+            self.closed.set()
+            self.heartbeat.join()
+            self.pool.shutdown(wait=True)
+            if self.owns_ledger:
+                self.ledger.close()
+        if self.on_progress:
+            if self.skipped:
+                self.on_progress(f"Notion: {self.skipped} unchanged messages skipped")
+            if self.errors:
+                self.on_progress(f"Notion: {self.errors} writes failed")
+            if left:
+                self.on_progress(f"Notion: {left} rows stay queued and will be delivered by the next export to this destination")
+
+    # --- delivery side ---
+
+    def _deliver_loop(self):
+        last_seq = 0
+        while True:
+            closing = self.closing
+            batch = self.ledger.queued(self.run_id, after_seq=last_seq)
+            for seq, row in batch:
+                last_seq = seq
+                try:
+                    self._deliver(seq, row)
+                except Exception as e:
+                    with self.lock:
+                        self.errors += 1
+                    if self.on_progress:
+                        self.on_progress(f"Notion error for message {row.get('id')}: {e}")
+            if batch:
+                continue
+            if closing:
+                break
+            self.wakeup.wait(1.0)
+            self.wakeup.clear()
+        self._flush_day(getattr(self, "final_title", None))
+        self._drain()
+
+    def _renew_lease(self):
+        # Every third of the lease until the sink is finalized
+        while not self.closed.wait(OUTBOX_LEASE / 3):
+            self.lease_until = time.time() + OUTBOX_LEASE
+            try:
+                self.ledger.renew(self.run_id, self.lease_until)
+            except Exception as e:
+                if self.on_progress:
+                    self.on_progress(f"Notion: could not renew the outbox lease: {e}")
+
+    def _deliver(self, seq, row):
+        chat_id = row.get('chat_id')
+        msg_id = row.get('ts') or row.get('id')
+        title = f"{row.get('chat_title', '')} • {row.get('id', '')} • {row.get('date', '')}"
+        blocks = make_blocks_from_row(row)
+        by_day = self.mode == "group_by_day" and self.dest_type.lower().startswith("page")
+        if by_day:
             # add a divider between messages
             blocks.append({"object": "block", "type": "divider", "divider": {}})
-            self.group.setdefault(date_str, []).extend(blocks)
-            if self.on_progress:
-                self.on_progress(f"Queued for {date_str}: message {row.get('id')}")
+        digest = content_hash(title, blocks)
+        entry = self.ledger.get(self.destination, chat_id, msg_id)
+        if entry is not None and entry.content_hash == digest:
+            self.skipped += 1
+            self.ledger.delivered([seq])
+            return
+
+        if by_day:
+            if entry is not None and entry.block_ids:
+                self._submit(f"message {msg_id}", [seq], self._rewrite_blocks, chat_id, msg_id, entry, blocks, digest)
+                return
+            # Group by date (YYYY-MM-DD) from row['date']
+            date_str = (row.get('date') or '')[:10]
+            if self.day is not None and date_str != self.day:
+                self._flush_day()
+            self.day = date_str
+            self.day_chat = self.day_chat or row.get('chat_title')
+            self.day_blocks.extend(blocks)
+            self.day_messages.append((seq, chat_id, msg_id, digest, len(blocks)))
             return
 
         # Default behavior: create page per message
-        title = f"{row.get('chat_title', '')} • {row.get('id', '')} • {row.get('date', '')}"
-        children = make_blocks_from_row(row)
-        if self.dest_type.lower().startswith("data"):
-            self.client.create_page_in_database(self.parent_id, self.title_prop, title, children)
+        self._submit(f"message {msg_id}", [seq], self._write_message, chat_id, msg_id, title, blocks, digest, entry)
+
+    def _submit(self, what: str, seqs, fn, *args):
+        # Runs fn on the pool with retries; its outbox rows are released on success
+        def job():
+            for attempt in range(DELIVERY_RETRIES):
+                try:
+                    fn(*args)
+                    break
+                except Exception as e:
+                    if attempt == DELIVERY_RETRIES - 1:
+                        raise
+                    delay = min(60.0, 2.0 * (2 ** attempt))
+                    if self.on_progress:
+                        self.on_progress(f"Notion: {what} failed ({e}); retrying in {delay:.0f}s")
+                    time.sleep(delay)
+            self.ledger.delivered(seqs)
+
+        self.slots.acquire()
+        fut = self.pool.submit(job)
+        with self.lock:
+            self.pending.add(fut)
+
+        def done(f):
+            self.slots.release()
+            with self.lock:
+                self.pending.discard(f)
+            if f.exception() is not None:
+                with self.lock:
+                    self.errors += 1
+                if self.on_progress:
+                    self.on_progress(f"Notion error for {what}: {f.exception()}")
+        fut.add_done_callback(done)
+
+    def _drain(self):
+        # Wait until every submitted write has finished
+        while True:
+            with self.lock:
+                pending = list(self.pending)
+            if not pending:
+                return
+            wait(pending)
+
+    def _write_message(self, chat_id, msg_id, title, children, digest, entry):
+        if entry is not None and not entry.block_ids:
+            # Edited since the last run: replace the page's content in place
+            for b in self.client.list_children(entry.page_id):
+                self.client.delete_block(b["id"])
+            self.client.append_children(entry.page_id, children)
+            page_id, verb = entry.page_id, "updated"
+        elif self.dest_type.lower().startswith("data"):
+            page_id = self.client.create_page_in_database(self.parent_id, self.title_prop, title, children).get("id")
+            verb = "wrote"
         else:
-            self.client.create_child_page(self.parent_id, title, children)
+            page_id = self.client.create_child_page(self.parent_id, title, children).get("id")
+            verb = "wrote"
+        self.ledger.put(self.destination, chat_id, msg_id, LedgerEntry(page_id, [], digest))
         if self.on_progress:
-            self.on_progress(f"Notion: wrote message {row.get('id')}")
+            self.on_progress(f"Notion: {verb} message {msg_id}")
 
-    def finalize(self, chat_title: str | None = None):
-        if self.mode != "group_by_day" or not self.group:
+    def _rewrite_blocks(self, chat_id, msg_id, entry, blocks, digest):
+        # Edited message on a day page: insert the new blocks after the old
+        # ones, then delete the old ones, keeping its place in the day
+        res = self.client.append_children(entry.page_id, blocks, after=entry.block_ids[-1]) or {}
+        for block_id in entry.block_ids:
+            self.client.delete_block(block_id)
+        new_ids = [b.get("id") for b in res.get("results", [])]
+        if len(new_ids) != len(blocks):
+            new_ids = []  # cannot map ids reliably; a later edit appends anew
+        self.ledger.put(self.destination, chat_id, msg_id, LedgerEntry(entry.page_id, new_ids, digest))
+        if self.on_progress:
+            self.on_progress(f"Notion: updated message {msg_id}")
+
+    def _flush_day(self, chat_title: str | None = None):
+        if self.day is None:
             return
-        # Create one page per day under the parent page, chunking children blocks
-        for date_str, blocks in self.group.items():
-            title = f"{chat_title or ''} • {date_str}"
-            # Create an empty page first
-            pg = self.client.create_child_page(self.parent_id, title, children=[])
-            page_id = pg.get("id")
-            # Chunk blocks (Notion limit ~100 per call)
-            max_chunk = 80
-            for i in range(0, len(blocks), max_chunk):
-                chunk = blocks[i:i+max_chunk]
-                self.client.append_children(page_id, chunk)
-            if self.on_progress:
-                self.on_progress(f"Notion: wrote day page {date_str} with {len(blocks)} blocks")
-
-
-def notion_sink(api_key: str, dest_type: str, parent_id: str, mode: str = "per_message", on_progress=None):
-    return NotionSink(api_key, dest_type, parent_id, mode=mode, on_progress=on_progress)
+        date_str, blocks, messages = self.day, self.day_blocks, self.day_messages
+        title = f"{self.day_chat or chat_title or ''} • {date_str}"
+        self.day, self.day_chat, self.day_blocks, self.day_messages = None, None, [], []
+        progress = {"offset": 0, "start": 0, "recorded": 0, "block_ids": []}
+        self._submit(f"day {date_str}", [], self._write_day, date_str, title, blocks, messages, progress)
+
+    def _day_page(self, title: str) -> tuple[str, bool]:
+        # (page id, created) for a day page, reusing one that already exists
+        with self.pages_lock:
+            if self.day_pages is None:
+                self.day_pages = {}
+                for b in self.client.list_children(self.parent_id):
+                    if b.get("type") == "child_page":
+                        self.day_pages.setdefault(b["child_page"].get("title"), b["id"])
+            page_id = self.day_pages.get(title)
+        if page_id:
+            return page_id, False
+        pg = self.client.create_child_page(self.parent_id, title, children=[])
+        with self.pages_lock:
+            self.day_pages[title] = pg.get("id")
+        return pg.get("id"), True
+
+    def _write_day(self, date_str, title, blocks, messages, progress):
+        # `progress` survives retries: chunks already appended are not sent
+        # again, and messages whose blocks are all written are recorded and
+        # released from the outbox as they complete
+        with self.lock:
+            day_lock = self.day_locks.setdefault(title, threading.Lock())
+        with day_lock:
+            if "page_id" not in progress:
+                progress["page_id"], progress["created"] = self._day_page(title)
+            page_id = progress["page_id"]
+            # One request per API-maximum chunk
+            while progress["offset"] < len(blocks):
+                chunk = blocks[progress["offset"]:progress["offset"] + MAX_BLOCKS_PER_APPEND]
+                res = self.client.append_children(page_id, chunk) or {}
+                ids = [b.get("id") for b in res.get("results", [])]
+                progress["block_ids"].extend(ids if len(ids) == len(chunk) else [None] * len(chunk))
+                progress["offset"] += len(chunk)
+                self._record_day_messages(page_id, messages, progress)
+        if self.on_progress:
+            verb = "wrote" if progress["created"] else "appended to"
+            self.on_progress(f"Notion: {verb} day page {date_str} with {len(blocks)} blocks")
+
+    def _record_day_messages(self, page_id, messages, progress):
+        # Ledger entries (with block ids) for messages now fully written
+        done = []
+        while progress["recorded"] < len(messages):
+            seq, chat_id, msg_id, digest, n = messages[progress["recorded"]]
+            start = progress["start"]
+            if start + n > progress["offset"]:
+                break
+            ids = progress["block_ids"][start:start + n]
+            if None in ids:
+                ids = []  # cannot map ids reliably; a later edit appends anew
+            self.ledger.put(self.destination, chat_id, msg_id, LedgerEntry(page_id, ids, digest))
+            done.append(seq)
+            progress["start"] = start + n
+            progress["recorded"] += 1
+        self.ledger.delivered(done)
+
 
+def notion_sink(api_key: str, dest_type: str, parent_id: str, mode: str = "per_message", on_progress=None,
+                platform: str = "chat", ledger_path: str | None = None):
+    return NotionSink(api_key, dest_type, parent_id, mode=mode, on_progress=on_progress,
+                      platform=platform, ledger_path=ledger_path)
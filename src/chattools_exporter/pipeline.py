@@ -0,0 +1,291 @@
+import csv
+import json
+import queue
+import threading
+from typing import Callable, Iterable, List, Optional
+
+from .query import row_datetime
+
+# Shared source -> filter/transform -> sink core used by all exporters.
+#
+#   source thread --(pages, bounded)--> caller thread: to_row, filters, stages
+#                 --(rows, bounded)--> sink thread
+#
+# Bounded queues give backpressure: a slow sink stalls filtering, which stalls
+# fetching once `prefetch` pages are buffered. Sources that must stay on the
+# calling thread (Telethon's sync client is bound to its event loop) run with
+# threaded_source=False; filtering and writing still overlap with fetching.
+
+ROW_FIELDS = [
+    "id", "date", "chat_id", "chat_title", "sender_id", "sender_username",
+    "sender_display", "text", "reply_to_id", "views", "forwards", "edit_date",
+    "via_bot_id", "is_pinned", "media", "media_type", "media_file_name", "media_path",
+]
+
+_END = ("end", None)
+
+
+def chunked(items: Iterable, size: int = 100):
+    page = []
+    for item in items:
+        page.append(item)
+        if len(page) >= size:
+            yield page
+            page = []
+    if page:
+        yield page
+
+
+def _put(q: queue.Queue, item, stop: threading.Event) -> bool:
+    # Blocking put that gives up once the pipeline is stopping
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.2)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def prefetch(pages: Iterable, depth: int = 2, stop: Optional[threading.Event] = None):
+    # Iterate `pages` on a background thread so the next page is already in
+    # flight while the current one is processed
+    stop = stop or threading.Event()
+    q: queue.Queue = queue.Queue(maxsize=max(1, depth))
+
+    def worker():
+        try:
+            for page in pages:
+                if not _put(q, ("page", page), stop):
+                    return
+            _put(q, _END, stop)
+        except BaseException as e:
+            _put(q, ("error", e), stop)
+
+    threading.Thread(target=worker, daemon=True).start()
+    try:
+        while True:
+            kind, val = q.get()
+            if kind == "end":
+                return
+            if kind == "error":
+                raise val
+            yield val
+    finally:
+        stop.set()
+
+
+def make_row_filter(
+    lo=None,
+    hi=None,
+    only_media: bool = False,
+    only_text: bool = False,
+    users: Optional[List[str]] = None,
+    keywords: Optional[List[str]] = None,
+    query=None,
+) -> Optional[Callable[[dict], bool]]:
+    # Single predicate over exported rows; lo/hi are naive UTC [lo, hi) bounds
+    user_set = {str(u).strip().lstrip("@").lower() for u in (users or []) if str(u).strip()}
+    kw = [k.strip().lower() for k in (keywords or []) if k and k.strip()]
+    if not (lo or hi or only_media or only_text or user_set or kw or query):
+        return None
+
+    def pred(row: dict) -> bool:
+        if lo or hi:
+            d = row_datetime(row)
+            if d is not None and ((lo and d < lo) or (hi and d >= hi)):
+                return False
+        if only_media and not row.get("media"):
+            return False
+        if only_text and row.get("media"):
+            return False
+        if user_set:
+            uid = str(row.get("sender_id") or "").lower()
+            uname = (row.get("sender_username") or "").lower()
+            if uid not in user_set and uname not in user_set:
+                return False
+        if kw:
+            text = (row.get("text") or "").lower()
+            if not any(k in text for k in kw):
+                return False
+        if query is not None and not query.matches(row):
+            return False
+        return True
+    return pred
+
+
+class FileSink:
+    def __init__(self, path: str, fmt: str, fields: Optional[List[str]] = None, flush_every: int = 500):
+        self.fmt = fmt
+        self.flush_every = flush_every
+        self.count = 0
+        self.csv_writer = None
+        if fmt == "jsonl":
+            self.f = open(path, "a", encoding="utf-8")
+        else:
+            self.f = open(path, "a", newline="", encoding="utf-8")
+            self.csv_writer = csv.DictWriter(self.f, fieldnames=fields or ROW_FIELDS, extrasaction="ignore")
+            if self.f.tell() == 0:
+                self.csv_writer.writeheader()
+
+    def __call__(self, row: dict, _raw=None):
+        if self.csv_writer is not None:
+            self.csv_writer.writerow(row)
+        else:
+            self.f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self.count += 1
+        if self.count % self.flush_every == 0:
+            self.f.flush()
+
+    def close(self):
+        if not self.f.closed:
+            self.f.flush()
+            self.f.close()
+
+
+class SortedSink:
+    # Collects rows and forwards them sorted by `key` on close (oldest -> newest
+    # unless descending)
+    def __init__(self, sink, key: Callable[[dict], object], descending: bool = False):
+        self.sink = sink
+        self.key = key
+        self.descending = descending
+        self.items = []
+
+    def __call__(self, row: dict, raw=None):
+        self.items.append((row, raw))
+
+    def close(self):
+        try:
+            self.items.sort(key=lambda it: self.key(it[0]), reverse=self.descending)
+        except Exception:
+            self.items.sort(key=lambda it: str(self.key(it[0])), reverse=self.descending)
+        for row, raw in self.items:
+            self.sink(row, raw)
+        self.items = []
+        if hasattr(self.sink, "close"):
+            self.sink.close()
+
+
+class SharedSink:
+    # One sink fed by several concurrent pipelines (e.g. a combined multi-chat
+    # file); closing it is left to whoever created it
+    def __init__(self, sink):
+        self.sink = sink
+        self.lock = threading.Lock()
+
+    def __call__(self, row: dict, raw=None):
+        with self.lock:
+            self.sink(row, raw)
+
+    def close(self):
+        pass
+
+
+def guarded_sink(sink, on_progress=None):
+    # External sinks (e.g. Notion) must not abort the export on a single failure
+    def call(row: dict, raw=None):
+        try:
+            sink(row, raw)
+        except Exception as e:
+            if on_progress:
+                on_progress(f"Sink error for message {row.get('id')}: {e}")
+    return call
+
+
+class Pipeline:
+    def __init__(
+        self,
+        to_row: Callable,
+        sink: Callable,
+        filters: Optional[List[Callable[[dict], bool]]] = None,
+        stages: Optional[List[Callable]] = None,
+        limit: Optional[int] = None,
+        queue_size: int = 1000,
+        on_progress=None,
+        progress_every: int = 500,
+        enough: Optional[Callable[[int], bool]] = None,
+    ):
+        # `enough(accepted)` lets a caller end the run early (e.g. a shard
+        # whose rows the merge would cut off anyway)
+        self.to_row = to_row
+        self.sink = sink
+        self.filters = [f for f in (filters or []) if f is not None]
+        self.stages = list(stages or [])
+        self.limit = limit
+        self.enough = enough
+        self.queue_size = queue_size
+        self.on_progress = on_progress
+        self.progress_every = progress_every
+        self.stop = threading.Event()
+        self.written = 0
+
+    def _sink_worker(self, q: queue.Queue, errors: list):
+        try:
+            while True:
+                item = q.get()
+                if item is _END:
+                    break
+                self.sink(*item)
+                self.written += 1
+                if self.on_progress and self.written % self.progress_every == 0:
+                    self.on_progress(f"Exported {self.written} messages...")
+        except BaseException as e:
+            errors.append(e)
+            self.stop.set()
+        finally:
+            try:
+                if hasattr(self.sink, "close"):
+                    self.sink.close()
+            except BaseException as e:
+                errors.append(e)
+
+    def process(self, raw) -> Optional[dict]:
+        # Runs to_row, filters and stages for one raw message; None means dropped
+        row = self.to_row(raw)
+        if row is None:
+            return None
+        for f in self.filters:
+            if not f(row):
+                return None
+        for stage in self.stages:
+            row = stage(row, raw)
+            if row is None:
+                return None
+        return row
+
+    def _done(self, accepted: int) -> bool:
+        return bool((self.limit and accepted >= self.limit) or (self.enough and self.enough(accepted)))
+
+    def run(self, pages: Iterable, prefetch_pages: int = 2, threaded_source: bool = True) -> int:
+        q: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        errors: list = []
+        sink_thread = threading.Thread(target=self._sink_worker, args=(q, errors), daemon=True)
+        sink_thread.start()
+
+        source = prefetch(pages, prefetch_pages) if threaded_source else pages
+        accepted = 0
+        try:
+            for page in source:
+                if self.enough and self.enough(accepted):
+                    break
+                for raw in page:
+                    row = self.process(raw)
+                    if row is None:
+                        continue
+                    if not _put(q, (row, raw), self.stop):
+                        break
+                    accepted += 1
+                    if self._done(accepted):
+                        break
+                if self.stop.is_set() or self._done(accepted):
+                    break
+        finally:
+            if hasattr(source, "close"):
+                source.close()
+            if not self.stop.is_set():
+                _put(q, _END, self.stop)
+            sink_thread.join()
+        if errors:
+            raise errors[0]
+        return self.written
@@ -0,0 +1,312 @@
+import re
+import datetime as dt
+from typing import Optional, List, Callable, Any
+
+# Small query language for export filters, e.g.
+#   (outage OR incident) AND NOT test
+#   /err(or)?\s+\d+/i has:media from:alice before:2024-01-01
+#
+# Terms and "quoted phrases" are case-insensitive substring matches on the
+# message text, adjacent expressions are AND-ed, `-x` is shorthand for NOT x.
+# Fields: from:<id|username|display name>, has:<media|text|link|reply|pinned|photo|document>,
+# after:/since:<YYYY-MM-DD> (on/after), before:/until:<YYYY-MM-DD> (strictly before),
+# on:<YYYY-MM-DD>.
+
+FIELDS = ("from", "has", "before", "until", "after", "since", "on")
+HAS_VALUES = ("media", "file", "text", "link", "reply", "pinned", "photo", "document")
+
+_TOKEN_RE = re.compile(
+    r"""\s*(?:
+        (?P<lparen>\()
+      | (?P<rparen>\))
+      | (?P<regex>/(?:\\.|[^/\\])+/[ims]*)
+      | (?P<field>[A-Za-z]+):(?:"(?P<fquoted>(?:\\.|[^"\\])*)"|(?P<fvalue>[^\s()]+))
+      | "(?P<phrase>(?:\\.|[^"\\])*)"
+      | (?P<word>[^\s()"]+)
+    )""",
+    re.VERBOSE,
+)
+
+
+class QueryError(ValueError):
+    pass
+
+
+def _tokenize(text: str) -> List[tuple]:
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        m = _TOKEN_RE.match(text, pos)
+        if not m or m.end() == pos:
+            raise QueryError(f"Cannot parse query near: {text[pos:pos + 20]!r}")
+        pos = m.end()
+        kind = m.lastgroup
+        if kind in ("fquoted", "fvalue"):
+            field = m.group("field").lower()
+            value = m.group("fquoted") if m.group("fquoted") is not None else m.group("fvalue")
+            if field not in FIELDS:
+                # Unknown prefix: treat the whole token as a plain term (e.g. "http://")
+                tokens.append(("term", m.group(0).strip()))
+            else:
+                tokens.append(("field", (field, value.replace('\\"', '"'))))
+        elif kind == "phrase":
+            tokens.append(("term", m.group("phrase").replace('\\"', '"')))
+        elif kind == "regex":
+            tokens.append(("regex", m.group("regex")))
+        elif kind == "word":
+            w = m.group("word")
+            if w in ("AND", "OR", "NOT", "&&", "||"):
+                tokens.append(("op", {"&&": "AND", "||": "OR"}.get(w, w)))
+            elif w == "-":
+                tokens.append(("op", "NOT"))
+            elif w.startswith("-") and len(w) > 1:
+                tokens.append(("op", "NOT"))
+                tokens.extend(_tokenize(w[1:]))
+            else:
+                tokens.append(("term", w))
+        else:
+            tokens.append((kind, m.group(kind)))
+    return tokens
+
+
+class _Parser:
+    # Recursive descent: or_expr := and_expr (OR and_expr)*
+    #                    and_expr := not_expr ([AND] not_expr)*
+    #                    not_expr := NOT not_expr | atom
+    def __init__(self, tokens: List[tuple]):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def take(self):
+        tok = self.peek()
+        self.pos += 1
+        return tok
+
+    def parse(self):
+        if not self.tokens:
+            raise QueryError("Empty query")
+        node = self.or_expr()
+        if self.pos != len(self.tokens):
+            raise QueryError(f"Unexpected token: {self.peek()[1]!r}")
+        return node
+
+    def or_expr(self):
+        items = [self.and_expr()]
+        while self.peek() == ("op", "OR"):
+            self.take()
+            items.append(self.and_expr())
+        return items[0] if len(items) == 1 else ("or", items)
+
+    def and_expr(self):
+        items = [self.not_expr()]
+        while True:
+            kind, val = self.peek()
+            if kind is None or kind == "rparen" or (kind, val) == ("op", "OR"):
+                break
+            if (kind, val) == ("op", "AND"):
+                self.take()
+            items.append(self.not_expr())
+        return items[0] if len(items) == 1 else ("and", items)
+
+    def not_expr(self):
+        if self.peek() == ("op", "NOT"):
+            self.take()
+            return ("not", self.not_expr())
+        return self.atom()
+
+    def atom(self):
+        kind, val = self.take()
+        if kind == "lparen":
+            node = self.or_expr()
+            if self.take()[0] != "rparen":
+                raise QueryError("Missing closing parenthesis")
+            return node
+        if kind == "term":
+            return ("term", val.lower())
+        if kind == "regex":
+            body, _, flags = val[1:].rpartition("/")
+            fl = 0
+            for ch in flags:
+                fl |= {"i": re.IGNORECASE, "m": re.MULTILINE, "s": re.DOTALL}[ch]
+            try:
+                return ("regex", re.compile(body, fl))
+            except re.error as e:
+                raise QueryError(f"Invalid regex {val}: {e}")
+        if kind == "field":
+            return _field_node(*val)
+        if kind is None:
+            raise QueryError("Unexpected end of query")
+        raise QueryError(f"Unexpected token: {val!r}")
+
+
+def _parse_day(value: str) -> dt.datetime:
+    try:
+        return dt.datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise QueryError(f"Dates must be YYYY-MM-DD, got {value!r}")
+
+
+def _field_node(field: str, value: str):
+    if field == "from":
+        return ("from", value.lstrip("@").lower())
+    if field == "has":
+        v = value.lower()
+        if v not in HAS_VALUES:
+            raise QueryError(f"Unknown has: value {value!r} (expected one of {', '.join(HAS_VALUES)})")
+        return ("has", v)
+    day = _parse_day(value)
+    if field in ("before", "until"):
+        return ("date", None, day)
+    if field in ("after", "since"):
+        return ("date", day, None)
+    return ("date", day, day + dt.timedelta(days=1))
+
+
+def row_datetime(row: dict) -> Optional[dt.datetime]:
+    d = row.get("date")
+    if not d:
+        return None
+    try:
+        v = dt.datetime.fromisoformat(str(d).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if v.tzinfo is not None:
+        v = v.astimezone(dt.timezone.utc).replace(tzinfo=None)
+    return v
+
+
+def _has(row: dict, what: str) -> bool:
+    if what in ("media", "file"):
+        return bool(row.get("media"))
+    if what == "text":
+        return bool((row.get("text") or "").strip())
+    if what == "link":
+        return "http://" in (row.get("text") or "") or "https://" in (row.get("text") or "")
+    if what == "reply":
+        return row.get("reply_to_id") is not None
+    if what == "pinned":
+        return bool(row.get("is_pinned"))
+    return what in (row.get("media_type") or "").lower()
+
+
+def _compile(node) -> Callable[[dict, dict], bool]:
+    # Compiled predicates take (row, cache); cache holds per-row derived values
+    kind = node[0]
+    if kind == "and":
+        parts = [_compile(n) for n in node[1]]
+        return lambda row, c: all(p(row, c) for p in parts)
+    if kind == "or":
+        parts = [_compile(n) for n in node[1]]
+        return lambda row, c: any(p(row, c) for p in parts)
+    if kind == "not":
+        inner = _compile(node[1])
+        return lambda row, c: not inner(row, c)
+    if kind == "term":
+        term = node[1]
+        return lambda row, c: term in _lower_text(row, c)
+    if kind == "regex":
+        rx = node[1]
+        return lambda row, c: rx.search(row.get("text") or "") is not None
+    if kind == "from":
+        who = node[1]
+        return lambda row, c: who in _senders(row, c)
+    if kind == "has":
+        what = node[1]
+        return lambda row, c: _has(row, what)
+    if kind == "date":
+        lo, hi = node[1], node[2]
+
+        def match_date(row, c):
+            if "date" not in c:
+                c["date"] = row_datetime(row)
+            d = c["date"]
+            if d is None:
+                return False
+            return (lo is None or d >= lo) and (hi is None or d < hi)
+        return match_date
+    raise QueryError(f"Unknown node {kind}")
+
+
+def _lower_text(row: dict, c: dict) -> str:
+    if "text" not in c:
+        c["text"] = (row.get("text") or "").lower()
+    return c["text"]
+
+
+def _senders(row: dict, c: dict) -> set:
+    if "senders" not in c:
+        c["senders"] = {
+            str(v).lower()
+            for v in (row.get("sender_id"), row.get("sender_username"), row.get("sender_display"))
+            if v not in (None, "")
+        }
+    return c["senders"]
+
+
+def _conjuncts(node) -> list:
+    return node[1] if node[0] == "and" else [node]
+
+
+class Query:
+    def __init__(self, text: str):
+        self.text = text
+        self.node = _Parser(_tokenize(text)).parse()
+        self._pred = _compile(self.node)
+
+    def __repr__(self):
+        return f"Query({self.text!r})"
+
+    def matches(self, row: dict) -> bool:
+        return self._pred(row, {})
+
+    # --- Pushdown helpers: only top-level AND-ed components are safe to push ---
+
+    def date_bounds(self):
+        # (lower inclusive, upper exclusive) naive UTC datetimes, or None
+        lo = hi = None
+        for n in _conjuncts(self.node):
+            if n[0] != "date":
+                continue
+            if n[1] is not None and (lo is None or n[1] > lo):
+                lo = n[1]
+            if n[2] is not None and (hi is None or n[2] < hi):
+                hi = n[2]
+        return lo, hi
+
+    def search_term(self) -> Optional[str]:
+        # Longest required plain word, suitable for platform full-text search
+        words = [
+            n[1] for n in _conjuncts(self.node)
+            if n[0] == "term" and re.fullmatch(r"\w+", n[1])
+        ]
+        return max(words, key=len) if words else None
+
+    def senders(self) -> List[str]:
+        return [n[1] for n in _conjuncts(self.node) if n[0] == "from"]
+
+
+def parse_query(text: Any) -> Optional[Query]:
+    if text is None or isinstance(text, Query):
+        return text
+    text = str(text).strip()
+    if not text:
+        return None
+    return Query(text)
+
+
+def merge_bounds(min_dt: Optional[dt.datetime], max_dt: Optional[dt.datetime], query: Optional[Query]):
+    # Combine --min-date/--max-date (inclusive days) with query dates into
+    # (lower inclusive, upper exclusive) naive UTC bounds
+    lo = min_dt
+    hi = max_dt + dt.timedelta(days=1) if max_dt else None
+    if query is not None:
+        qlo, qhi = query.date_bounds()
+        if qlo is not None and (lo is None or qlo > lo):
+            lo = qlo
+        if qhi is not None and (hi is None or qhi < hi):
+            hi = qhi
+    return lo, hi
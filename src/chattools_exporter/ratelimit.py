@@ -0,0 +1,260 @@
+import random
+import threading
+import time
+from typing import Dict, Hashable, Optional
+
+import requests
+
+# Process-wide rate limiting shared by concurrent exports (shards, channels,
+# server jobs). Buckets are keyed per platform/token/method so that separate
+# exports against the same API budget throttle together.
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = float(rate)  # tokens per second
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        # Blocks until `tokens` are available; returns the time spent waiting
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.blocked_until and self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return waited
+                if now < self.blocked_until:
+                    delay = self.blocked_until - now
+                else:
+                    delay = (tokens - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def penalize(self, seconds: float):
+        # Server told us to back off (Retry-After): pause every user of this bucket
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + max(0.0, seconds))
+            self.tokens = 0.0
+
+
+class AdaptivePacer:
+    # Paces one connection's requests from server feedback (AIMD): every
+    # FloodWait doubles the delay between requests, and each run of
+    # `ease_after` clean requests eases it back down. Tracks total throttled
+    # time (pacing delays plus server-imposed waits) for progress reporting.
+    def __init__(self, start_wait: float = 0.0, min_wait: float = 0.0, max_wait: float = 10.0, ease_after: int = 20):
+        self.wait = float(start_wait)
+        self.min_wait = float(min_wait)
+        self.max_wait = float(max_wait)
+        self.ease_after = ease_after
+        self.clean = 0
+        self.floods = 0
+        self.throttled = 0.0
+        self.last = 0.0
+        self.lock = threading.Lock()
+
+    def before_request(self):
+        # Reserve the next request slot first so concurrent callers sharing
+        # this pacer are spaced out rather than released together
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.last + self.wait)
+            self.last = slot
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+            with self.lock:
+                self.throttled += delay
+
+    def on_success(self):
+        with self.lock:
+            self.clean += 1
+            if self.clean >= self.ease_after:
+                self.clean = 0
+                self.wait = max(self.min_wait, self.wait * 0.75)
+
+    def on_flood(self):
+        with self.lock:
+            self.floods += 1
+            self.clean = 0
+            self.wait = min(self.max_wait, max(self.wait * 2, 0.5))
+
+    def backoff(self, attempt: int, seconds: Optional[float] = None) -> float:
+        # Delay before retry `attempt` (0-based): the server's wait plus a
+        # little jitter so parallel workers do not retry in lockstep, or
+        # exponential backoff with full jitter for transient errors
+        if seconds is not None:
+            return seconds + random.uniform(0, min(5.0, 1.0 + seconds * 0.1))
+        return random.uniform(0, min(60.0, 2.0 ** attempt))
+
+    def note_backoff(self, seconds: float):
+        with self.lock:
+            self.throttled += seconds
+
+
+_buckets: Dict[Hashable, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def get_bucket(key: Hashable, rate: float, capacity: Optional[float] = None) -> TokenBucket:
+    with _buckets_lock:
+        b = _buckets.get(key)
+        if b is None:
+            b = TokenBucket(rate, capacity)
+            _buckets[key] = b
+        return b
+
+
+# --- Slack: per-method tiers (requests per minute) ---
+
+SLACK_TIERS = {1: 1, 2: 20, 3: 50, 4: 100}
+SLACK_METHOD_TIERS = {
+    "conversations.history": 3,
+    "conversations.replies": 3,
+    "conversations.info": 3,
+    "conversations.list": 2,
+    "users.list": 2,
+    "users.info": 4,
+    "files.list": 3,
+    "search.messages": 2,
+    "pins.list": 2,
+}
+
+
+def slack_bucket(token: str, method: str) -> TokenBucket:
+    per_min = SLACK_TIERS[SLACK_METHOD_TIERS.get(method, 3)]
+    rate = per_min / 60.0
+    # Slack tolerates short bursts above the sustained tier rate
+    return get_bucket(("slack", token, method), rate, capacity=max(1.0, per_min / 2.0))
+
+
+def slack_call(client, method: str, retries: int = 6, **kwargs):
+    # Calls `client.<method>` (dotted Slack name) under the shared tier limiter,
+    # honouring Retry-After on 429/ratelimited responses
+    from slack_sdk.errors import SlackApiError
+
+    bucket = slack_bucket(getattr(client, "token", None) or "", method)
+    fn = getattr(client, method.replace(".", "_"))
+    for attempt in range(retries):
+        bucket.acquire()
+        try:
+            return fn(**kwargs)
+        except SlackApiError as e:
+            resp = e.response
+            status = getattr(resp, "status_code", None)
+            error = resp.get("error") if resp is not None else None
+            if (status == 429 or error == "ratelimited") and attempt < retries - 1:
+                headers = getattr(resp, "headers", None) or {}
+                bucket.penalize(float(headers.get("Retry-After", headers.get("retry-after", 1)) or 1))
+                continue
+            raise
+
+
+# --- Discord: global per-token limit, per-route buckets and 429 handling ---
+
+DISCORD_GLOBAL_RATE = 50.0  # requests per second per bot token
+
+
+def discord_bucket(token_header: str) -> TokenBucket:
+    return get_bucket(("discord", token_header), DISCORD_GLOBAL_RATE, capacity=DISCORD_GLOBAL_RATE)
+
+
+class DiscordRouteBuckets:
+    # Discord's per-route limits, learned from X-RateLimit-* response headers.
+    # Routes map to a bucket id (several routes can share one); callers wait
+    # for the bucket's reset instead of running into 429s. `remaining` is
+    # decremented on acquire so concurrent callers do not overshoot.
+    def __init__(self):
+        self.routes: Dict[str, str] = {}
+        self.buckets: Dict[str, list] = {}  # bucket id -> [remaining, reset_at]
+        self.lock = threading.Lock()
+
+    def acquire(self, route: str) -> float:
+        waited = 0.0
+        while True:
+            with self.lock:
+                state = self.buckets.get(self.routes.get(route, route))
+                now = time.monotonic()
+                if state is None:
+                    return waited
+                if state[0] > 0:
+                    state[0] -= 1
+                    return waited
+                if now >= state[1]:
+                    # Window reset: one request probes it, the rest wait for
+                    # its headers (or this short hold) before going
+                    state[1] = now + 1.0
+                    return waited
+                delay = state[1] - now
+            time.sleep(delay)
+            waited += delay
+
+    def update(self, route: str, headers):
+        bucket = headers.get("X-RateLimit-Bucket")
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset_after = headers.get("X-RateLimit-Reset-After")
+        if remaining is None or reset_after is None:
+            return
+        with self.lock:
+            key = bucket or route
+            self.routes[route] = key
+            self.buckets[key] = [int(remaining), time.monotonic() + float(reset_after)]
+
+
+_route_buckets: Dict[str, DiscordRouteBuckets] = {}
+
+
+def discord_route_buckets(token_header: str) -> DiscordRouteBuckets:
+    with _buckets_lock:
+        b = _route_buckets.get(token_header)
+        if b is None:
+            b = _route_buckets[token_header] = DiscordRouteBuckets()
+        return b
+
+
+def discord_route(url: str) -> str:
+    # Rate limit route key: the path (major ids included), without the query
+    return "GET " + url.split("?", 1)[0].split("/api/v10", 1)[-1]
+
+
+def discord_get(url: str, headers: Dict[str, str], params: Optional[dict] = None, timeout: int = 30, retries: int = 8):
+    token = headers.get("Authorization", "")
+    bucket = discord_bucket(token)
+    routes = discord_route_buckets(token)
+    route = discord_route(url)
+    for attempt in range(retries):
+        routes.acquire(route)
+        bucket.acquire()
+        r = requests.get(url, headers=headers, params=params, timeout=timeout)
+        routes.update(route, r.headers)
+        if r.status_code != 429 or attempt == retries - 1:
+            return r
+        try:
+            retry = float((r.json() or {}).get("retry_after") or r.headers.get("Retry-After", "1"))
+        except Exception:
+            retry = float(r.headers.get("Retry-After", "1") or 1)
+        if r.headers.get("X-RateLimit-Global"):
+            bucket.penalize(retry)
+        else:
+            time.sleep(retry)
+    return r
+
+
+# --- Notion: average of 3 requests per second per integration ---
+
+NOTION_RATE = 3.0  # requests per second
+
+
+def notion_bucket(api_key: str) -> TokenBucket:
+    # Shared by every sink and client using the same integration token
+    return get_bucket(("notion", api_key), NOTION_RATE, capacity=NOTION_RATE)
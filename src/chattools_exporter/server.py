@@ -3,22 +3,30 @@ import json
 import threading
 import time
 import uuid
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import nullcontext
 from typing import Optional, Dict, Any
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 import sys
 import subprocess
-import asyncio
 import threading
 
 from .export_telegram import export_messages as tg_export
-from .export_slack import export_slack_messages as slack_export, test_slack_token
-from .export_discord import export_discord_messages as discord_export
-from .notion_writer import notion_sink, test_connection as notion_test
+from .export_slack import export_slack_messages as slack_export, test_slack_token, list_conversations as list_slack_conversations
+from .export_discord import export_discord_messages as discord_export, list_guild_channels as list_discord_channels
+from .notion_writer import notion_sink, close_notion_clients, test_connection as notion_test
+from .query import parse_query, QueryError
+from .tg_session_pool import SessionPool
+from .tg_connections import get_manager as tg_connections
+from .metadata_cache import get_cache as metadata_cache, token_key
+from .job_queue import get_scheduler as job_scheduler, QueueFull
+from .task_store import TaskStore
 
 try:
     from telethon import TelegramClient
@@ -31,6 +39,14 @@ except Exception:
 APP_DIR = os.path.dirname(os.path.abspath(__file__))
 CONFIG_PATH = os.path.join(APP_DIR, "config.json")
 DEFAULT_SESSION = os.path.join(APP_DIR, "tg_export.session")
+METADATA_CACHE = os.path.join(APP_DIR, "chattools_cache.sqlite")
+NOTION_LEDGER = os.path.join(APP_DIR, "notion_ledger.sqlite")
+TASK_EVENT_BUFFER = 2000  # events kept per task; older ones are dropped
+TASK_POLL_LOGS = 500  # log lines returned by a poll without a cursor
+TASK_STORE = os.path.join(APP_DIR, "tasks.sqlite")
+TASK_STORED_LOGS = 200  # log lines persisted per task
+TASK_CACHE = 200  # finished tasks kept in memory
+TASK_TTL = 7 * 24 * 3600  # finished tasks are deleted after this many seconds
 
 
 def load_config() -> Dict[str, Any]:
@@ -98,11 +114,17 @@ class TelegramExtractRequest(BaseModel):
     only_text: bool = False
     keywords: Optional[list[str]] = None
     users: Optional[list[str]] = None
+    query: Optional[str] = Field(default=None, description="Filter query, e.g. '(outage OR incident) AND NOT test from:alice'")
+    shards: int = Field(default=1, ge=1, le=16, description="Concurrent message-id shards (one connection each)")
+    takeout: bool = Field(default=False, description="Read history through a takeout session (bulk export, fewer FloodWaits)")
+    server_search: bool = Field(default=False, description="Send a required query word to Telegram search (word/prefix matching)")
+    sessions: Optional[list[str]] = Field(default=None, description="Logged-in session files leased round-robin; FloodWaited accounts are cooled down")
     # Notion destination (if provided, overrides local FS)
     notion_api_key: Optional[str] = None
     notion_dest_type: Optional[str] = Field(default=None, description="Database or Page")
     notion_parent_id: Optional[str] = None
     notion_mode: Optional[str] = Field(default="per_message")
+    priority: int = Field(default=0, ge=-10, le=10, description="Higher runs first when exports are queued")
 
 
 class SlackExtractRequest(BaseModel):
@@ -120,11 +142,16 @@ class SlackExtractRequest(BaseModel):
     only_text: bool = False
     keywords: Optional[list[str]] = None
     users: Optional[list[str]] = None
+    query: Optional[str] = Field(default=None, description="Filter query, e.g. '(outage OR incident) AND NOT test from:alice'")
+    shards: int = Field(default=1, ge=1, le=32, description="Concurrent time-range shards")
+    expand_mentions: bool = Field(default=False, description="Replace <@U...> mentions with @display names")
+    use_search: bool = Field(default=False, description="Find keywords with search.messages (user tokens; whole-word matching)")
     # Notion destination (if provided)
     notion_api_key: Optional[str] = None
     notion_dest_type: Optional[str] = None
     notion_parent_id: Optional[str] = None
     notion_mode: Optional[str] = Field(default="per_message")
+    priority: int = Field(default=0, ge=-10, le=10, description="Higher runs first when exports are queued")
 
 
 class NotionTestRequest(BaseModel):
@@ -147,6 +174,7 @@ class SlackChannelsRequest(BaseModel):
     token: str
     query: Optional[str] = None
     limit: int = 500
+    refresh: bool = False
 
 
 class DiscordTestRequest(BaseModel):
@@ -157,6 +185,8 @@ class DiscordChannelsRequest(BaseModel):
     token: str
     guild_id: str
     query: Optional[str] = None
+    include_threads: bool = True
+    refresh: bool = False
 
 
 class DiscordExtractRequest(BaseModel):
@@ -174,27 +204,216 @@ class DiscordExtractRequest(BaseModel):
     only_text: bool = False
     keywords: Optional[list[str]] = None
     users: Optional[list[str]] = None
+    query: Optional[str] = Field(default=None, description="Filter query, e.g. '(outage OR incident) AND NOT test from:alice'")
+    shards: int = Field(default=1, ge=1, le=32, description="Concurrent time-range shards")
     notion_api_key: Optional[str] = None
     notion_dest_type: Optional[str] = None
     notion_parent_id: Optional[str] = None
     notion_mode: Optional[str] = Field(default="per_message")
+    priority: int = Field(default=0, ge=-10, le=10, description="Higher runs first when exports are queued")
 
 
 class TaskState:
-    def __init__(self):
-        self.status = "running"  # running|done|error
-        self.logs: list[str] = []
+    # Status of a background export plus its recent events (log lines and the
+    # final status) in a fixed-size ring buffer. Events are numbered, so
+    # pollers and event streams only fetch what follows the last one they saw.
+    def __init__(self, task_id: str, platform: str):
+        self.id = task_id
+        self.platform = platform
+        self.status = "queued"  # queued|running|done|error
+        self.events: deque = deque(maxlen=TASK_EVENT_BUFFER)
+        self.seq = 0
+        self.lock = threading.Lock()
         self.result: Optional[Any] = None
         self.error: Optional[str] = None
-        self.started_at = time.time()
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
         self.finished_at: Optional[float] = None
+        self.on_change = None  # called after status changes (persistence)
+
+    def _emit(self, kind: str, data: Any):
+        with self.lock:
+            self.seq += 1
+            self.events.append({"seq": self.seq, "type": kind, "time": time.time(), "data": data})
 
     def log(self, msg: str):
         ts = time.strftime("%H:%M:%S")
-        self.logs.append(f"[{ts}] {msg}")
+        self._emit("log", f"[{ts}] {msg}")
 
+    def start(self):
+        self.status = "running"
+        self.started_at = time.time()
+        self._emit("status", self.summary())
+        if self.on_change:
+            self.on_change(self)
+
+    def finish(self, result: Optional[Any] = None, error: Optional[str] = None):
+        self.result = result
+        self.error = error
+        self.status = "error" if error is not None else "done"
+        self.finished_at = time.time()
+        self._emit("status", self.summary())
+        if self.on_change:
+            self.on_change(self)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+    def record(self) -> Dict[str, Any]:
+        with self.lock:
+            logs = [e["data"] for e in self.events if e["type"] == "log"][-TASK_STORED_LOGS:]
+        return {"id": self.id, "platform": self.platform, **self.summary(), "logs": logs}
+
+    @classmethod
+    def from_record(cls, record: Dict[str, Any]) -> "TaskState":
+        # Read-only copy of a stored task; its events end with the final status
+        task = cls(record["id"], record["platform"])
+        for key in ("status", "result", "error", "created_at", "started_at", "finished_at"):
+            setattr(task, key, record.get(key))
+        for line in record.get("logs") or []:
+            task._emit("log", line)
+        task._emit("status", task.summary())
+        return task
+
+    def events_since(self, since: int) -> tuple[list[dict], bool]:
+        # (events after `since`, whether some were already dropped)
+        with self.lock:
+            events = [e for e in self.events if e["seq"] > since]
+            oldest = self.events[0]["seq"] if self.events else self.seq + 1
+        return events, since + 1 < oldest
+
+
+class TaskRegistry:
+    # Tasks by id. Queued and running tasks stay in memory, as do the most
+    # recently used finished ones (LRU); everything is written to the task
+    # store on creation and on every status change, and finished tasks
+    # evicted from memory are read back from it on demand.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tasks: "OrderedDict[str, TaskState]" = OrderedDict()
+        self.store: Optional[TaskStore] = None
+        self.pruned_at = 0.0
+
+    def open(self, path: str):
+        store = TaskStore(path)
+        interrupted = store.interrupt_unfinished("Interrupted by a server restart")
+        if interrupted:
+            print(f"Marked {interrupted} unfinished task(s) as interrupted", file=sys.stderr)
+        self.store = store
+        self._prune()
+
+    def add(self, task: TaskState):
+        task.on_change = self._changed
+        with self.lock:
+            self.tasks[task.id] = task
+        self._persist(task)
+        self._evict()
+
+    def get(self, task_id: str) -> Optional[TaskState]:
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if task is not None:
+                self.tasks.move_to_end(task_id)
+                return task
+        record = self.store.get(task_id) if self.store else None
+        if record is None:
+            return None
+        task = TaskState.from_record(record)
+        with self.lock:
+            task = self.tasks.setdefault(task_id, task)
+        self._evict()
+        return task
+
+    def discard(self, task_id: str):
+        with self.lock:
+            self.tasks.pop(task_id, None)
+        if self.store:
+            self.store.delete(task_id)
+
+    def list(self, status: Optional[str] = None, platform: Optional[str] = None,
+             before: Optional[float] = None, limit: int = 50) -> list[Dict[str, Any]]:
+        if self.store:
+            return self.store.list(status=status, platform=platform, before=before, limit=limit)
+        with self.lock:
+            records = [t.record() for t in self.tasks.values()]
+        records = [
+            {k: v for k, v in r.items() if k != "logs"} for r in records
+            if (not status or r["status"] == status) and (not platform or r["platform"] == platform)
+            and (before is None or r["created_at"] < before)
+        ]
+        return sorted(records, key=lambda r: r["created_at"], reverse=True)[:limit]
+
+    def _changed(self, task: TaskState):
+        self._persist(task)
+        self._evict()
+
+    def _persist(self, task: TaskState):
+        if self.store:
+            self.store.put(task.record())
+        if time.time() - self.pruned_at > 3600:
+            self._prune()
+
+    def _prune(self):
+        self.pruned_at = time.time()
+        if self.store:
+            self.store.prune(TASK_TTL)
+
+    def _evict(self):
+        # Drops the least recently used finished tasks beyond TASK_CACHE
+        # (without a store they are kept until the TTL instead)
+        with self.lock:
+            finished = [tid for tid, t in self.tasks.items() if t.status in ("done", "error")]
+            if self.store:
+                excess = finished[:max(0, len(finished) - TASK_CACHE)]
+            else:
+                cutoff = time.time() - TASK_TTL
+                excess = [tid for tid in finished if (self.tasks[tid].finished_at or 0) < cutoff]
+            for tid in excess:
+                del self.tasks[tid]
+
+
+tasks = TaskRegistry()
 
-tasks: Dict[str, TaskState] = {}
+
+def _schedule(task_id: str, task: TaskState, runner, platform: str, key: str, priority: int = 0):
+    # Hands the export to the job scheduler; it starts once a worker and the
+    # platform/account concurrency caps allow
+    def run():
+        task.start()
+        runner()
+
+    try:
+        position = job_scheduler().submit(task_id, run, platform, key=key, priority=priority)
+    except QueueFull as e:
+        tasks.discard(task_id)
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "30"})
+    if task.status == "queued":
+        task.log(f"Queued (position {position})")
+    return {"task_id": task_id, "queue_position": position}
+
+
+def _notion_sink(req, platform: str, on_progress):
+    # Built by the job once it runs, so a queued or rejected request holds no
+    # deliverer thread and queues nothing
+    return notion_sink(req.notion_api_key, req.notion_dest_type, req.notion_parent_id, mode=(req.notion_mode or "per_message"),
+                       on_progress=on_progress, platform=platform, ledger_path=NOTION_LEDGER)
+
+
+def _finalize_sink(sink, task: TaskState):
+    # Delivers what the export queued and frees the sink, also after errors
+    if sink is None:
+        return
+    try:
+        sink.finalize(chat_title=None)
+    except Exception as e:
+        task.log(f"Notion finalize error: {e}")
 
 app = FastAPI(title="ChatTools Exporter API")
 app.add_middleware(
@@ -223,89 +442,150 @@ def set_config(body: ConfigPayload):
 
 
 @app.post("/api/telegram/login/start")
-async def telegram_login_start(req: TelegramLoginStart):
+def telegram_login_start(req: TelegramLoginStart):
     session = req.session or DEFAULT_SESSION
     if TelegramClient is None:
         raise HTTPException(status_code=500, detail="Telethon not available")
     try:
-        cmd = [sys.executable, "-m", "chattools_exporter.tg_login_helper", "start",
-               "--api-id", str(req.api_id), "--api-hash", req.api_hash,
-               "--phone", req.phone, "--session", session]
-        r = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
-        if r.returncode != 0:
-            raise RuntimeError(r.stderr.strip() or "Login start failed")
+        # The shared connection keeps the phone_code_hash for the complete step
+        client = tg_connections().get(session, req.api_id, req.api_hash).client
+        client.send_code_request(req.phone)
         return {"ok": True, "code_required": True, "session": session}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.post("/api/telegram/login/complete")
-async def telegram_login_complete(req: TelegramLoginComplete):
+def telegram_login_complete(req: TelegramLoginComplete):
     session = req.session or DEFAULT_SESSION
     if TelegramClient is None:
         raise HTTPException(status_code=500, detail="Telethon not available")
     try:
-        cmd = [sys.executable, "-m", "chattools_exporter.tg_login_helper", "complete",
-               "--api-id", str(req.api_id), "--api-hash", req.api_hash,
-               "--phone", req.phone, "--session", session,
-               "--code", req.code or ""]
-        if req.password:
-            cmd += ["--password", req.password]
-        r = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
-        if r.returncode != 0:
-            raise RuntimeError(r.stderr.strip() or "Login complete failed")
+        manager = tg_connections()
+        client = manager.get(session, req.api_id, req.api_hash).client
+        try:
+            client.sign_in(phone=req.phone, code=req.code or "")
+        except SessionPasswordNeededError:
+            if not req.password:
+                raise RuntimeError("ERR: password required")
+            client.sign_in(password=req.password)
+        manager.persist(session)
         return {"ok": True, "session": session}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
-def _run_task(task: TaskState, target, kwargs):
-    try:
-        def on_progress(msg: str):
-            task.log(msg)
+@app.on_event("shutdown")
+def close_tg_connections():
+    # Write session auth keys back to their files and disconnect
+    tg_connections().close()
 
-        if "on_progress" in kwargs:
-            kwargs["on_progress"] = on_progress
-        else:
-            kwargs.update({"on_progress": on_progress})
-        result = target(**kwargs)
-        task.result = result
-        task.status = "done"
-    except Exception as e:
-        task.error = str(e)
-        task.status = "error"
-    finally:
-        task.finished_at = time.time()
 
+@app.on_event("shutdown")
+def close_notion_connections():
+    close_notion_clients()
 
-@app.get("/api/tasks/{task_id}")
-def get_task(task_id: str):
+
+@app.on_event("startup")
+def open_task_store():
+    # Task history survives restarts; tasks cut off by one are marked as such
+    tasks.open(TASK_STORE)
+
+
+@app.on_event("startup")
+def open_metadata_cache():
+    # Channel listings for the pickers and exporters, kept next to the config
+    # unless CHATTOOLS_CACHE points elsewhere
+    metadata_cache(os.getenv("CHATTOOLS_CACHE") or METADATA_CACHE)
+
+
+def _validate_query(query: Optional[str]):
+    try:
+        parse_query(query)
+    except QueryError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid query: {e}")
+
+
+def _get_task(task_id: str) -> TaskState:
     t = tasks.get(task_id)
     if not t:
         raise HTTPException(status_code=404, detail="Task not found")
+    return t
+
+
+@app.get("/api/tasks")
+def list_tasks(status: Optional[str] = None, platform: Optional[str] = None,
+               before: Optional[float] = None, limit: int = Query(default=50, ge=1, le=500)):
+    # Newest first; pass the last created_at as `before` for the next page
+    results = tasks.list(status=status, platform=platform, before=before, limit=limit)
+    for r in results:
+        r["queue_position"] = job_scheduler().position(r["id"]) if r["status"] == "queued" else None
+    return {"tasks": results}
+
+
+@app.get("/api/tasks/{task_id}")
+def get_task(task_id: str, since: Optional[int] = None):
+    # With `since` (the previous response's cursor) only newer log lines are
+    # returned; without it, the latest ones
+    t = _get_task(task_id)
+    events, truncated = t.events_since(since or 0)
+    logs = [e["data"] for e in events if e["type"] == "log"]
+    if since is None:
+        logs = logs[-TASK_POLL_LOGS:]
     return {
-        "status": t.status,
-        "logs": t.logs[-500:],  # limit
-        "result": t.result,
-        "error": t.error,
-        "started_at": t.started_at,
-        "finished_at": t.finished_at,
+        **t.summary(),
+        "queue_position": job_scheduler().position(task_id) if t.status == "queued" else None,
+        "logs": logs,
+        "cursor": events[-1]["seq"] if events else (since or 0),
+        "truncated": truncated,
     }
 
 
+@app.get("/api/tasks/{task_id}/events")
+async def task_events(task_id: str, request: Request, since: Optional[int] = None):
+    # Server-sent events: buffered events after `since` (or Last-Event-ID on
+    # reconnect), then new ones as they happen; "status" events mark the
+    # start and the end of the export, and the stream closes after the end
+    t = _get_task(task_id)
+    if since is None:
+        since = int(request.headers.get("last-event-id") or 0)
+
+    async def stream():
+        cursor = since
+        idle = 0.0
+        while True:
+            events, _ = t.events_since(cursor)
+            for e in events:
+                yield f"id: {e['seq']}\nevent: {e['type']}\ndata: {json.dumps(e, ensure_ascii=False, default=str)}\n\n"
+                cursor = e["seq"]
+                if e["type"] == "status" and e["data"]["status"] in ("done", "error"):
+                    return
+            if events:
+                idle = 0.0
+            elif idle >= 15:
+                yield ": keep-alive\n\n"
+                idle = 0.0
+            if await request.is_disconnected():
+                return
+            await asyncio.sleep(0.25)
+            idle += 0.25
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
 @app.post("/api/telegram/extract")
 def telegram_extract(req: TelegramExtractRequest):
+    _validate_query(req.query)
     out_fmt = req.format
     out_path = req.out
-    sink = None
-    if req.notion_api_key and req.notion_parent_id and req.notion_dest_type:
-        sink = notion_sink(req.notion_api_key, req.notion_dest_type, req.notion_parent_id, mode=(req.notion_mode or "per_message"), on_progress=None)
+    to_notion = bool(req.notion_api_key and req.notion_parent_id and req.notion_dest_type)
+    if to_notion:
         # When using Notion sink, ignore filesystem out unless provided for logging
         if not out_fmt:
             out_fmt = "jsonl"  # dummy for control flow
         if not out_path:
             out_path = os.path.join(APP_DIR, "_notion_sink.jsonl")
-    if not sink:
+    if not to_notion:
         # Filesystem mode requires out + format
         if not out_path:
             raise HTTPException(status_code=400, detail="Missing 'out' path for filesystem export")
@@ -321,116 +601,56 @@ def telegram_extract(req: TelegramExtractRequest):
 
     session = req.session or DEFAULT_SESSION
     task_id = str(uuid.uuid4())
-    task = TaskState()
-    tasks[task_id] = task
+    task = TaskState(task_id, "telegram")
+    tasks.add(task)
 
     def runner():
-        # Filesystem exports: use subprocess CLI for robustness
-        if sink is None:
-            cmd = [sys.executable, '-m', 'chattools_exporter.export_telegram',
-                   '--api-id', str(req.api_id), '--api-hash', req.api_hash,
-                   '--session', session,
-                   '--chat', req.chat,
-                   '--out', out_path]
-            if out_fmt:
-                cmd += ['--format', out_fmt]
-            if req.reverse:
-                cmd += ['--reverse']
-            if req.resume:
-                cmd += ['--resume']
-            if req.limit:
-                cmd += ['--limit', str(req.limit)]
-            if req.media_dir:
-                cmd += ['--media-dir', req.media_dir]
-            if req.min_date:
-                cmd += ['--min-date', req.min_date]
-            if req.max_date:
-                cmd += ['--max-date', req.max_date]
-            if req.only_media:
-                cmd += ['--only-media']
-            if req.only_text:
-                cmd += ['--only-text']
-            if req.keywords:
-                cmd += ['--keywords', ','.join(req.keywords)]
-            if req.users:
-                cmd += ['--users', ','.join(req.users)]
-
-            try:
-                task.log('Starting Telegram export...')
-                proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-                # Stream stderr (progress) and stdout (not much) to logs
-                while True:
-                    line = proc.stderr.readline()
-                    if line:
-                        task.log(line.strip())
-                    if proc.poll() is not None:
-                        # Drain remaining
-                        for rem in proc.stderr.readlines():
-                            task.log(rem.strip())
-                        break
-                rc = proc.returncode
-                if rc != 0:
-                    task.error = f"Exporter exited with code {rc}"
-                    task.status = 'error'
-                else:
-                    # We can't know exact count reliably; report success
-                    task.result = {"messages": None}
-                    task.status = 'done'
-            except Exception as e:
-                task.error = str(e)
-                task.status = 'error'
-            finally:
-                task.finished_at = time.time()
-            return
-
-        # Notion sink path (requires Telethon in-process)
-        try:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-        except Exception:
-            pass
+        # Runs in-process over the shared connection for this session: no
+        # subprocess, no reconnect/auth handshake and no concurrent opens of
+        # the .session file
         def on_progress(msg: str):
             task.log(msg)
+        sink = None
         try:
-            count = tg_export(
-                api_id=req.api_id,
-                api_hash=req.api_hash,
-                session=session,
-                chat=req.chat,
-                out_path=out_path,
-                out_fmt=out_fmt,
-                reverse=req.reverse,
-                resume=req.resume,
-                limit=req.limit,
-                media_dir=req.media_dir,
-                min_date=req.min_date,
-                max_date=req.max_date,
-                only_media=req.only_media,
-                only_text=req.only_text,
-                keywords=req.keywords or [],
-                users=req.users or [],
-                on_progress=on_progress,
-                sink=sink,
-            )
-            if sink and hasattr(sink, 'finalize'):
-                try:
-                    sink.finalize(chat_title=None)
-                except Exception as e:
-                    task.log(f"Notion finalize error: {e}")
-            task.result = {"messages": count}
-            task.status = 'done'
+            conn = tg_connections().get(session, req.api_id, req.api_hash)
+            if not conn.client.is_user_authorized():
+                raise RuntimeError("Telegram session is not logged in; complete the login first")
+            sink = _notion_sink(req, "telegram", on_progress) if to_notion else None
+            # Takeouts are per account: jobs on one session take turns
+            with conn.takeout_lock if req.takeout else nullcontext():
+                count = tg_export(
+                    api_id=req.api_id,
+                    api_hash=req.api_hash,
+                    session=session,
+                    chat=req.chat,
+                    out_path=out_path,
+                    out_fmt=out_fmt,
+                    reverse=req.reverse,
+                    resume=req.resume,
+                    limit=req.limit,
+                    media_dir=req.media_dir,
+                    min_date=req.min_date,
+                    max_date=req.max_date,
+                    only_media=req.only_media,
+                    only_text=req.only_text,
+                    keywords=req.keywords or [],
+                    users=req.users or [],
+                    query=req.query,
+                    shards=req.shards,
+                    takeout=req.takeout,
+                    server_search=req.server_search,
+                    pool=SessionPool(req.sessions) if req.sessions else None,
+                    client=conn.client,
+                    on_progress=on_progress,
+                    sink=sink,
+                )
+            _finalize_sink(sink, task)
+            task.finish(result={"messages": count})
         except Exception as e:
-            task.error = str(e)
-            task.status = 'error'
-        finally:
-            task.finished_at = time.time()
-            try:
-                loop.close()
-            except Exception:
-                pass
+            _finalize_sink(sink, task)
+            task.finish(error=str(e))
 
-    threading.Thread(target=runner, daemon=True).start()
-    return {"task_id": task_id}
+    return _schedule(task_id, task, runner, "telegram", session, req.priority)
 
 
 @app.post("/api/slack/test")
@@ -491,16 +711,16 @@ def notion_search(req: NotionSearchRequest):
 
 @app.post("/api/slack/extract")
 def slack_extract(req: SlackExtractRequest):
+    _validate_query(req.query)
     out_fmt = req.format
     out_path = req.out
-    sink = None
-    if req.notion_api_key and req.notion_parent_id and req.notion_dest_type:
-        sink = notion_sink(req.notion_api_key, req.notion_dest_type, req.notion_parent_id, mode=(req.notion_mode or "per_message"), on_progress=None)
+    to_notion = bool(req.notion_api_key and req.notion_parent_id and req.notion_dest_type)
+    if to_notion:
         if not out_fmt:
             out_fmt = "jsonl"
         if not out_path:
             out_path = os.path.join(APP_DIR, "_notion_sink_slack.jsonl")
-    if not sink:
+    if not to_notion:
         if not out_path:
             raise HTTPException(status_code=400, detail="Missing 'out' path for filesystem export")
         if not out_fmt:
@@ -513,8 +733,8 @@ def slack_extract(req: SlackExtractRequest):
                 raise HTTPException(status_code=400, detail="Provide 'format' or use .jsonl/.csv extension")
 
     task_id = str(uuid.uuid4())
-    task = TaskState()
-    tasks[task_id] = task
+    task = TaskState(task_id, "slack")
+    tasks.add(task)
 
     def runner():
         kwargs = dict(
@@ -532,54 +752,47 @@ def slack_extract(req: SlackExtractRequest):
             only_text=req.only_text,
             keywords=req.keywords or [],
             users=req.users or [],
-            sink=sink,
+            query=req.query,
+            shards=req.shards,
+            expand_mentions=req.expand_mentions,
+            use_search=req.use_search,
         )
 
         def on_progress(msg: str):
             task.log(msg)
 
+        sink = None
         try:
             kwargs["on_progress"] = on_progress
+            sink = _notion_sink(req, "slack", on_progress) if to_notion else None
+            kwargs["sink"] = sink
             count = slack_export(**kwargs)
-            try:
-                if sink and hasattr(sink, "finalize"):
-                    sink.finalize(chat_title=None)
-            except Exception as e:
-                task.log(f"Notion finalize error: {e}")
-            task.result = {"messages": count}
-            task.status = "done"
+            _finalize_sink(sink, task)
+            task.finish(result={"messages": count})
         except Exception as e:
-            task.error = str(e)
-            task.status = "error"
-        finally:
-            task.finished_at = time.time()
+            _finalize_sink(sink, task)
+            task.finish(error=str(e))
 
-    threading.Thread(target=runner, daemon=True).start()
-    return {"task_id": task_id}
+    return _schedule(task_id, task, runner, "slack", token_key(req.token), req.priority)
 
 
 @app.post("/api/slack/channels")
 def slack_channels(req: SlackChannelsRequest):
     from slack_sdk import WebClient
+    from slack_sdk.errors import SlackApiError
     client = WebClient(token=req.token)
+    try:
+        chans = list_slack_conversations(client, exclude_archived=False, refresh=req.refresh)
+    except SlackApiError as e:
+        raise HTTPException(status_code=400, detail=f"Slack API error: {e.response.get('error') if e.response else e}")
     q = (req.query or "").lower()
     items = []
-    cursor = None
-    cap = 0
-    while True and cap < req.limit:
-        res = client.conversations_list(limit=200, cursor=cursor, types="public_channel,private_channel")
-        for c in res.get("channels", []):
-            name = c.get("name") or ""
-            if not q or q in name.lower():
-                items.append({"id": c.get("id"), "name": name, "is_private": c.get("is_private", False)})
-                cap += 1
-                if cap >= req.limit:
-                    break
-        if cap >= req.limit:
-            break
-        cursor = res.get("response_metadata", {}).get("next_cursor") or None
-        if not cursor:
-            break
+    for c in chans:
+        name = c.get("name") or ""
+        if not q or q in name.lower():
+            items.append({"id": c.get("id"), "name": name, "is_private": c.get("is_private", False)})
+            if len(items) >= req.limit:
+                break
     return {"results": items}
 
 
@@ -596,36 +809,34 @@ def discord_test(req: DiscordTestRequest):
 
 @app.post("/api/discord/channels")
 def discord_channels(req: DiscordChannelsRequest):
-    import requests
-    r = requests.get(f"https://discord.com/api/v10/guilds/{req.guild_id}/channels", headers={"Authorization": f"Bot {req.token}", "User-Agent": "ChatTools-Exporter"}, timeout=30)
-    if r.status_code == 403:
+    try:
+        chans = list_discord_channels(req.token, req.guild_id, include_threads=req.include_threads, refresh=req.refresh)
+    except PermissionError:
         raise HTTPException(status_code=403, detail="Forbidden: bot likely missing permissions or not in guild")
-    if r.status_code != 200:
-        raise HTTPException(status_code=400, detail=f"Discord API error: {r.status_code} {r.text}")
-    chans = r.json() or []
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
     items = []
     q = (req.query or '').lower()
     for c in chans:
-        # type 0 = text channel
-        if c.get('type') == 0:
-            name = c.get('name') or ''
-            if not q or q in name.lower():
-                items.append({"id": c.get('id'), "name": name})
+        # Threads (incl. forum posts) are shown under their parent channel
+        name = f"{c['parent_name']} / {c['name']}" if c.get('parent_name') else c['name']
+        if not q or q in name.lower():
+            items.append({"id": c['id'], "name": name, "kind": c['kind'], "parent_id": c.get('parent_id')})
     return {"results": items}
 
 
 @app.post("/api/discord/extract")
 def discord_extract(req: DiscordExtractRequest):
+    _validate_query(req.query)
     out_fmt = req.format
     out_path = req.out
-    sink = None
-    if req.notion_api_key and req.notion_parent_id and req.notion_dest_type:
-        sink = notion_sink(req.notion_api_key, req.notion_dest_type, req.notion_parent_id, mode=(req.notion_mode or "per_message"), on_progress=None)
+    to_notion = bool(req.notion_api_key and req.notion_parent_id and req.notion_dest_type)
+    if to_notion:
         if not out_fmt:
             out_fmt = "jsonl"
         if not out_path:
             out_path = os.path.join(APP_DIR, "_notion_sink_discord.jsonl")
-    if not sink:
+    if not to_notion:
         if not out_path:
             raise HTTPException(status_code=400, detail="Missing 'out' path for filesystem export")
         if not out_fmt:
@@ -638,11 +849,11 @@ def discord_extract(req: DiscordExtractRequest):
                 raise HTTPException(status_code=400, detail="Provide 'format' or use .jsonl/.csv extension")
 
     task_id = str(uuid.uuid4())
-    task = TaskState()
-    tasks[task_id] = task
+    task = TaskState(task_id, "discord")
+    tasks.add(task)
 
     def runner():
-        if sink is None:
+        if not to_notion:
             # Use subprocess CLI for file exports
             cmd = [sys.executable, '-m', 'chattools_exporter.export_discord',
                    '--token', req.token, '--channel', req.channel,
@@ -669,6 +880,10 @@ def discord_extract(req: DiscordExtractRequest):
                 cmd += ['--keywords', ','.join(req.keywords)]
             if req.users:
                 cmd += ['--users', ','.join(req.users)]
+            if req.query:
+                cmd += ['--query', req.query]
+            if req.shards and req.shards > 1:
+                cmd += ['--shards', str(req.shards)]
             try:
                 task.log('Starting Discord export...')
                 proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
@@ -682,22 +897,19 @@ def discord_extract(req: DiscordExtractRequest):
                         break
                 rc = proc.returncode
                 if rc != 0:
-                    task.error = f"Exporter exited with code {rc}"
-                    task.status = 'error'
+                    task.finish(error=f"Exporter exited with code {rc}")
                 else:
-                    task.result = {"messages": None}
-                    task.status = 'done'
+                    task.finish(result={"messages": None})
             except Exception as e:
-                task.error = str(e)
-                task.status = 'error'
-            finally:
-                task.finished_at = time.time()
+                task.finish(error=str(e))
             return
 
         # Notion sink path (in-process)
         def on_progress(msg: str):
             task.log(msg)
+        sink = None
         try:
+            sink = _notion_sink(req, "discord", on_progress)
             count = discord_export(
                 token=req.token,
                 channel=req.channel,
@@ -713,24 +925,18 @@ def discord_extract(req: DiscordExtractRequest):
                 only_text=req.only_text,
                 keywords=req.keywords or [],
                 users=req.users or [],
+                query=req.query,
+                shards=req.shards,
                 on_progress=on_progress,
                 sink=sink,
             )
-            if sink and hasattr(sink, 'finalize'):
-                try:
-                    sink.finalize(chat_title=None)
-                except Exception as e:
-                    task.log(f"Notion finalize error: {e}")
-            task.result = {"messages": count}
-            task.status = 'done'
+            _finalize_sink(sink, task)
+            task.finish(result={"messages": count})
         except Exception as e:
-            task.error = str(e)
-            task.status = 'error'
-        finally:
-            task.finished_at = time.time()
+            _finalize_sink(sink, task)
+            task.finish(error=str(e))
 
-    threading.Thread(target=runner, daemon=True).start()
-    return {"task_id": task_id}
+    return _schedule(task_id, task, runner, "discord", token_key(req.token), req.priority)
 
 
 # Convenience for `python -m chattools_exporter.server`
@@ -0,0 +1,122 @@
+import json
+import os
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Sequence, Tuple
+
+# Range-sharded exports: split [start, end) into N shards, export each shard
+# concurrently into its own JSONL segment, then concatenate the segments in
+# order into the real destination.
+
+
+def split_range(start: int, end: int, n: int) -> List[Tuple[int, int]]:
+    # Half-open, contiguous, non-empty ranges covering [start, end)
+    n = max(1, min(int(n), max(1, end - start)))
+    step = (end - start) / n
+    bounds = [start + int(round(step * i)) for i in range(n)] + [end]
+    return [(bounds[i], bounds[i + 1]) for i in range(n) if bounds[i] < bounds[i + 1]]
+
+
+def segment_path(out_path: str, index: int) -> str:
+    return f"{out_path}.shard{index:03d}.jsonl"
+
+
+def iter_segment(path: str):
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def merge_segments(paths: Sequence[str], sink: Callable, limit: Optional[int] = None) -> int:
+    # Concatenate segments in the given order into `sink(row, raw)`
+    count = 0
+    try:
+        for path in paths:
+            for row in iter_segment(path):
+                if limit and count >= limit:
+                    return count
+                sink(row, None)
+                count += 1
+    finally:
+        if hasattr(sink, "close"):
+            sink.close()
+    return count
+
+
+class ShardBudget:
+    # Row budget shared by shards listed in output order. Shard i is not
+    # needed once shards 0..i-1 together hold `limit` rows: the ordered merge
+    # would cut everything after them. A shard that fetches in output order
+    # ("ordered") can also stop once shards 0..i hold `limit` rows; one that
+    # reorders its rows afterwards (SortedSink) has to read its whole range.
+    def __init__(self, n: int, limit: Optional[int]):
+        self.limit = limit
+        self.counts = [0] * n
+        self.lock = threading.Lock()
+
+    def slot(self, index: int, ordered: bool):
+        if not self.limit:
+            return None
+
+        def enough(accepted: int) -> bool:
+            with self.lock:
+                self.counts[index] = accepted
+                before = sum(self.counts[:index])
+            return before >= self.limit or (ordered and before + accepted >= self.limit)
+        return enough
+
+
+def remove_segments(paths: Sequence[str]):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def run_shards(
+    ranges: Sequence[Tuple[int, int]],
+    export_range: Callable[[int, int, int, str], int],
+    out_path: str,
+    sink: Callable,
+    limit: Optional[int] = None,
+    on_progress=None,
+    max_workers: Optional[int] = None,
+) -> int:
+    # `ranges` must already be in output order. export_range(index, lo, hi,
+    # segment, budget) writes one shard's rows (in output order) to `segment`
+    # and returns its count; `budget` is a ShardBudget (None without a limit),
+    # from which the shard takes its early-stop check. The limit itself is
+    # applied by the ordered merge.
+    if not ranges:
+        if hasattr(sink, "close"):
+            sink.close()
+        return 0
+    # Sink-only exports (e.g. Notion) have no output file; keep segments in temp
+    base = out_path or os.path.join(tempfile.gettempdir(), f"chattools_export_{uuid.uuid4().hex}")
+    paths = [segment_path(base, i) for i in range(len(ranges))]
+    budget = ShardBudget(len(ranges), limit) if limit else None
+    remove_segments(paths)
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, max_workers or len(ranges))) as pool:
+            futures = [
+                pool.submit(export_range, i, lo, hi, paths[i], budget)
+                for i, (lo, hi) in enumerate(ranges)
+            ]
+            counts = [f.result() for f in futures]
+        if on_progress:
+            on_progress(f"All {len(ranges)} shards fetched ({sum(counts)} messages); merging segments...")
+        return merge_segments(paths, sink, limit=limit)
+    finally:
+        remove_segments(paths)
+
+
+def shard_progress(on_progress, index: int, total: int):
+    if not on_progress:
+        return None
+    return lambda msg: on_progress(f"[shard {index + 1}/{total}] {msg}")
@@ -0,0 +1,109 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+# On-disk record of the server's export tasks: status, result counters,
+# timestamps and the last log lines. The server keeps only queued/running
+# tasks and a few recently finished ones in memory and answers everything
+# else from here, so task ids stay valid across restarts. Finished tasks are
+# deleted once older than the server's TTL.
+
+DEFAULT_TASK_STORE = "tasks.sqlite"
+
+_COLUMNS = ("id", "platform", "status", "created_at", "started_at", "finished_at", "result", "error", "logs")
+
+
+class TaskStore:
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or DEFAULT_TASK_STORE
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        with self.lock:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS tasks ("
+                " id TEXT PRIMARY KEY, platform TEXT NOT NULL, status TEXT NOT NULL,"
+                " created_at REAL NOT NULL, started_at REAL, finished_at REAL,"
+                " result TEXT, error TEXT, logs TEXT NOT NULL DEFAULT '[]')"
+            )
+            self.db.execute("CREATE INDEX IF NOT EXISTS tasks_created ON tasks (created_at)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, created_at)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS tasks_platform ON tasks (platform, created_at)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS tasks_finished ON tasks (finished_at)")
+            self.db.commit()
+
+    def put(self, record: dict):
+        values = dict(record)
+        values["result"] = json.dumps(values.get("result"), ensure_ascii=False, default=str)
+        values["logs"] = json.dumps(values.get("logs") or [], ensure_ascii=False)
+        with self.lock:
+            self.db.execute(
+                f"INSERT OR REPLACE INTO tasks ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+                tuple(values.get(c) for c in _COLUMNS),
+            )
+            self.db.commit()
+
+    def get(self, task_id: str) -> Optional[dict]:
+        with self.lock:
+            row = self.db.execute(f"SELECT {', '.join(_COLUMNS)} FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        return self._record(row) if row else None
+
+    def delete(self, task_id: str):
+        with self.lock:
+            self.db.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+            self.db.commit()
+
+    def list(self, status: Optional[str] = None, platform: Optional[str] = None,
+             before: Optional[float] = None, limit: int = 50) -> List[dict]:
+        # Newest first, without logs; `before` pages by created_at
+        where, args = [], []
+        if status:
+            where.append("status = ?")
+            args.append(status)
+        if platform:
+            where.append("platform = ?")
+            args.append(platform)
+        if before is not None:
+            where.append("created_at < ?")
+            args.append(before)
+        sql = f"SELECT {', '.join(_COLUMNS[:-1])} FROM tasks"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY created_at DESC LIMIT ?"
+        with self.lock:
+            rows = self.db.execute(sql, (*args, limit)).fetchall()
+        return [self._record(r) for r in rows]
+
+    def prune(self, max_age: float) -> int:
+        # Deletes tasks that finished more than `max_age` seconds ago
+        with self.lock:
+            cur = self.db.execute("DELETE FROM tasks WHERE finished_at IS NOT NULL AND finished_at < ?", (time.time() - max_age,))
+            self.db.commit()
+            return cur.rowcount
+
+    def interrupt_unfinished(self, error: str) -> int:
+        # Tasks left queued/running by a previous process can never finish
+        with self.lock:
+            cur = self.db.execute(
+                "UPDATE tasks SET status = 'error', error = ?, finished_at = ? WHERE status IN ('queued', 'running')",
+                (error, time.time()),
+            )
+            self.db.commit()
+            return cur.rowcount
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    @staticmethod
+    def _record(row) -> dict:
+        record = dict(zip(_COLUMNS, row))
+        record["result"] = json.loads(record["result"]) if record.get("result") else None
+        if "logs" in record:
+            record["logs"] = json.loads(record["logs"] or "[]")
+        return record
@@ -0,0 +1,235 @@
+import asyncio
+import inspect
+import os
+import threading
+from concurrent.futures import Future
+from typing import Dict, Optional
+
+from telethon.sync import TelegramClient
+from telethon.sessions import SQLiteSession, StringSession
+
+# Long-lived Telegram connections for the server: one connected client per
+# session file, shared by every login step and export job using that session.
+#
+# All clients live on a single background event loop. Jobs (running on their
+# own threads) talk to them through SyncClient, a blocking facade with the same
+# surface as Telethon's sync client, so export_messages works unchanged. The
+# client runs on an in-memory StringSession; the auth key is written back to
+# the .session file periodically and on shutdown, so the SQLite file is never
+# opened by concurrent jobs ("database is locked").
+
+PERSIST_INTERVAL = 60.0  # seconds
+ITER_BATCH = 100  # messages pulled across threads per round trip
+
+
+class _Loop:
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="tg-connections", daemon=True)
+        self.thread.start()
+
+    def run(self, fn):
+        # Runs fn() on the loop thread, awaiting it if it returns an awaitable
+        if threading.current_thread() is self.thread:
+            raise RuntimeError("SyncClient cannot be used from the connection loop itself")
+
+        async def call():
+            result = fn()
+            if inspect.isawaitable(result):
+                result = await result
+            return result
+        return asyncio.run_coroutine_threadsafe(call(), self.loop).result()
+
+
+def _wrap(loop: _Loop, value):
+    if hasattr(value, "__anext__"):
+        return _iter_async(loop, value)
+    if hasattr(value, "__aenter__"):
+        return _SyncContext(loop, value)
+    return value
+
+
+def _iter_async(loop: _Loop, it):
+    # Sync iteration over an async iterator (e.g. iter_messages), in batches
+    async def take():
+        items = []
+        try:
+            while len(items) < ITER_BATCH:
+                items.append(await it.__anext__())
+        except StopAsyncIteration:
+            return items, True
+        return items, False
+
+    while True:
+        items, done = loop.run(take)
+        yield from items
+        if done:
+            return
+
+
+class _SyncContext:
+    # Async context managers (e.g. client.takeout()) used with sync enter/exit
+    def __init__(self, loop: _Loop, cm):
+        self._loop = loop
+        self._cm = cm
+
+    def __enter__(self):
+        return SyncClient(self._loop, self._loop.run(self._cm.__aenter__))
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._loop.run(lambda: self._cm.__aexit__(exc_type, exc, tb))
+
+
+class SyncClient:
+    # Blocking proxy for a client owned by the connection loop
+    def __init__(self, loop: _Loop, client):
+        self._loop = loop
+        self._client = client
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            return _wrap(self._loop, self._loop.run(lambda: attr(*args, **kwargs)))
+        return call
+
+
+class Connection:
+    def __init__(self, manager: "ConnectionManager", path: str, client):
+        self.path = path
+        self.client = SyncClient(manager.loop, client)
+        self._raw = client
+        self._manager = manager
+        self._persisted: Optional[str] = None
+        # Takeouts are per account; jobs asking for one take turns
+        self.takeout_lock = threading.Lock()
+
+    def persist(self):
+        # Write the auth key/DC back to the .session file when they changed
+        mem = self._raw.session
+        if not mem.auth_key:
+            return
+        current = StringSession.save(mem)
+        if current == self._persisted:
+            return
+        sess = SQLiteSession(self.path)
+        try:
+            sess.set_dc(mem.dc_id, mem.server_address, mem.port)
+            sess.auth_key = mem.auth_key
+            sess.save()
+        finally:
+            sess.close()
+        self._persisted = current
+
+
+class ConnectionManager:
+    def __init__(self, persist_interval: float = PERSIST_INTERVAL):
+        self.loop = _Loop()
+        self.lock = threading.Lock()
+        self.connections: Dict[str, Connection] = {}
+        self.pending: Dict[str, Future] = {}
+        asyncio.run_coroutine_threadsafe(self._persist_every(persist_interval), self.loop.loop)
+
+    async def _persist_every(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            for conn in list(self.connections.values()):
+                try:
+                    conn.persist()
+                except Exception:
+                    pass
+
+    @staticmethod
+    def _key(session: str) -> str:
+        path = session if session.endswith(".session") else f"{session}.session"
+        return os.path.abspath(path)
+
+    def _open(self, path: str, api_id: int, api_hash: str) -> Connection:
+        saved = None
+        if os.path.exists(path):
+            sess = SQLiteSession(path)
+            try:
+                if sess.auth_key:
+                    saved = StringSession.save(sess)
+            finally:
+                sess.close()
+
+        async def connect():
+            client = TelegramClient(StringSession(saved), api_id, api_hash)
+            # Exports pace and retry FloodWaits themselves (AdaptivePacer)
+            client.flood_sleep_threshold = 0
+            await client.connect()
+            return client
+        conn = Connection(self, path, self.loop.run(connect))
+        conn._persisted = saved
+        return conn
+
+    def get(self, session: str, api_id: int, api_hash: str) -> Connection:
+        # Connected client for `session`, created on first use. Concurrent
+        # callers wait for the same connect instead of opening their own.
+        key = self._key(session)
+        with self.lock:
+            conn = self.connections.get(key)
+            if conn is not None:
+                return conn
+            fut = self.pending.get(key)
+            owner = fut is None
+            if owner:
+                fut = self.pending[key] = Future()
+        if not owner:
+            return fut.result()
+        try:
+            conn = self._open(key, api_id, api_hash)
+            with self.lock:
+                self.connections[key] = conn
+            fut.set_result(conn)
+            return conn
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.pending.pop(key, None)
+
+    def authorized_client(self, session: str, api_id: int, api_hash: str) -> SyncClient:
+        conn = self.get(session, api_id, api_hash)
+        if not conn.client.is_user_authorized():
+            raise RuntimeError("Telegram session is not logged in; complete the login first")
+        return conn.client
+
+    def persist(self, session: str):
+        conn = self.connections.get(self._key(session))
+        if conn is not None:
+            conn.persist()
+
+    def drop(self, session: str):
+        # Disconnect and forget a session (e.g. after logging out)
+        with self.lock:
+            conn = self.connections.pop(self._key(session), None)
+        if conn is not None:
+            conn.client.disconnect()
+
+    def close(self):
+        with self.lock:
+            conns = list(self.connections.values())
+            self.connections.clear()
+        for conn in conns:
+            try:
+                conn.persist()
+                conn.client.disconnect()
+            except Exception:
+                pass
+
+
+_manager: Optional[ConnectionManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_manager() -> ConnectionManager:
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = ConnectionManager()
+        return _manager
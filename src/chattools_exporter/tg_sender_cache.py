@@ -0,0 +1,76 @@
+import threading
+import time
+from typing import Dict, Optional
+
+from telethon.tl.types import Channel, Chat
+
+from .metadata_cache import get_cache
+
+# Per-chat sender directory (id -> username/display name) for Telegram
+# exports. Rows are filled from it when a message arrives without its sender
+# entity (min/unknown users, channel signatures), so the per-message cost is a
+# dict lookup and never a get_entity round trip. It is pre-warmed from the
+# participant list where the account may read it, learns every sender seen in
+# history, and is persisted in the metadata cache between runs.
+
+PREWARM_LIMIT = 10000  # Telegram returns at most ~10k participants anyway
+PREWARM_MAX_AGE = 7 * 24 * 3600  # seconds between participant re-listings
+
+
+def sender_info(s) -> dict:
+    username = getattr(s, "username", None)
+    name_parts = [getattr(s, "first_name", None), getattr(s, "last_name", None)]
+    display = " ".join([x for x in name_parts if x]) or getattr(s, "title", None) or username or str(getattr(s, "id", ""))
+    return {"username": username, "display": display}
+
+
+class SenderCache:
+    def __init__(self, chat_key: str):
+        self.key = chat_key
+        self.lock = threading.Lock()
+        stored, _ = get_cache().get("telegram.senders", chat_key)
+        stored = stored or {}
+        self.senders: Dict[str, dict] = stored.get("senders", {})
+        self.warmed_at: float = stored.get("warmed_at", 0)
+        self.dirty = False
+
+    def remember(self, s) -> dict:
+        info = sender_info(s)
+        key = str(getattr(s, "id", ""))
+        if self.senders.get(key) != info:
+            with self.lock:
+                self.senders[key] = info
+                self.dirty = True
+        return info
+
+    def lookup(self, sender_id) -> Optional[dict]:
+        return self.senders.get(str(sender_id)) if sender_id is not None else None
+
+    def prewarm(self, client, entity, on_progress=None):
+        # Participant lists are readable in basic groups and supergroups
+        # (broadcast channels need admin rights); failures are not fatal
+        if time.time() - self.warmed_at < PREWARM_MAX_AGE:
+            return
+        if not (isinstance(entity, Chat) or (isinstance(entity, Channel) and entity.megagroup)):
+            return
+        count = 0
+        try:
+            for user in client.iter_participants(entity, limit=PREWARM_LIMIT):
+                self.remember(user)
+                count += 1
+        except Exception as e:
+            if on_progress:
+                on_progress(f"Sender pre-warm stopped after {count} members: {e}")
+        with self.lock:
+            self.warmed_at = time.time()
+            self.dirty = True
+        if on_progress and count:
+            on_progress(f"Cached {count} chat members as senders")
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            payload = {"warmed_at": self.warmed_at, "senders": dict(self.senders)}
+            self.dirty = False
+        get_cache().put("telegram.senders", self.key, payload)
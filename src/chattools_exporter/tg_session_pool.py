@@ -0,0 +1,161 @@
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from telethon.sessions import SQLiteSession, StringSession
+
+from .metadata_cache import user_cache_dir
+
+# Pool of logged-in Telegram accounts (session files created by
+# tg_login_helper). Telegram throttles per account, so export work is leased
+# round-robin across accounts; an account that hits a FloodWait is put on
+# cool-down and the work moves to a healthy one. Cool-downs are persisted so
+# that a new process does not immediately hammer a throttled account.
+
+POOL_STATE_FILE = "tg_session_pool.json"
+_COUNTERS = ("flood_waits", "throttled_seconds")  # summed across processes
+_LATEST = ("cooldown_until", "last_used")  # the later value wins
+
+
+@dataclass
+class Lease:
+    name: str
+    session: str  # StringSession payload cloned from the session file
+
+
+def default_pool_state() -> str:
+    # One per-user file, so the CLI and the server see the same cool-downs;
+    # CHATTOOLS_POOL_STATE overrides it
+    return os.getenv("CHATTOOLS_POOL_STATE") or os.path.join(user_cache_dir(), POOL_STATE_FILE)
+
+
+class SessionPool:
+    def __init__(self, sessions: List[str], state_path: Optional[str] = None):
+        names = [s.strip() for s in sessions if s and s.strip()]
+        if not names:
+            raise ValueError("Session pool needs at least one session file")
+        self.names = list(dict.fromkeys(names))
+        self.state_path = state_path or default_pool_state()
+        os.makedirs(os.path.dirname(os.path.abspath(self.state_path)), exist_ok=True)
+        self.lock = threading.Lock()
+        self.cursor = 0
+        self.active: Dict[str, int] = {n: 0 for n in self.names}
+        self.strings: Dict[str, str] = {}
+        self.state: Dict[str, dict] = self._load_state()
+        # Counter increments not yet written to the state file
+        self.pending: Dict[str, Dict[str, float]] = {}
+
+    def _load_state(self) -> Dict[str, dict]:
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return {k: v for k, v in data.items() if isinstance(v, dict)}
+        except Exception:
+            return {}
+
+    def _merged_state(self) -> Dict[str, dict]:
+        # The state file merged field by field with ours, so that cool-downs
+        # and flood-wait counts other processes recorded are kept: timestamps
+        # take the later value and counters add our unsaved increments
+        merged = self._load_state()
+        for name, st in self.state.items():
+            cur = dict(merged.get(name, {}))
+            for key, value in st.items():
+                if key in _LATEST:
+                    cur[key] = max(cur.get(key, 0), value)
+                elif key in _COUNTERS:
+                    cur[key] = cur.get(key, 0) + self.pending.get(name, {}).get(key, 0)
+                else:
+                    cur.setdefault(key, value)
+            merged[name] = cur
+        return merged
+
+    def _save_state(self):
+        merged = self._merged_state()
+        tmp = f"{self.state_path}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(merged, f, indent=2)
+            os.replace(tmp, self.state_path)
+        except OSError:
+            return
+        self.state = merged
+        self.pending = {}
+
+    def session_string(self, name: str) -> str:
+        # Clone the auth key out of the SQLite file once; connections then use
+        # in-memory sessions, so the file is never opened concurrently
+        with self.lock:
+            s = self.strings.get(name)
+            if s is None:
+                path = name if name.endswith(".session") else f"{name}.session"
+                if not os.path.exists(path):
+                    raise ValueError(f"Session file not found: {path}")
+                sess = SQLiteSession(name)
+                try:
+                    if not sess.auth_key:
+                        raise ValueError(f"Session '{name}' is not logged in")
+                    s = StringSession.save(sess)
+                finally:
+                    sess.close()
+                self.strings[name] = s
+            return s
+
+    def cooldown_remaining(self, name: str) -> float:
+        return max(0.0, self.state.get(name, {}).get("cooldown_until", 0) - time.time())
+
+    def healthy(self) -> List[str]:
+        return [n for n in self.names if self.cooldown_remaining(n) <= 0]
+
+    def lease(self, on_progress=None) -> Lease:
+        # Next healthy account, preferring the least busy one in round-robin
+        # order. Blocks only when every account is cooling down.
+        while True:
+            with self.lock:
+                self.state = self._merged_state()
+                order = self.names[self.cursor:] + self.names[:self.cursor]
+                ready = [n for n in order if self.cooldown_remaining(n) <= 0]
+                if ready:
+                    name = min(ready, key=lambda n: self.active[n])
+                    self.cursor = (self.names.index(name) + 1) % len(self.names)
+                    self.active[name] += 1
+                    self.state.setdefault(name, {})["last_used"] = time.time()
+                    break
+                wait = min(self.cooldown_remaining(n) for n in self.names)
+            if on_progress:
+                on_progress(f"All {len(self.names)} accounts are cooling down; waiting {int(wait) + 1}s")
+            time.sleep(wait + 0.5)
+        try:
+            return Lease(name=name, session=self.session_string(name))
+        except Exception:
+            with self.lock:
+                self.active[name] -= 1
+            raise
+
+    def release(self, lease: Lease):
+        with self.lock:
+            self.active[lease.name] = max(0, self.active[lease.name] - 1)
+
+    def cool_down(self, name: str, seconds: float):
+        with self.lock:
+            st = self.state.setdefault(name, {})
+            st["cooldown_until"] = max(st.get("cooldown_until", 0), time.time() + seconds)
+            pending = self.pending.setdefault(name, {})
+            for key, inc in (("flood_waits", 1), ("throttled_seconds", seconds)):
+                st[key] = st.get(key, 0) + inc
+                pending[key] = pending.get(key, 0) + inc
+            self._save_state()
+
+    def status(self) -> List[dict]:
+        return [
+            {
+                "session": n,
+                "active": self.active[n],
+                "cooldown_seconds": int(self.cooldown_remaining(n)),
+                "flood_waits": self.state.get(n, {}).get("flood_waits", 0),
+            }
+            for n in self.names
+        ]
@@ -150,6 +150,8 @@ class App(tk.Tk):
         ttk.Checkbutton(p, text="Resume (JSONL)", variable=self.resume_var).grid(row=row, column=1, sticky="w", padx=8, pady=6)
         self.media_var = tk.BooleanVar(value=False)
         ttk.Checkbutton(p, text="Download media", variable=self.media_var).grid(row=row, column=2, sticky="w", padx=8, pady=6)
+        self.takeout_var = tk.BooleanVar(value=self.cfg["defaults"].get("takeout", False))
+        ttk.Checkbutton(p, text="Takeout (Telegram bulk)", variable=self.takeout_var).grid(row=row, column=3, sticky="w", padx=8, pady=6)
 
         # Destination
         row += 1
@@ -372,6 +374,7 @@ class App(tk.Tk):
         self.cfg["telegram"]["session"] = self.session_var.get().strip() or DEFAULT_SESSION
         self.cfg["defaults"]["reverse"] = bool(self.reverse_var.get())
         self.cfg["defaults"]["resume"] = bool(self.resume_var.get())
+        self.cfg["defaults"]["takeout"] = bool(self.takeout_var.get())
         self.cfg["defaults"]["format"] = self.format_var.get()
         self.cfg["defaults"]["only"] = self.only_var.get()
         self.cfg["defaults"]["last_output_folder"] = self.out_folder_var.get()
@@ -537,6 +540,8 @@ class App(tk.Tk):
                         match.get('parent_id'),
                         mode=self.notion_mode_var.get(),
                         on_progress=self.append_log,
+                        platform="telegram" if app.startswith("Telegram") else "slack",
+                        ledger_path=os.path.join(APP_DIR, "notion_ledger.sqlite"),
                     )
 
                 if app.startswith("Telegram"):
@@ -557,6 +562,7 @@ class App(tk.Tk):
                         only_text=only_text,
                         keywords=keywords,
                         users=users,
+                        takeout=bool(self.takeout_var.get()),
                         on_progress=lambda msg: self.append_log(msg),
                         sink=sink,
                     )
@@ -2,6 +2,7 @@ import React, { useEffect, useMemo, useState } from 'react'
 import {
   api,
   getTask,
+  taskEvents,
   loadConfig,
   saveConfig,
   startSlackExport,
@@ -13,6 +14,7 @@ import {
   tgLoginComplete,
   tgLoginStart,
   TaskStatus,
+  TaskEvent,
   searchNotion,
   listSlackChannels,
   listDiscordChannels,
@@ -55,18 +57,43 @@ export default function App() {
 
   useEffect(() => {
     if (!taskId) return
-    setTask(null)
-    const t = setInterval(async () => {
+    setTask({ status: 'queued', logs: [] })
+    // Log lines and the final status are pushed by the server; the browser
+    // reconnects on its own and resumes after the last event it received
+    const es = taskEvents(taskId)
+    es.addEventListener('log', (e) => {
+      const ev = JSON.parse((e as MessageEvent).data) as TaskEvent
+      setTask((t) => ({ ...(t || { status: 'queued' }), logs: [...(t?.logs || []), ev.data].slice(-500) }))
+    })
+    es.addEventListener('status', (e) => {
+      const ev = JSON.parse((e as MessageEvent).data) as TaskEvent
+      setTask((t) => ({ ...ev.data, logs: t?.logs || [] }))
+      if (ev.data.status === 'done' || ev.data.status === 'error') es.close()
+    })
+    return () => es.close()
+  }, [taskId])
+
+  const queued = task?.status === 'queued'
+  useEffect(() => {
+    if (!taskId || !queued) return
+    // The stream only reports starting and finishing; while the task waits,
+    // the task endpoint tells where it stands in the export queue
+    let stopped = false
+    const poll = async () => {
       try {
         const st = await getTask(taskId)
-        setTask(st)
-        if (st.status !== 'running') clearInterval(t)
+        if (!stopped) setTask((t) => (t && t.status === 'queued' ? { ...t, queue_position: st.queue_position } : t))
       } catch (e) {
-        clearInterval(t)
+        // the next poll or the event stream catches up
       }
-    }, 800)
-    return () => clearInterval(t)
-  }, [taskId])
+    }
+    poll()
+    const timer = setInterval(poll, 2000)
+    return () => {
+      stopped = true
+      clearInterval(timer)
+    }
+  }, [taskId, queued])
 
   const dfl = cfg?.defaults || {}
 
@@ -439,7 +466,10 @@ export default function App() {
         {taskId && (
           <Section title={`Task ${taskId}`}> 
             <Row>
-              <div>Status: {task?.status || 'running'}</div>
+              <div>
+                Status: {task?.status || 'queued'}
+                {task?.status === 'queued' && task.queue_position ? ` (position ${task.queue_position} in queue)` : ''}
+              </div>
               {task?.result && <div>Result: {JSON.stringify(task.result)}</div>}
               {task?.error && <div style={{ color: 'red' }}>Error: {task.error}</div>}
             </Row>
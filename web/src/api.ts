@@ -7,10 +7,20 @@ export const api = axios.create({
 })
 
 export type TaskStatus = {
-  status: 'running' | 'done' | 'error'
+  status: 'queued' | 'running' | 'done' | 'error'
+  queue_position?: number | null
   logs: string[]
   result?: any
   error?: string
+  cursor?: number
+}
+
+// One entry of a task's event stream (/api/tasks/{id}/events)
+export type TaskEvent = {
+  seq: number
+  type: 'log' | 'status'
+  time: number
+  data: any
 }
 
 // Config
@@ -52,11 +62,15 @@ export async function startSlackExport(payload: any) {
   return data as { task_id: string }
 }
 
-export async function getTask(taskId: string) {
-  const { data } = await api.get(`/api/tasks/${taskId}`)
+export async function getTask(taskId: string, since?: number) {
+  const { data } = await api.get(`/api/tasks/${taskId}`, { params: since === undefined ? {} : { since } })
   return data as TaskStatus
 }
 
+export function taskEvents(taskId: string) {
+  return new EventSource(`${API_BASE}/api/tasks/${taskId}/events`)
+}
+
 export async function testSlack(token: string) {
   const { data } = await api.post('/api/slack/test', { token })
   return data